@@ -1,8 +1,69 @@
 import { type NextRequest, NextResponse } from "next/server"
 import { spawn } from "child_process"
-import fs from "fs"
 import path from "path"
+import { verifyToken } from "@/lib/auth"
+
+const pythonPath = "C:\\Users\\VM764NY\\Downloads\\saida_proj\\saida\\Scripts\\python.exe"
+
+// Run a Python script and resolve with its stdout (rejects on a non-zero exit)
+function runPython(script: string, args: string[], input: Buffer | null, timeoutMs: number): Promise<string> {
+  const scriptPath = path.join(process.cwd(), "scripts", script)
+  const pythonProcess = spawn(pythonPath, [scriptPath, ...args], {
+    stdio: ['pipe', 'pipe', 'pipe'],
+    env: {
+      ...process.env,
+      PYTHONIOENCODING: 'utf-8',
+      PYTHONUNBUFFERED: '1'
+    }
+  })
+
+  pythonProcess.stdin.on('error', (error) => {
+    console.error(`Failed to send input to ${script}:`, error)
+  })
+  pythonProcess.stdin.end(input ?? undefined)
+
+  let stdout = ""
+  let stderr = ""
+
+  pythonProcess.stdout.setEncoding('utf8')
+  pythonProcess.stdout.on('data', (data) => {
+    stdout += data.toString()
+  })
+
+  pythonProcess.stderr.setEncoding('utf8')
+  pythonProcess.stderr.on('data', (data) => {
+    const output = data.toString()
+    console.error(`${script} Error:`, output.trim())
+    stderr += output
+  })
+
+  return new Promise<string>((resolve, reject) => {
+    const timer = setTimeout(() => {
+      pythonProcess.kill()
+      reject(new Error(`${script} timeout after ${timeoutMs / 1000} seconds`))
+    }, timeoutMs)
+
+    pythonProcess.on('close', (code) => {
+      clearTimeout(timer)
+      // The queue scripts report failures as JSON on stdout
+      if (code !== 0 && !stdout.trim()) {
+        reject(new Error(`${script} exited with code ${code}. Error: ${stderr}`))
+      } else {
+        resolve(stdout)
+      }
+    })
+
+    pythonProcess.on('error', (error) => {
+      clearTimeout(timer)
+      console.error(`Failed to start ${script}:`, error)
+      reject(error)
+    })
+  })
+}
 
+// Uploads are queued (scripts/ocr_queue.py) and processed by a fixed pool of
+// workers started with `python scripts/ocr_queue.py work`; the client polls
+// GET /api/process-pdf?job=<id> until the catalog is ready.
 export async function POST(request: NextRequest) {
   try {
     const formData = await request.formData()
@@ -12,258 +73,89 @@ export async function POST(request: NextRequest) {
       return NextResponse.json({ error: "No PDF file uploaded" }, { status: 400 })
     }
 
-    // Create uploads directory if it doesn't exist
-    const uploadsDir = path.join(process.cwd(), "uploads")
-    if (!fs.existsSync(uploadsDir)) {
-      fs.mkdirSync(uploadsDir, { recursive: true })
-    }
-
-    // Save the uploaded file temporarily
-    const bytes = await file.arrayBuffer()
-    const buffer = Buffer.from(bytes)
-    const filePath = path.join(uploadsDir, `${Date.now()}-${file.name}`)
-    fs.writeFileSync(filePath, buffer)
-
-    // Execute the Python OCR script
-    const pythonScriptPath = path.join(process.cwd(), "scripts", "ocr.py")
-    const pythonPath = "C:\\Users\\VM764NY\\Downloads\\saida_proj\\saida\\Scripts\\python.exe"
-
-    console.log("Executing Python OCR script:", pythonPath, pythonScriptPath, filePath)
-
-    const pythonProcess = spawn(pythonPath, [pythonScriptPath, filePath], {
-      stdio: ['pipe', 'pipe', 'pipe'],
-      env: {
-        ...process.env,
-        PYTHONIOENCODING: 'utf-8',
-        PYTHONUNBUFFERED: '1'
-      }
-    })
-
-    let stdout = ""
-    let stderr = ""
-
-    pythonProcess.stdout.setEncoding('utf8')
-    pythonProcess.stdout.on('data', (data) => {
-      const output = data.toString()
-      console.log("Python Output:", output.trim())
-      stdout += output
-    })
-
-    pythonProcess.stderr.setEncoding('utf8')
-    pythonProcess.stderr.on('data', (data) => {
-      const output = data.toString()
-      console.error("Python Error:", output.trim())
-      stderr += output
-    })
-
-    const pythonResult = await new Promise<string>((resolve, reject) => {
-      pythonProcess.on('close', (code) => {
-        console.log(`Python process exited with code: ${code}`)
-        
-        if (code !== 0) {
-          reject(new Error(`Python script exited with code ${code}. Error: ${stderr}`))
-        } else {
-          resolve(stdout)
-        }
-      })
-
-      pythonProcess.on('error', (error) => {
-        console.error("Failed to start Python process:", error)
-        reject(error)
-      })
+    // Jobs are shared fairly between users
+    const token = request.cookies.get("auth-token")?.value
+    const user = token ? verifyToken(token) : null
+    const owner = user ? `user:${user.userId}` : "anonymous"
 
-      setTimeout(() => {
-        pythonProcess.kill()
-        reject(new Error("Python script timeout after 5 minutes"))
-      }, 300000)
-    })
-
-    // Parse the JSON output from the OCR script
-    let ocrOutput
-    try {
-      const output = JSON.parse(pythonResult.trim())
+    const buffer = Buffer.from(await file.arrayBuffer())
+    const output = JSON.parse((await runPython(
+      "ocr_queue.py", ["submit", "-", "--name", file.name, "--owner", owner], buffer, 60000,
+    )).trim())
 
-      if (!output.ok || !output.products) {
-        throw new Error(output.error || "Unknown error from Python script")
-      }
-      
-      ocrOutput = output.products
-      console.log(`✅ OCR extracted ${ocrOutput.length} products`)
-      
-    } catch (parseError) {
-      console.error("Failed to parse Python output:", parseError)
-      console.error("Raw output:", pythonResult)
-      return NextResponse.json({ error: "Failed to parse Python script output" }, { status: 500 })
+    if (!output.success) {
+      return NextResponse.json({ error: output.error || "Could not queue the PDF" }, { status: 400 })
     }
 
-    // Insert into database
-    const dbScriptPath = path.join(process.cwd(), "scripts", "create_table_catalog.py")
-    
-    console.log("Inserting into database...")
-    
-    const dbProcess = spawn(pythonPath, [
-      dbScriptPath,
-      JSON.stringify(ocrOutput),
-      file.name
-    ], {
-      stdio: ['pipe', 'pipe', 'pipe'],
-      env: {
-        ...process.env,
-        PYTHONIOENCODING: 'utf-8',
-        PYTHONUNBUFFERED: '1'
-      }
-    })
-
-    let dbStdout = ""
-    let dbStderr = ""
-
-    dbProcess.stdout.setEncoding('utf8')
-    dbProcess.stdout.on('data', (data) => {
-      const output = data.toString()
-      console.log("DB Script Output:", output.trim())
-      dbStdout += output
-    })
+    console.log(`Queued ${file.name} as job ${output.job.id} (${output.job.lane} lane, position ${output.job.position})`)
 
-    dbProcess.stderr.setEncoding('utf8')
-    dbProcess.stderr.on('data', (data) => {
-      const output = data.toString()
-      console.error("DB Script Error:", output.trim())
-      dbStderr += output
-    })
-
-    const dbResult = await new Promise<string>((resolve, reject) => {
-      dbProcess.on('close', (code) => {
-        console.log(`DB process exited with code: ${code}`)
-        
-        if (code !== 0) {
-          reject(new Error(`Database insertion failed: ${dbStderr}`))
-        } else {
-          resolve(dbStdout)
-        }
-      })
+    return NextResponse.json({
+      success: true,
+      job_id: output.job.id,
+      status: output.job.status,
+      position: output.job.position,
+    }, { status: 202 })
 
-      dbProcess.on('error', (error) => {
-        console.error("Failed to start DB process:", error)
-        reject(error)
-      })
+  } catch (error) {
+    console.error("Error queueing PDF:", error)
+    return NextResponse.json(
+      {
+        error: "Failed to process PDF",
+        details: error instanceof Error ? error.message : "Unknown error",
+      },
+      { status: 500 },
+    )
+  }
+}
 
-      setTimeout(() => {
-        dbProcess.kill()
-        reject(new Error("Database insertion timeout after 30 seconds"))
-      }, 30000)
-    })
+export async function GET(request: NextRequest) {
+  const jobId = request.nextUrl.searchParams.get("job")
+  if (!jobId) {
+    return NextResponse.json({ error: "Missing job id" }, { status: 400 })
+  }
 
-    // Parse database result
-    let dbInfo
-    try {
-      dbInfo = JSON.parse(dbResult.trim())
-      
-      if (!dbInfo.success) {
-        throw new Error(dbInfo.error || "Database insertion failed")
-      }
-      
-      console.log(`✅ Database insertion successful: ${dbInfo.products_inserted} products inserted into table '${dbInfo.table_name}'`)
-      
-    } catch (parseError) {
-      console.error("Failed to parse DB script output:", parseError)
-      console.error("Raw DB output:", dbResult)
-      return NextResponse.json({ 
-        error: "Database insertion failed", 
-        details: "Could not parse database response" 
-      }, { status: 500 })
+  try {
+    const output = JSON.parse((await runPython("ocr_queue.py", ["status", jobId], null, 30000)).trim())
+    if (!output.success) {
+      return NextResponse.json({ error: output.error || "Unknown job" }, { status: 404 })
     }
 
-    // Now fetch the data from database to return to frontend
-    const fetchScriptPath = path.join(process.cwd(), "scripts", "fetch_catalog_data.py")
-    
-    console.log("Fetching data from database...")
-    
-    const fetchProcess = spawn(pythonPath, [
-      fetchScriptPath,
-      dbInfo.table_name
-    ], {
-      stdio: ['pipe', 'pipe', 'pipe'],
-      env: {
-        ...process.env,
-        PYTHONIOENCODING: 'utf-8',
-        PYTHONUNBUFFERED: '1'
-      }
-    })
-
-    let fetchStdout = ""
-    let fetchStderr = ""
-
-    fetchProcess.stdout.setEncoding('utf8')
-    fetchProcess.stdout.on('data', (data) => {
-      fetchStdout += data.toString()
-    })
-
-    fetchProcess.stderr.setEncoding('utf8')
-    fetchProcess.stderr.on('data', (data) => {
-      const output = data.toString()
-      console.error("Fetch Script Error:", output.trim())
-      fetchStderr += output
-    })
-
-    const fetchResult = await new Promise<string>((resolve, reject) => {
-      fetchProcess.on('close', (code) => {
-        if (code !== 0) {
-          reject(new Error(`Failed to fetch data: ${fetchStderr}`))
-        } else {
-          resolve(fetchStdout)
-        }
-      })
-
-      fetchProcess.on('error', (error) => {
-        reject(error)
-      })
-
-      setTimeout(() => {
-        fetchProcess.kill()
-        reject(new Error("Fetch timeout"))
-      }, 30000)
-    })
+    const job = output.job
+    if (job.status === "failed") {
+      return NextResponse.json({ success: false, status: job.status, error: job.error || "Processing failed" })
+    }
+    if (job.status !== "done") {
+      return NextResponse.json({ success: true, status: job.status, position: job.position ?? null })
+    }
 
-    // Parse fetched data
-    let fetchedData
-    try {
-      const output = JSON.parse(fetchResult.trim())
-      
-      if (!output.success) {
-        throw new Error(output.error || "Failed to fetch data")
-      }
-      
-      fetchedData = output.data
-      console.log(`✅ Fetched ${fetchedData.length} products from database`)
-      
-    } catch (parseError) {
-      console.error("Failed to parse fetched data:", parseError)
-      // Fallback to OCR data if fetch fails
-      console.log("⚠️ Falling back to OCR data")
-      fetchedData = ocrOutput
+    // Done: return the catalog the worker loaded, as before
+    const dbInfo = job.result
+    const fetched = JSON.parse((await runPython("fetch_catalog_data.py", [dbInfo.table_name], null, 30000)).trim())
+    if (!fetched.success) {
+      throw new Error(fetched.error || "Failed to fetch data")
     }
 
-    // Clean up uploaded file
-    fs.unlinkSync(filePath)
+    console.log(`✅ Fetched ${fetched.data.length} products from database`)
 
     return NextResponse.json({
       success: true,
-      data: fetchedData,
+      status: job.status,
+      data: fetched.data,
       metadata: {
         table_name: dbInfo.table_name,
-        products_count: fetchedData.length,
-        source_file: file.name
+        products_count: fetched.data.length,
+        source_file: job.name
       }
     })
-    
+
   } catch (error) {
-    console.error("Error processing PDF:", error)
+    console.error("Error reading job status:", error)
     return NextResponse.json(
       {
-        error: "Failed to process PDF",
+        error: "Failed to read job status",
         details: error instanceof Error ? error.message : "Unknown error",
       },
       { status: 500 },
     )
   }
-}
\ No newline at end of file
+}
@@ -7,6 +7,10 @@ import { Button } from "@/components/ui/button"
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from "@/components/ui/dialog"
 import { Upload, FileText, Loader2 } from "lucide-react"
 
+// Queued uploads are polled every POLL_INTERVAL_MS for at most POLL_TIMEOUT_MS
+const POLL_INTERVAL_MS = 2000
+const POLL_TIMEOUT_MS = 15 * 60 * 1000
+
 interface PDFUploadModalProps {
   isOpen: boolean
   onClose: () => void
@@ -16,6 +20,7 @@ interface PDFUploadModalProps {
 export function PDFUploadModal({ isOpen, onClose, onSuccess }: PDFUploadModalProps) {
   const [isUploading, setIsUploading] = useState(false)
   const [dragActive, setDragActive] = useState(false)
+  const [jobStatus, setJobStatus] = useState<string | null>(null)
 
   const handleFileUpload = async (file: File) => {
     if (!file.type.includes("pdf")) {
@@ -24,6 +29,7 @@ export function PDFUploadModal({ isOpen, onClose, onSuccess }: PDFUploadModalPro
     }
 
     setIsUploading(true)
+    setJobStatus(null)
 
     try {
       const formData = new FormData()
@@ -34,7 +40,29 @@ export function PDFUploadModal({ isOpen, onClose, onSuccess }: PDFUploadModalPro
         body: formData,
       })
 
-      const result = await response.json()
+      let result = await response.json()
+
+      // The upload is queued; poll until the catalog is ready, or give up
+      // (e.g. no worker pool is running to take the job)
+      const deadline = Date.now() + POLL_TIMEOUT_MS
+      while (result.success && result.job_id !== undefined && !result.data) {
+        const jobId = result.job_id
+        setJobStatus(
+          result.status === "queued"
+            ? `En attente${result.position != null ? ` (position ${result.position})` : ""}...`
+            : "Traitement du PDF en cours...",
+        )
+        if (Date.now() >= deadline) {
+          result = {
+            success: false,
+            error: `le traitement n'a pas abouti après ${POLL_TIMEOUT_MS / 60000} minutes (statut : ${result.status ?? "inconnu"})`,
+          }
+          break
+        }
+        await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS))
+        const status = await fetch(`/api/process-pdf?job=${jobId}`)
+        result = { ...(await status.json()), job_id: jobId }
+      }
 
       if (result.success) {
         onSuccess(result.data)
@@ -47,6 +75,7 @@ export function PDFUploadModal({ isOpen, onClose, onSuccess }: PDFUploadModalPro
       alert("Erreur lors du traitement du PDF")
     } finally {
       setIsUploading(false)
+      setJobStatus(null)
     }
   }
 
@@ -96,7 +125,7 @@ export function PDFUploadModal({ isOpen, onClose, onSuccess }: PDFUploadModalPro
             {isUploading ? (
               <div className="space-y-2">
                 <Loader2 className="w-8 h-8 mx-auto animate-spin text-green-600" />
-                <p className="text-sm text-gray-600">Traitement du PDF en cours...</p>
+                <p className="text-sm text-gray-600">{jobStatus ?? "Traitement du PDF en cours..."}</p>
               </div>
             ) : (
               <div className="space-y-2">
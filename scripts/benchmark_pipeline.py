@@ -0,0 +1,657 @@
+"""
+Reproducible benchmark runner for the catalog pipeline.
+
+Times each OCR method of perform_ocr_on_pdf_enhanced, the grouping step,
+process_pdf_file end to end with a stubbed LLM, the LLM client against a
+throttling stub server, cross-catalog product matching, fetch_catalog_data's
+row conversion (column plan vs the old per-cell mapping), and the MySQL
+insert/fetch/export scripts, on synthetic catalog PDFs and products
+(seeded, so every run sees the same input) plus the PDFs in uploads/.
+Backends or services that are not available (PaddleOCR, the tesseract
+binary, MySQL) are reported as skipped.
+
+The MySQL cases only run against a dedicated schema named by
+BENCHMARK_MYSQL_DATABASE (it must differ from MYSQL_DATABASE). They insert
+without the post-ingest refreshes (analytics, product matching, price
+changes, search index) and drop their tables afterwards.
+
+Results are written as JSON and compared against a stored baseline; any case
+slower than the baseline by more than the threshold is flagged and the
+runner exits with status 1. It also exits 1 if `import ocr` exceeds the
+startup budget or if the spatial path imports a heavy OCR backend.
+
+Usage:
+  python benchmark_pipeline.py [--quick] [--output results.json]
+                               [--baseline baseline.json] [--save-baseline]
+                               [--threshold 0.2]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import tempfile
+import subprocess
+import unicodedata
+from collections import Counter
+from datetime import date, datetime
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import fitz
+
+import ocr
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+UPLOADS_DIR = SCRIPTS_DIR.parent / "uploads"
+DEFAULT_BASELINE = SCRIPTS_DIR / "benchmark_baseline.json"
+
+# Budget for `import ocr` in a fresh interpreter (the upload route spawns one per request)
+STARTUP_BUDGET_S = 0.5
+
+# Why the db.* cases cannot run; cleared by use_benchmark_database()
+_mysql_unavailable = "BENCHMARK_MYSQL_DATABASE not set"
+
+# Modules the spatial path must never import
+HEAVY_BACKEND_MODULES = ("paddle", "paddleocr", "paddlex", "cv2", "pytesseract")
+
+BRANDS = ["ALDIVIA", "BAHLSEN", "DELICE", "VITALAIT", "SAIDA", "JADIDA", "ELMAZRAA", "LILAS"]
+PRODUCTS = ["Gaufrettes chocolat", "Biscuits au beurre", "Lait demi-écrémé", "Yaourt fraise",
+            "Huile végétale", "Eau minérale", "Fromage fondu", "Jus d'orange", "Café moulu"]
+
+
+# ----- synthetic inputs -----
+def generate_catalog_pdf(path: str, pages: int, density: int, seed: int = 0, scanned: bool = False) -> str:
+    """
+    Write a synthetic catalog PDF.
+
+    Args:
+        path: Output path
+        pages: Number of pages
+        density: Products per page (laid out on a grid)
+        seed: Random seed, so the same arguments always give the same PDF
+        scanned: Rasterize every page so there is no text layer (forces OCR)
+
+    Returns:
+        The output path
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    cols = max(1, int(density ** 0.5))
+    rows = max(1, -(-density // cols))
+    for _ in range(pages):
+        page = doc.new_page(width=595, height=842)
+        cell_w, cell_h = 595 / cols, (842 - 60) / rows
+        page.insert_text((40, 40), "PROMO SPECIAL FROID du 13/08/2025 au 31/08/2025", fontsize=14)
+        for i in range(density):
+            x = 10 + (i % cols) * cell_w
+            y = 70 + (i // cols) * cell_h
+            price = rng.randint(500, 99999)
+            lines = [
+                rng.choice(BRANDS),
+                f"{rng.choice(PRODUCTS)} {rng.choice(['100g', '500g', '1L', '1kg'])}",
+                f"{price // 1000},{price % 1000:03d} DT",
+                f"-{rng.choice([10, 15, 20, 25, 30])}%",
+            ]
+            for j, line in enumerate(lines):
+                page.insert_text((x, y + 12 + j * 11), line, fontsize=min(9, cell_h / 6))
+    if scanned:
+        raster = fitz.open()
+        for page in doc:
+            pix = page.get_pixmap(dpi=100)
+            out = raster.new_page(width=page.rect.width, height=page.rect.height)
+            out.insert_image(out.rect, stream=pix.tobytes("png"))
+        doc.close()
+        doc = raster
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def generate_text_blocks(count: int, width: int = 2480, height: int = 3508, seed: int = 0) -> List[Dict[str, Any]]:
+    """Synthetic OCR text blocks for the grouping benchmark."""
+    rng = random.Random(seed)
+    blocks = []
+    for _ in range(count):
+        x1, y1 = rng.randint(0, width - 200), rng.randint(0, height - 40)
+        x2, y2 = x1 + rng.randint(40, 200), y1 + rng.randint(12, 40)
+        text = rng.choice([rng.choice(BRANDS), rng.choice(PRODUCTS), f"{rng.randint(1, 99)},{rng.randint(0, 999):03d} DT", "-20%"])
+        blocks.append({
+            "text": text,
+            "confidence": 1.0,
+            "bbox": [x1, y1, x2, y2],
+            "center_x": (x1 + x2) // 2,
+            "center_y": (y1 + y2) // 2,
+        })
+    return blocks
+
+
+PRODUCT_WORDS = ["lait", "demi", "écrémé", "entier", "yaourt", "fraise", "vanille", "chocolat", "biscuits", "beurre",
+                 "gaufrettes", "huile", "végétale", "olive", "eau", "minérale", "gazeuse", "fromage", "fondu", "jus",
+                 "orange", "pomme", "café", "moulu", "thé", "vert", "pâtes", "riz", "farine", "sucre", "tomate",
+                 "concentré", "thon", "sardines", "miel", "confiture", "abricot", "céréales", "crème", "caramel",
+                 "noisette", "amande", "savon", "shampooing", "lessive", "liquide", "poudre", "papier", "mouchoirs",
+                 "bébé", "nature", "light", "bio", "classique", "extra", "premium", "croquant", "citron", "pêche"]
+# Canonical quantity -> ways catalogs write it
+QUANTITY_SPELLINGS = [["1L", "1 l", "100cl", "1000ml", "1 Litre"], ["500ml", "50cl", "0,5L", "0.5 L"],
+                      ["250g", "250gr", "0,25kg", "250 G"], ["1kg", "1000g", "1 KG"], ["6x1L", "6 x 1L", "6×1 L"],
+                      ["125g", "125 gr"], ["33cl", "330ml", "33 CL"], ["2kg", "2000g"]]
+
+
+def generate_product_variants(count: int, variants: int = 5, seed: int = 0) -> List[Tuple[Any, ...]]:
+    """
+    Synthetic products as several catalogs would list them: count /
+    variants distinct products, each written `variants` times with
+    different case, accents, quantity spelling, brand placement and the
+    occasional OCR typo. About a quarter of the products have a twin with
+    the same name and quantity from another brand, which must not match.
+
+    Returns:
+        Shuffled (brand, product, grammage, true_product_index) tuples
+    """
+    rng = random.Random(seed)
+    brands = ["".join(rng.choice("BCDFGLMNPRSTV") + rng.choice("AEIOU") for _ in range(rng.randint(2, 4)))
+              for _ in range(max(count // 40, 1))]
+    bases = set()
+    while len(bases) < count // variants:
+        brand = rng.choice(brands)
+        name = " ".join(rng.sample(PRODUCT_WORDS, rng.randint(2, 4)))
+        quantity = rng.randrange(len(QUANTITY_SPELLINGS))
+        bases.add((brand, name, quantity))
+        if len(brands) > 1 and rng.random() < 0.25 and len(bases) < count // variants:
+            bases.add((rng.choice([other for other in brands if other != brand]), name, quantity))
+
+    def noisy(text):
+        case = rng.random()
+        text = text.upper() if case < 0.3 else text.lower() if case < 0.5 else text.title() if case < 0.6 else text
+        if rng.random() < 0.4:
+            text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+        if rng.random() < 0.15 and len(text) > 6:
+            i = rng.randrange(1, len(text) - 1)
+            text = text[:i] + text[i + 1:]
+        return text
+
+    products = []
+    for index, (brand, name, quantity) in enumerate(sorted(bases)):
+        for _ in range(variants):
+            grammage = rng.choice(QUANTITY_SPELLINGS[quantity])
+            product = noisy(name)
+            if rng.random() < 0.3:
+                product = f"{brand} {product}"
+            if rng.random() < 0.3:
+                products.append((brand, f"{product} {grammage}", None, index))
+            else:
+                products.append((brand, product, grammage, index))
+    rng.shuffle(products)
+    return products
+
+
+def generate_result_rows(count: int, seed: int = 0) -> Tuple[List[Tuple[Any, ...]], List[Tuple[Any, ...]]]:
+    """
+    Synthetic catalog rows as a MySQL cursor returns them, for the row
+    conversion benchmark.
+
+    Returns:
+        (cursor.description, tuple rows)
+    """
+    from mysql.connector import FieldType
+    rng = random.Random(seed)
+    columns = [("id", FieldType.LONG), ("source", FieldType.VAR_STRING), ("brand", FieldType.VAR_STRING),
+               ("product", FieldType.BLOB), ("rayon", FieldType.VAR_STRING), ("famille", FieldType.VAR_STRING),
+               ("sous_famille", FieldType.VAR_STRING), ("grammage", FieldType.VAR_STRING),
+               ("price_before_tnd", FieldType.NEWDECIMAL), ("price_after_tnd", FieldType.NEWDECIMAL),
+               ("url", FieldType.BLOB), ("promo_date_debut", FieldType.DATE), ("promo_date_fin", FieldType.DATE),
+               ("created_at", FieldType.TIMESTAMP), ("source_file", FieldType.VAR_STRING)]
+    description = [(name, type_code, None, None, None, None, True, 0) for name, type_code in columns]
+    created = datetime(2025, 8, 13, 9, 30)
+    rows = []
+    for i in range(count):
+        before = Decimal(rng.randint(500, 50000)) / 1000
+        rows.append((i + 1, "Carrefour", rng.choice(BRANDS), f"{rng.choice(PRODUCTS)} #{i}", "Epicerie", None, None,
+                     rng.choice(["1L", "500g", "250g"]), before, (before * Decimal("0.8")).quantize(Decimal("0.001")),
+                     None, date(2025, 8, 13), date(2025, 8, 31) if i % 10 else None, created, "promo.pdf"))
+    return description, rows
+
+
+def legacy_convert_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    fetch_catalog_data's row conversion before the column plan: a lookup,
+    a chain of name comparisons and isinstance checks for every cell of a
+    dictionary-cursor row. Kept as the "before" side of convert.* cases.
+    """
+    product = {}
+    for key, value in row.items():
+        if key.lower() in ['id', 'created_at', 'source_file']:
+            continue
+        original_key = key
+        if key == 'brand':
+            original_key = 'Brand'
+        elif key == 'product':
+            original_key = 'Product'
+        elif key == 'source':
+            original_key = 'Source'
+        elif key == 'rayon':
+            original_key = 'Rayon'
+        elif key == 'famille':
+            original_key = 'Famille'
+        elif key == 'sous_famille':
+            original_key = 'Sous-famille'
+        elif key == 'grammage':
+            original_key = 'Grammage'
+        elif key == 'price_before_tnd':
+            original_key = 'Price Before (TND)'
+        elif key == 'price_after_tnd':
+            original_key = 'Price After (TND)'
+        elif key == 'url':
+            original_key = 'URL'
+        elif key == 'promo_date_debut':
+            original_key = 'promo_date_debut'
+        elif key == 'promo_date_fin':
+            original_key = 'promo_date_fin'
+        if isinstance(value, date) and not isinstance(value, datetime):
+            value = value.strftime('%d/%m/%Y')
+        if isinstance(value, Decimal):
+            value = str(value)
+        product[original_key] = value
+    return product
+
+
+def stub_llm_extract(ocr_json: Dict[str, Any], openai_model: str = "stub") -> List[Dict[str, Any]]:
+    """Deterministic stand-in for the LLM: one product per grouped cell."""
+    products = []
+    for page in ocr_json.get("ocr", {}).get("pages", {}).values():
+        for cell in page.get("structured_products", []):
+            lines = cell["text"].splitlines()
+            products.append({
+                "Brand": lines[0] if lines else None,
+                "Product": " ".join(lines[1:2]) or None,
+                "Rayon": None,
+                "Famille": None,
+                "Sous-famille": None,
+                "Grammage": None,
+                "Price Before (TND)": None,
+                "Price After (TND)": cell.get("price"),
+                "URL": None,
+                "promo_date_debut": "13/08/2025",
+                "promo_date_fin": "31/08/2025",
+                "Source": "Carrefour",
+            })
+    return products
+
+
+# ----- timing -----
+class Skip(Exception):
+    """Raised by a benchmark case whose backend or service is unavailable."""
+
+
+def time_case(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Run fn once to warm up, then `repeat` timed runs."""
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        "min_s": round(min(times), 6),
+        "median_s": round(statistics.median(times), 6),
+        "mean_s": round(statistics.mean(times), 6),
+        "runs": repeat,
+    }
+
+
+def _require_backend(method: str):
+    if method in ("paddle", "hybrid") and not ocr._have_paddle:
+        raise Skip("PaddleOCR not installed")
+    if method == "tesseract":
+        try:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+        except Exception as e:
+            raise Skip(f"tesseract binary not available: {e}")
+
+
+def use_benchmark_database():
+    """Point the MySQL cases at BENCHMARK_MYSQL_DATABASE, if it is a schema of its own."""
+    global _mysql_unavailable
+    database = os.getenv("BENCHMARK_MYSQL_DATABASE")
+    if not database:
+        _mysql_unavailable = "BENCHMARK_MYSQL_DATABASE not set"
+    elif database == os.getenv("MYSQL_DATABASE", "ma_base"):
+        _mysql_unavailable = "BENCHMARK_MYSQL_DATABASE must not be the application database"
+    else:
+        # database.get_db_config() reads this on every connection
+        os.environ["MYSQL_DATABASE"] = database
+        _mysql_unavailable = None
+
+
+def _require_mysql():
+    if _mysql_unavailable:
+        raise Skip(_mysql_unavailable)
+    try:
+        from database import get_connection
+        get_connection().close()
+    except Exception as e:
+        raise Skip(f"MySQL not available: {e}")
+
+
+def _drop_benchmark_table(table_pdf: str):
+    """Drop a table created by the db.* cases (if MySQL is there at all)."""
+    try:
+        _require_mysql()
+    except Skip:
+        return
+    from create_table_catalog import sanitize_table_name, invalidate_table
+    from database import get_connection
+    table_name = sanitize_table_name(table_pdf)
+    connection = get_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS `{table_name}`")
+        cursor.close()
+    finally:
+        connection.close()
+    invalidate_table(table_name)
+
+
+def build_cases(workdir: str, quick: bool) -> List[Dict[str, Any]]:
+    """List the benchmark cases as dictionaries with a name, fn and unit count."""
+    cases = []
+    sizes = [(2, 12), (8, 24)] if quick else [(2, 12), (8, 24), (24, 48)]
+
+    pdfs = []
+    for pages, density in sizes:
+        path = os.path.join(workdir, f"synthetic_{pages}p_{density}d.pdf")
+        pdfs.append((f"synthetic_{pages}p_{density}d", generate_catalog_pdf(path, pages, density, seed=pages * 100 + density), pages))
+    scanned_path = os.path.join(workdir, "synthetic_scanned_2p_12d.pdf")
+    pdfs.append(("synthetic_scanned_2p_12d", generate_catalog_pdf(scanned_path, 2, 12, seed=7, scanned=True), 2))
+    seen = set()
+    for upload in sorted(UPLOADS_DIR.glob("*.pdf")) if UPLOADS_DIR.is_dir() else []:
+        # uploads/ holds byte-identical copies; benchmark each document once
+        key = upload.stat().st_size, upload.name.split("-", 1)[-1]
+        if key in seen:
+            continue
+        seen.add(key)
+        with fitz.open(str(upload)) as doc:
+            pdfs.append((f"upload_{upload.stem}", str(upload), len(doc)))
+
+    for method in ("spatial", "tesseract", "paddle", "hybrid"):
+        for label, path, pages in pdfs:
+            if method in ("tesseract", "paddle") and label.startswith("upload_") and quick:
+                continue
+
+            def run(method=method, path=path, label=label):
+                _require_backend(method)
+                if "scanned" in label:
+                    # No text layer: every method ends up in tesseract
+                    _require_backend("tesseract")
+                ocr.perform_ocr_on_pdf_enhanced(path, language="en", method=method, dpi=200)
+            cases.append({"name": f"ocr.{method}.{label}", "fn": run, "units": pages, "unit": "pages"})
+
+    for count in (100, 1000, 10000):
+        blocks = generate_text_blocks(count, seed=count)
+        cases.append({
+            "name": f"group.{count}_blocks",
+            "fn": lambda blocks=blocks: ocr.group_text_blocks_into_products_improved(blocks, (3508, 2480)),
+            "units": count,
+            "unit": "blocks",
+        })
+
+    label, path, pages = pdfs[1]
+
+    def end_to_end(path=path):
+        original = ocr.llm_extract_products_from_ocr
+        ocr.llm_extract_products_from_ocr = stub_llm_extract
+        try:
+            result = ocr.process_pdf_file(path)
+        finally:
+            ocr.llm_extract_products_from_ocr = original
+        if not result.get("ok"):
+            raise RuntimeError(result)
+    cases.append({"name": f"process_pdf_file.stub_llm.{label}", "fn": end_to_end, "units": pages, "unit": "pages"})
+
+    def llm_throttled(requests=40):
+        from llm_client import LLMClient
+        from llm_stub_server import start_stub_server
+        # Every 5th request is throttled; measures retry/backoff overhead and connection reuse
+        server = start_stub_server(throttle_every=5, retry_after=0.05, latency_ms=20)
+        try:
+            client = LLMClient(api_key="stub", endpoint=f"http://127.0.0.1:{server.server_port}", rpm=6000)
+            messages = [{"role": "user", "content": json.dumps(generate_text_blocks(50))}]
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(lambda _: client.complete(messages, model="stub"), range(requests)))
+        finally:
+            server.shutdown()
+            server.server_close()
+    cases.append({"name": "llm.stub_throttled.40_requests", "fn": llm_throttled, "units": 40, "unit": "requests"})
+
+    for count in ((10000,) if quick else (10000, 100000)):
+        variants = generate_product_variants(count, seed=count)
+
+        def match(variants=variants):
+            from product_matching import ProductMatcher
+            matcher = ProductMatcher()
+            predicted = [canonical_id for canonical_id, _ in matcher.match_all([v[:3] for v in variants])]
+            # Pairwise precision/recall against the true product of each variant
+            pairs = lambda counter: sum(n * (n - 1) // 2 for n in counter.values())
+            true_positive = pairs(Counter(zip(predicted, (v[3] for v in variants))))
+            precision = true_positive / max(pairs(Counter(predicted)), 1)
+            recall = true_positive / max(pairs(Counter(v[3] for v in variants)), 1)
+            if precision < 0.95 or recall < 0.95:
+                raise RuntimeError(f"match quality dropped: precision {precision:.3f}, recall {recall:.3f}")
+        cases.append({"name": f"match.{count}_products", "fn": match, "units": count, "unit": "products"})
+
+    count = 50000 if quick else 200000
+    description, rows = generate_result_rows(count, seed=count)
+    names = [column[0] for column in description]
+    dict_rows = [dict(zip(names, row)) for row in rows]
+
+    def convert_planned(description=description, rows=rows):
+        from fetch_catalog_data import build_column_plan, convert_row
+        plan = build_column_plan(description)
+        return [convert_row(row, plan) for row in rows]
+
+    def convert_per_cell(dict_rows=dict_rows):
+        return [legacy_convert_row(row) for row in dict_rows]
+
+    cases.append({"name": f"convert.column_plan.{count}_rows", "fn": convert_planned, "units": count, "unit": "rows"})
+    cases.append({"name": f"convert.per_cell.{count}_rows", "fn": convert_per_cell, "units": count, "unit": "rows"})
+
+    for count in (100, 1000, 10000):
+        products = stub_llm_extract({"ocr": {"pages": {"p": {"structured_products": [
+            {"text": f"{BRANDS[i % len(BRANDS)]}\n{PRODUCTS[i % len(PRODUCTS)]} #{i}", "price": f"{i % 50},{i % 1000:03d}"}
+            for i in range(count)
+        ]}}}})
+        table_pdf = f"benchmark_{count}.pdf"
+
+        def insert(products=products, table_pdf=table_pdf):
+            _require_mysql()
+            from create_table_catalog import create_catalog_table
+            result = create_catalog_table(products, table_pdf, refresh_derived=False)
+            if not result["success"]:
+                raise RuntimeError(result["error"])
+
+        def fetch(table_pdf=table_pdf):
+            _require_mysql()
+            from create_table_catalog import sanitize_table_name
+            from fetch_catalog_data import fetch_catalog_data
+            result = fetch_catalog_data(sanitize_table_name(table_pdf))
+            if not result["success"]:
+                raise RuntimeError(result["error"])
+
+        def export(table_pdf=table_pdf):
+            _require_mysql()
+            from create_table_catalog import sanitize_table_name
+            from export_catalog import export_catalogs
+            result = export_catalogs([sanitize_table_name(table_pdf)], os.path.join(workdir, "export"))
+            if not result["success"]:
+                raise RuntimeError(result["error"])
+
+        cases.append({"name": f"db.insert.{count}_products", "fn": insert, "units": count, "unit": "rows",
+                      "cleanup": lambda table_pdf=table_pdf: _drop_benchmark_table(table_pdf)})
+        cases.append({"name": f"db.fetch.{count}_products", "fn": fetch, "units": count, "unit": "rows"})
+        cases.append({"name": f"db.export_parquet.{count}_products", "fn": export, "units": count, "unit": "rows"})
+
+    return cases
+
+
+def check_startup(workdir: str, budget_s: float = STARTUP_BUDGET_S) -> Dict[str, Any]:
+    """
+    Check interpreter startup cost of ocr.py in fresh processes.
+
+    Measures `import ocr` with `python -X importtime` against budget_s, and
+    runs the spatial method on a born-digital PDF to check that none of
+    HEAVY_BACKEND_MODULES gets imported.
+
+    Returns:
+        Dictionary with the measurements and a list of failures
+    """
+    failures = []
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import ocr"],
+        cwd=str(SCRIPTS_DIR), capture_output=True, text=True
+    )
+    import_s = None
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == "ocr":
+            import_s = int(parts[1]) / 1e6
+    if import_s is None:
+        failures.append(f"could not measure import time: {proc.stderr[-500:]}")
+    elif import_s > budget_s:
+        failures.append(f"import ocr took {import_s:.3f}s (budget {budget_s}s)")
+
+    pdf = generate_catalog_pdf(os.path.join(workdir, "startup_check.pdf"), 1, 12, seed=1)
+    probe = (
+        "import sys, json, ocr\n"
+        f"ocr.perform_ocr_on_pdf_enhanced({pdf!r}, method='spatial')\n"
+        f"heavy = {HEAVY_BACKEND_MODULES!r}\n"
+        "print(json.dumps(sorted(m for m in sys.modules if m.split('.')[0] in heavy)))\n"
+    )
+    # Budgets off: pages are OCRed in the probe itself, not in a PageWorker child
+    env = dict(os.environ, OCR_PAGE_BUDGET_S="0", OCR_DOC_BUDGET_S="0")
+    proc = subprocess.run([sys.executable, "-c", probe], cwd=str(SCRIPTS_DIR), env=env, capture_output=True, text=True)
+    try:
+        loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        loaded = None
+        failures.append(f"spatial probe failed: {proc.stderr[-500:]}")
+    if loaded:
+        failures.append(f"spatial path imported heavy backends: {', '.join(loaded)}")
+
+    return {"import_ocr_s": import_s, "budget_s": budget_s, "spatial_heavy_imports": loaded, "failures": failures}
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Return the cases whose median time regressed by more than threshold."""
+    regressions = []
+    base_cases = baseline.get("cases", {})
+    for name, case in results["cases"].items():
+        base = base_cases.get(name)
+        if not base or "median_s" not in base or "median_s" not in case:
+            continue
+        ratio = case["median_s"] / base["median_s"] if base["median_s"] else 1.0
+        case["baseline_median_s"] = base["median_s"]
+        case["ratio"] = round(ratio, 3)
+        if ratio > 1.0 + threshold:
+            regressions.append({"name": name, "ratio": round(ratio, 3),
+                                "median_s": case["median_s"], "baseline_median_s": base["median_s"]})
+    return regressions
+
+
+def run_benchmarks(quick: bool = False, repeat: int = 3, only: str = None) -> Dict[str, Any]:
+    """Run every case and return the results document."""
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "cases": {},
+    }
+    cleanups = []
+    with tempfile.TemporaryDirectory(prefix="catalog_bench_") as workdir:
+        # Repeats must redo the work, not hit the page index or job checkpoints
+        os.environ["OCR_DEDUP"] = "0"
+        os.environ["OCR_JOBS_DIR"] = os.path.join(workdir, "jobs")
+        use_benchmark_database()
+        try:
+            for case in build_cases(workdir, quick):
+                if only and only not in case["name"]:
+                    continue
+                if "cleanup" in case:
+                    cleanups.append(case["cleanup"])
+                name = case["name"]
+                try:
+                    timing = time_case(case["fn"], repeat)
+                    timing[f"{case['unit']}_per_s"] = round(case["units"] / timing["median_s"], 2) if timing["median_s"] else None
+                    results["cases"][name] = timing
+                    print(f"{name:55s} {timing['median_s']:10.4f}s", file=sys.stderr)
+                except Skip as e:
+                    results["cases"][name] = {"skipped": str(e)}
+                    print(f"{name:55s}    skipped ({e})", file=sys.stderr)
+                except Exception as e:
+                    results["cases"][name] = {"error": str(e)}
+                    print(f"{name:55s}    error ({e})", file=sys.stderr)
+        finally:
+            for cleanup in cleanups:
+                try:
+                    cleanup()
+                except Exception as e:
+                    print(f"Benchmark cleanup failed: {e}", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the catalog OCR/DB pipeline.")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs, fewer cases")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (after one warm-up)")
+    parser.add_argument("--only", help="run only cases whose name contains this string")
+    parser.add_argument("--output", default="benchmark_results.json", help="results JSON path")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET_S,
+                        help="seconds allowed for `import ocr` in a fresh interpreter")
+    args = parser.parse_args()
+
+    results = run_benchmarks(quick=args.quick, repeat=args.repeat, only=args.only)
+
+    with tempfile.TemporaryDirectory(prefix="catalog_bench_") as workdir:
+        results["startup"] = check_startup(workdir, args.startup_budget)
+    for failure in results["startup"]["failures"]:
+        print(f"❌ Startup: {failure}", file=sys.stderr)
+
+    regressions = []
+    if os.path.isfile(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f), args.threshold)
+    results["regressions"] = regressions
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✅ Baseline saved to {args.baseline}", file=sys.stderr)
+
+    for regression in regressions:
+        print(f"❌ Regression: {regression['name']} is {regression['ratio']}x the baseline "
+              f"({regression['median_s']}s vs {regression['baseline_median_s']}s)", file=sys.stderr)
+    print(json.dumps({
+        "output": args.output,
+        "cases": len(results["cases"]),
+        "regressions": len(regressions),
+        "startup_failures": len(results["startup"]["failures"]),
+    }))
+    sys.exit(1 if regressions or results["startup"]["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""
+Precomputed analytics for the dashboard charts.
+
+Instead of every chart aggregating all catalog rows on each render, this job
+maintains small summary tables. Each catalog table contributes its own rows
+(keyed by catalog_table), so ingesting a catalog only recomputes that
+catalog: its old summary rows are replaced in one transaction and nothing
+else is rescanned.
+
+  analytics_discounts      products per (brand | rayon | famille, discount %),
+                           with the sum of their current prices
+  analytics_promo_weeks    promotions running per week, by source and brand
+  analytics_price_buckets  products per price band, by rayon
+
+Discounts are stored as counts per whole percent rather than as averages,
+so the average and median discount of any selection of catalogs can be read
+back exactly (to 1%) by summing rows.
+
+Usage:
+  python catalog_analytics.py update <table_name>
+  python catalog_analytics.py rebuild
+  python catalog_analytics.py fetch [--catalog <table_name>]
+"""
+import sys
+import json
+import argparse
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+import mysql.connector
+from catalog_columns import sanitize_column_name
+from create_table_catalog import parse_decimal_string, normalize_date_value, is_null_value
+from database import get_connection
+
+# Lower edges of the price bands, in TND
+PRICE_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+# Promotions longer than this are counted for their first weeks only
+MAX_PROMO_WEEKS = 26
+
+DIMENSIONS = {
+    'brand': 'Brand',
+    'rayon': 'Rayon',
+    'famille': 'Famille',
+}
+
+# Product fields the aggregates are computed from
+AGGREGATE_FIELDS = list(DIMENSIONS.values()) + ['Source', 'Price Before (TND)', 'Price After (TND)',
+                                                'promo_date_debut', 'promo_date_fin']
+
+# Added up when two summary rows still land on the same key
+_MERGE_COLUMNS = {
+    'analytics_discounts': ['products', 'price_after_sum'],
+    'analytics_promo_weeks': ['promotions'],
+    'analytics_price_buckets': ['products'],
+}
+
+ANALYTICS_TABLES = {
+    'analytics_discounts': """
+        CREATE TABLE IF NOT EXISTS `analytics_discounts` (
+            `catalog_table` VARCHAR(64) NOT NULL,
+            `dimension` VARCHAR(16) NOT NULL,
+            `dimension_value` VARCHAR(255) NOT NULL,
+            `discount_pct` SMALLINT NOT NULL,
+            `products` INT NOT NULL,
+            `price_after_sum` DECIMAL(14, 3) NOT NULL,
+            PRIMARY KEY (`catalog_table`, `dimension`, `dimension_value`, `discount_pct`),
+            INDEX `idx_dimension` (`dimension`, `dimension_value`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+    'analytics_promo_weeks': """
+        CREATE TABLE IF NOT EXISTS `analytics_promo_weeks` (
+            `catalog_table` VARCHAR(64) NOT NULL,
+            `week_start` DATE NOT NULL,
+            `source` VARCHAR(255) NOT NULL,
+            `brand` VARCHAR(255) NOT NULL,
+            `promotions` INT NOT NULL,
+            PRIMARY KEY (`catalog_table`, `week_start`, `source`, `brand`),
+            INDEX `idx_week` (`week_start`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+    'analytics_price_buckets': """
+        CREATE TABLE IF NOT EXISTS `analytics_price_buckets` (
+            `catalog_table` VARCHAR(64) NOT NULL,
+            `rayon` VARCHAR(255) NOT NULL,
+            `bucket_min` DECIMAL(10, 3) NOT NULL,
+            `bucket_max` DECIMAL(10, 3) NULL,
+            `products` INT NOT NULL,
+            PRIMARY KEY (`catalog_table`, `rayon`, `bucket_min`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+}
+
+def ensure_analytics_tables(cursor):
+    """Create the summary tables if they do not exist yet."""
+    for create_query in ANALYTICS_TABLES.values():
+        cursor.execute(create_query)
+
+def _text(value):
+    """Dimension value as stored: trimmed, '' for missing, at most 255 chars."""
+    if value is None or is_null_value(value):
+        return ''
+    return str(value).strip()[:255]
+
+def collation_key(text):
+    """
+    Grouping key of a dimension value: equal for values the summary tables'
+    utf8mb4_unicode_ci keys treat as equal ("Délice", "DELICE").
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def price_value(value):
+    """A price read from a catalog table (DECIMAL, or text in VARCHAR price columns) as a Decimal."""
+    if value is None:
+        return None
+    if isinstance(value, Decimal):
+        return value
+    return parse_decimal_string(value)
+
+def date_value(value):
+    """A date read from a catalog table (DATE, or text) as a date."""
+    if value is None or isinstance(value, date):
+        return value
+    normalized = normalize_date_value(value)
+    return date.fromisoformat(normalized) if normalized else None
+
+def _bucket(price):
+    """Lower and upper edge of the price band holding price."""
+    lower = PRICE_BUCKETS[0]
+    for edge in PRICE_BUCKETS[1:]:
+        if price < edge:
+            return lower, edge
+        lower = edge
+    return lower, None
+
+def read_catalog_rows(cursor, table_name, fields=None):
+    """
+    Read some columns of a catalog table. Columns the table does not have
+    (its schema follows the extracted data) are left out of the rows.
+
+    Args:
+        cursor: MySQL cursor
+        table_name: Catalog table to read
+        fields: Product fields to read (default: AGGREGATE_FIELDS); "id"
+            reads the row id
+
+    Returns:
+        List of dictionaries keyed by product field (Brand, Rayon, ...)
+    """
+    fields = fields or AGGREGATE_FIELDS
+    cursor.execute(f"SELECT * FROM `{table_name}` LIMIT 0")
+    cursor.fetchall()
+    available = set(cursor.column_names)
+    selected = [field for field in fields if sanitize_column_name(field) in available]
+    if not selected:
+        return []
+    cursor.execute("SELECT " + ", ".join(f"`{sanitize_column_name(field)}`" for field in selected) +
+                   f" FROM `{table_name}`")
+    return [dict(zip(selected, row)) for row in cursor.fetchall()]
+
+def compute_catalog_aggregates(rows):
+    """
+    Compute the summary rows of one catalog.
+
+    A product's discount is (before - after) / before, rounded to a whole
+    percent; products without a valid before price count as 0%. Products
+    without a current price are left out of discounts and price bands.
+    Brands, rayons, etc. are grouped ignoring case and accents, like the
+    keys of the summary tables, under their most frequent spelling.
+
+    Args:
+        rows: Product dictionaries from read_catalog_rows
+
+    Returns:
+        Dictionary of table name -> list of value tuples (without catalog_table)
+    """
+    discounts = defaultdict(lambda: [0, Decimal(0)])
+    promo_weeks = Counter()
+    price_buckets = Counter()
+    spellings = defaultdict(Counter)
+
+    def key(value):
+        text = _text(value)
+        text_key = collation_key(text)
+        spellings[text_key][text] += 1
+        return text_key
+
+    for row in rows:
+        after = price_value(row.get('Price After (TND)'))
+        before = price_value(row.get('Price Before (TND)'))
+        if after is not None and after >= 0:
+            pct = 0
+            if before is not None and before > after:
+                pct = int(round((before - after) / before * 100))
+            for dimension, field in DIMENSIONS.items():
+                entry = discounts[(dimension, key(row.get(field)), pct)]
+                entry[0] += 1
+                entry[1] += after
+            price_buckets[(key(row.get('Rayon')),) + _bucket(after)] += 1
+
+        start = date_value(row.get('promo_date_debut'))
+        end = date_value(row.get('promo_date_fin')) or start
+        if start is not None and end >= start:
+            week = start - timedelta(days=start.weekday())
+            for _ in range(MAX_PROMO_WEEKS):
+                if week > end:
+                    break
+                promo_weeks[(week, key(row.get('Source')), key(row.get('Brand')))] += 1
+                week += timedelta(days=7)
+
+    label = {text_key: counts.most_common(1)[0][0] for text_key, counts in spellings.items()}
+    return {
+        'analytics_discounts': [(dimension, label[value], pct, count, total)
+                                for (dimension, value, pct), (count, total) in discounts.items()],
+        'analytics_promo_weeks': [(week, label[source], label[brand], count)
+                                  for (week, source, brand), count in promo_weeks.items()],
+        'analytics_price_buckets': [(label[rayon], low, high, count)
+                                    for (rayon, low, high), count in price_buckets.items()],
+    }
+
+def update_catalog_aggregates(connection, table_name):
+    """
+    Replace the summary rows of one catalog table with fresh ones computed
+    from that table only.
+
+    Args:
+        connection: Open MySQL connection
+        table_name: Catalog table that was just (re)loaded
+
+    Returns:
+        Dictionary with the number of summary rows written per table
+    """
+    cursor = connection.cursor()
+    try:
+        ensure_analytics_tables(cursor)
+        aggregates = compute_catalog_aggregates(read_catalog_rows(cursor, table_name))
+        for summary_table, values in aggregates.items():
+            cursor.execute(f"DELETE FROM `{summary_table}` WHERE `catalog_table` = %s", (table_name,))
+            if values:
+                placeholders = ", ".join(["%s"] * (len(values[0]) + 1))
+                merge = ", ".join(f"`{column}` = `{column}` + VALUES(`{column}`)"
+                                  for column in _MERGE_COLUMNS[summary_table])
+                cursor.executemany(f"INSERT INTO `{summary_table}` VALUES ({placeholders}) "
+                                   f"ON DUPLICATE KEY UPDATE {merge}",
+                                   [(table_name,) + value for value in values])
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return {summary_table: len(values) for summary_table, values in aggregates.items()}
+
+def remove_catalog_aggregates(connection, table_name):
+    """Drop the summary rows of a catalog table that no longer exists."""
+    cursor = connection.cursor()
+    try:
+        ensure_analytics_tables(cursor)
+        for summary_table in ANALYTICS_TABLES:
+            cursor.execute(f"DELETE FROM `{summary_table}` WHERE `catalog_table` = %s", (table_name,))
+        connection.commit()
+    finally:
+        cursor.close()
+
+def refresh_catalog_aggregates(table_name, connection=None):
+    """
+    Update the aggregates after a catalog was ingested. Failures are only
+    reported: the catalog itself is already loaded.
+
+    Args:
+        table_name: Catalog table that was just (re)loaded
+        connection: Connection to reuse (default: a pooled one, closed after)
+
+    Returns:
+        The counts from update_catalog_aggregates, or None on failure
+    """
+    own_connection = connection is None
+    try:
+        if own_connection:
+            connection = get_connection()
+        counts = update_catalog_aggregates(connection, table_name)
+        print(f"✅ Updated analytics for '{table_name}'", file=sys.stderr)
+        return counts
+    except Exception as err:
+        print(f"Warning: Could not update analytics for '{table_name}': {err}", file=sys.stderr)
+        return None
+    finally:
+        if own_connection and connection is not None and connection.is_connected():
+            connection.close()
+
+def list_catalog_tables(cursor):
+    """Catalog tables in the current database (tables with a source_file column)."""
+    cursor.execute(
+        "SELECT DISTINCT table_name FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND column_name = 'source_file'"
+    )
+    return [name for (name,) in cursor.fetchall()
+            if not name.endswith('__loading') and not name.endswith('__old')]
+
+def rebuild_all_aggregates(connection):
+    """Recompute every catalog's summary rows and drop those of deleted catalogs."""
+    cursor = connection.cursor()
+    try:
+        ensure_analytics_tables(cursor)
+        catalogs = list_catalog_tables(cursor)
+        cursor.execute("SELECT DISTINCT `catalog_table` FROM `analytics_discounts` "
+                       "UNION SELECT DISTINCT `catalog_table` FROM `analytics_promo_weeks` "
+                       "UNION SELECT DISTINCT `catalog_table` FROM `analytics_price_buckets`")
+        stale = {name for (name,) in cursor.fetchall()} - set(catalogs)
+    finally:
+        cursor.close()
+    for table_name in stale:
+        remove_catalog_aggregates(connection, table_name)
+    for table_name in catalogs:
+        update_catalog_aggregates(connection, table_name)
+    return {"catalogs": len(catalogs), "removed": len(stale)}
+
+def _median_pct(counts):
+    """Median of a {discount_pct: products} histogram."""
+    total = sum(counts.values())
+    if not total:
+        return None
+    seen = 0
+    ordered = sorted(counts.items())
+    for index, (pct, count) in enumerate(ordered):
+        seen += count
+        if seen * 2 > total:
+            return float(pct)
+        if seen * 2 == total:
+            return (pct + ordered[index + 1][0]) / 2.0
+
+def fetch_analytics(catalog=None):
+    """
+    Read the dashboard aggregates, summed over all catalogs or for one.
+
+    Args:
+        catalog: Catalog table name to restrict to (default: all)
+
+    Returns:
+        Dictionary with success status and "discounts", "promo_weeks" and
+        "price_distribution" lists
+    """
+    connection = None
+    try:
+        connection = get_connection()
+        cursor = connection.cursor()
+        ensure_analytics_tables(cursor)
+        where = "WHERE `catalog_table` = %s" if catalog else ""
+        params = (catalog,) if catalog else ()
+
+        cursor.execute(
+            "SELECT `dimension`, `dimension_value`, `discount_pct`, SUM(`products`), SUM(`price_after_sum`) "
+            f"FROM `analytics_discounts` {where} GROUP BY `dimension`, `dimension_value`, `discount_pct`",
+            params)
+        groups = defaultdict(lambda: {"histogram": {}, "products": 0, "price_sum": Decimal(0)})
+        for dimension, value, pct, products, price_sum in cursor.fetchall():
+            group = groups[(dimension, value)]
+            group["products"] += int(products)
+            group["price_sum"] += price_sum
+            if pct > 0:
+                group["histogram"][pct] = int(products)
+        discounts = []
+        for (dimension, value), group in sorted(groups.items()):
+            discounted = sum(group["histogram"].values())
+            discounts.append({
+                "dimension": dimension,
+                "value": value or None,
+                "products": group["products"],
+                "discounted": discounted,
+                "avg_discount_pct": round(sum(p * c for p, c in group["histogram"].items()) / discounted, 2)
+                if discounted else None,
+                "median_discount_pct": _median_pct(group["histogram"]),
+                "avg_price_after": round(float(group["price_sum"]) / group["products"], 3),
+            })
+
+        cursor.execute(
+            "SELECT `week_start`, `source`, `brand`, SUM(`promotions`) FROM `analytics_promo_weeks` "
+            f"{where} GROUP BY `week_start`, `source`, `brand` ORDER BY `week_start`", params)
+        promo_weeks = [{"week_start": week.isoformat(), "source": source or None, "brand": brand or None,
+                        "promotions": int(count)} for week, source, brand, count in cursor.fetchall()]
+
+        cursor.execute(
+            "SELECT `rayon`, `bucket_min`, `bucket_max`, SUM(`products`) FROM `analytics_price_buckets` "
+            f"{where} GROUP BY `rayon`, `bucket_min`, `bucket_max` ORDER BY `rayon`, `bucket_min`", params)
+        price_distribution = [{"rayon": rayon or None, "min": float(low),
+                               "max": float(high) if high is not None else None, "products": int(count)}
+                              for rayon, low, high, count in cursor.fetchall()]
+        cursor.close()
+        return {
+            "success": True,
+            "discounts": discounts,
+            "promo_weeks": promo_weeks,
+            "price_distribution": price_distribution,
+        }
+    except mysql.connector.Error as err:
+        return {"success": False, "error": f"Database error: {err}"}
+    finally:
+        if connection is not None and connection.is_connected():
+            connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain and read the dashboard analytics tables.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    update = commands.add_parser("update", help="recompute the aggregates of one catalog table")
+    update.add_argument("table_name")
+    commands.add_parser("rebuild", help="recompute the aggregates of every catalog table")
+    fetch = commands.add_parser("fetch", help="print the aggregates as JSON")
+    fetch.add_argument("--catalog", help="only this catalog table")
+    args = parser.parse_args()
+
+    if args.command == "fetch":
+        result = fetch_analytics(args.catalog)
+    else:
+        connection = None
+        try:
+            connection = get_connection()
+            if args.command == "update":
+                result = {"success": True, "rows": update_catalog_aggregates(connection, args.table_name)}
+            else:
+                result = dict(success=True, **rebuild_all_aggregates(connection))
+        except mysql.connector.Error as err:
+            result = {"success": False, "error": f"Database error: {err}"}
+        finally:
+            if connection is not None and connection.is_connected():
+                connection.close()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
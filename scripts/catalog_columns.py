@@ -0,0 +1,49 @@
+"""
+Shared mapping between catalog product keys and MySQL column names.
+
+create_table_catalog.py uses it to turn product keys into column names and
+fetch_catalog_data.py uses it to turn column names back into product keys.
+"""
+import re
+
+# Product keys produced by the LLM extraction step (see ocr.py)
+CATALOG_FIELDS = [
+    'Brand',
+    'Product',
+    'Rayon',
+    'Famille',
+    'Sous-famille',
+    'Grammage',
+    'Price Before (TND)',
+    'Price After (TND)',
+    'URL',
+    'promo_date_debut',
+    'promo_date_fin',
+    'Source',
+]
+
+# Metadata columns added by create_catalog_table, hidden from the frontend
+INTERNAL_COLUMNS = frozenset(['id', 'created_at', 'source_file'])
+
+def sanitize_column_name(key):
+    """
+    Convert a product key to a valid MySQL column name.
+
+    Args:
+        key: Product key (e.g., "Price Before (TND)")
+
+    Returns:
+        Column name (e.g., "price_before_tnd")
+    """
+    col_name = re.sub(r'[^\w]', '_', key).lower()
+    return re.sub(r'_+', '_', col_name).strip('_')
+
+# Reverse mapping (e.g., price_before_tnd -> Price Before (TND))
+COLUMN_TO_FIELD = {sanitize_column_name(field): field for field in CATALOG_FIELDS}
+
+def original_field_name(column_name):
+    """
+    Return the product key for a column name, or the column name itself
+    when it is not one of the known catalog fields.
+    """
+    return COLUMN_TO_FIELD.get(column_name, column_name)
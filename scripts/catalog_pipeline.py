@@ -0,0 +1,375 @@
+"""
+In-process catalog pipeline: OCR -> LLM -> DB with overlapping stages.
+
+Instead of OCRing every page, then making one LLM call for the whole
+document, then spawning create_table_catalog.py and fetch_catalog_data.py,
+the stages run concurrently and are connected by bounded queues:
+
+  OCR thread --(pages)--> LLM worker threads --(products)--> DB thread
+
+A full queue blocks the stage feeding it (backpressure), so a slow LLM
+holds back OCR instead of letting finished pages pile up in memory.
+End-to-end latency approaches the slowest stage instead of the sum.
+
+The DB stage collects the products and, once every page is done, loads them
+into a staging table typed by infer_catalog_schema, exactly like
+create_catalog_table would, then swaps it in place of the real table so
+readers never see a half-loaded catalog. Column types depend on every value
+(a single non-numeric price keeps the column as text), so the load cannot
+start before the last page; it is a small part of the run next to OCR and
+the LLM calls.
+
+OCR results and extracted products are checkpointed per page (see ocr_jobs);
+with --resume, a rerun after a crash or timeout only redoes the pages that
+are missing or whose extraction failed. Pages seen in earlier catalogs reuse
+their OCR and extraction results (see page_dedup).
+
+Usage:
+  python catalog_pipeline.py <pdf_path> [--name original.pdf] [--fetch]
+                             [--llm-workers N] [--queue-size N] [--resume]
+"""
+import os
+import sys
+import json
+import queue
+import argparse
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+import fitz
+
+import ocr
+from ocr_metrics import stage, record_event, get_metrics
+from ocr_jobs import open_job, load_page_checkpoint, save_page_checkpoint
+from page_dedup import PageFingerprint, open_page_index, config_variant, is_reusable
+from create_table_catalog import (
+    sanitize_table_name, infer_catalog_schema, create_table_from_schema,
+    build_catalog_rows, insert_catalog_rows, invalidate_table,
+    is_null_value, normalize_date_value,
+)
+from database import get_connection, table_exists, forget_table
+from catalog_analytics import refresh_catalog_aggregates
+from product_matching import refresh_product_matches
+from price_changes import refresh_price_changes
+from catalog_search import refresh_search_index
+
+# Sentinel closing a queue
+_DONE = object()
+
+
+class _PipelineError(Exception):
+    """Raised inside a stage when another stage has already failed."""
+
+
+def _put(q: "queue.Queue", item, failed: threading.Event):
+    """Blocking put that gives up once the pipeline has failed."""
+    while True:
+        if failed.is_set():
+            raise _PipelineError()
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q: "queue.Queue", failed: threading.Event):
+    """Blocking get that gives up once the pipeline has failed."""
+    while True:
+        if failed.is_set():
+            raise _PipelineError()
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+
+
+def _fill_promo_dates(cursor, table_name: str, products: List[Dict[str, Any]]):
+    """
+    Per-page extraction only sees the promo dates on the page that prints
+    them (usually the cover); copy the most common dates to the other rows.
+    """
+    for field in ("promo_date_debut", "promo_date_fin"):
+        dates = Counter(
+            normalize_date_value(row[field]) for row in products if not is_null_value(row.get(field))
+        )
+        dates.pop(None, None)
+        if dates:
+            cursor.execute(f"UPDATE `{table_name}` SET `{field}` = %s WHERE `{field}` IS NULL",
+                           (dates.most_common(1)[0][0],))
+
+
+def _load_staging_table(connection, staging_table: str, products: List[Dict[str, Any]], pdf_filename: str) -> int:
+    """
+    (Re)create the staging table with the columns create_catalog_table would
+    infer for these products and insert them. Does not commit.
+
+    Returns:
+        Number of rows inserted
+    """
+    schema = infer_catalog_schema(products)
+    if not schema:
+        raise ValueError("No product fields found in the extracted products")
+    cursor = connection.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS `{staging_table}`")
+    create_table_from_schema(cursor, staging_table, schema)
+    rows = build_catalog_rows(products, schema, pdf_filename)
+    return insert_catalog_rows(connection, staging_table, schema, rows)
+
+
+def run_catalog_pipeline(
+    pdf_path: str,
+    pdf_filename: str = None,
+    llm_workers: int = 4,
+    queue_size: int = 4,
+    openai_model: str = "gpt-4.1",
+    resume: bool = False
+) -> Dict[str, Any]:
+    """
+    OCR, extract and load a catalog PDF with the three stages overlapping.
+
+    Args:
+        pdf_path: PDF to process
+        pdf_filename: Original file name, used for the table name and
+            source_file column (defaults to the basename of pdf_path)
+        llm_workers: Pages sent to the LLM concurrently
+        queue_size: Capacity of each inter-stage queue
+        openai_model: Model used for per-page extraction
+        resume: Reuse the per-page checkpoints of an earlier run on this PDF
+
+    Returns:
+        Dictionary with success status, table name and counts, like
+        create_catalog_table
+    """
+    if not os.path.exists(pdf_path):
+        return {"success": False, "error": f"File not found: {pdf_path}"}
+
+    pdf_filename = pdf_filename or os.path.basename(pdf_path)
+    table_name = sanitize_table_name(pdf_filename)
+    staging_table = f"{table_name[:52]}__loading"
+    config = ocr.get_ocr_config()
+    try:
+        job_dir = open_job(pdf_path, config, resume=resume)
+    except OSError as e:
+        print(f"Checkpointing disabled: {e}", file=sys.stderr)
+        job_dir = None
+    page_index = open_page_index()
+    ocr_variant = config_variant(config)
+
+    pages_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    products_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    failed = threading.Event()
+    errors: List[str] = []
+    failed_pages: List[Dict[str, Any]] = []
+    state = {"num_pages": 0, "inserted": 0, "products": 0}
+
+    def fail(message: str):
+        errors.append(message)
+        failed.set()
+
+    def ocr_stage():
+        # Same per-page and per-document budgets as ocr.perform_ocr_on_pdf_enhanced
+        doc_deadline = time.perf_counter() + ocr.DOC_BUDGET_S if ocr.DOC_BUDGET_S > 0 else None
+        worker = None
+        if ocr.PAGE_BUDGET_S > 0 or doc_deadline is not None:
+            worker = ocr.PageWorker(pdf_path, config["language"], config["dpi"], config["paddle_options"])
+        try:
+            with fitz.open(pdf_path) as doc:
+                state["num_pages"] = len(doc)
+                for page_num in range(len(doc)):
+                    fingerprint = PageFingerprint(doc[page_num]) if page_index is not None else None
+                    page_result = load_page_checkpoint(job_dir, page_num, "ocr")
+                    if page_result is None and fingerprint is not None:
+                        page_result = page_index.lookup(fingerprint, "ocr", ocr_variant)
+                    if page_result is None:
+                        if worker is None:
+                            page_result = ocr.ocr_page(doc[page_num], config["language"], config["method"],
+                                                       config["dpi"], config["paddle_options"])
+                        else:
+                            page_result = ocr.ocr_page_with_budget(worker, doc[page_num], config["method"],
+                                                                   ocr.PAGE_BUDGET_S, doc_deadline)
+                        if fingerprint is not None and is_reusable(page_result):
+                            page_index.store(fingerprint, "ocr", ocr_variant, page_result)
+                    save_page_checkpoint(job_dir, page_num, "ocr", page_result)
+                    if fingerprint is not None:
+                        fingerprint.detach()
+                    _put(pages_q, (page_num, page_result, fingerprint), failed)
+        except _PipelineError:
+            return
+        except Exception as e:
+            fail(f"OCR failed: {e}")
+        finally:
+            if worker is not None:
+                worker.close()
+            for _ in range(llm_workers):
+                try:
+                    _put(pages_q, _DONE, failed)
+                except _PipelineError:
+                    break
+
+    def llm_stage():
+        try:
+            while True:
+                item = _get(pages_q, failed)
+                if item is _DONE:
+                    break
+                page_num, page_result, fingerprint = item
+                products = load_page_checkpoint(job_dir, page_num, "products")
+                if products is None and fingerprint is not None:
+                    products = page_index.lookup(fingerprint, "products", openai_model)
+                    if products is not None:
+                        save_page_checkpoint(job_dir, page_num, "products", products)
+                if products is not None:
+                    record_event("checkpoint_hit", page=page_num + 1, kind="products")
+                    if products:
+                        _put(products_q, products, failed)
+                    continue
+                ocr_json = {"ok": True, "ocr": {
+                    "pdf_path": os.path.abspath(pdf_path),
+                    "num_pages": state["num_pages"],
+                    "pages": {f"page_{page_num+1}": page_result},
+                }}
+                try:
+                    products = ocr.llm_extract_products_from_ocr(ocr_json, openai_model=openai_model)
+                except Exception as e:
+                    # One bad page should not sink the catalog
+                    print(f"LLM extraction failed on page {page_num+1}: {e}", file=sys.stderr)
+                    failed_pages.append({"page": page_num + 1, "error": str(e)})
+                    continue
+                if isinstance(products, ocr.PartialProducts):
+                    # Loaded, but not checkpointed: a resumed run extracts the page again
+                    failed_pages.append({"page": page_num + 1, "error": products.error, "partial": True})
+                elif ocr.is_complete_extraction(products):
+                    save_page_checkpoint(job_dir, page_num, "products", products)
+                    if fingerprint is not None:
+                        page_index.store(fingerprint, "products", openai_model, products)
+                if isinstance(products, list) and products:
+                    _put(products_q, products, failed)
+        except _PipelineError:
+            return
+        except Exception as e:
+            fail(f"LLM stage failed: {e}")
+        finally:
+            try:
+                _put(products_q, _DONE, failed)
+            except _PipelineError:
+                pass
+
+    def db_stage():
+        connection = None
+        try:
+            collected: List[Dict[str, Any]] = []
+            open_workers = llm_workers
+            while open_workers:
+                item = _get(products_q, failed)
+                if item is _DONE:
+                    open_workers -= 1
+                    continue
+                products = [p for p in item if isinstance(p, dict)]
+                state["products"] += len(products)
+                collected.extend(products)
+
+            if failed.is_set():
+                return
+            if failed_pages and not collected:
+                # Keep the previous table rather than replacing it with nothing
+                fail("LLM extraction failed on every page")
+                return
+            connection = get_connection()
+            cursor = connection.cursor()
+            with stage("db_insert", rows=len(collected)):
+                state["inserted"] = _load_staging_table(connection, staging_table, collected, pdf_filename)
+            _fill_promo_dates(cursor, staging_table, collected)
+            connection.commit()
+
+            # Swap the staging table in; RENAME of both tables is atomic
+            old_table = f"{table_name[:56]}__old"
+            cursor.execute(f"DROP TABLE IF EXISTS `{old_table}`")
+            forget_table(table_name)
+            try:
+                if table_exists(connection, table_name):
+                    cursor.execute(f"RENAME TABLE `{table_name}` TO `{old_table}`, `{staging_table}` TO `{table_name}`")
+                    cursor.execute(f"DROP TABLE `{old_table}`")
+                else:
+                    cursor.execute(f"RENAME TABLE `{staging_table}` TO `{table_name}`")
+            finally:
+                # Also when the swap failed halfway: the table may already be the new one
+                invalidate_table(staging_table)
+                invalidate_table(table_name)
+            refresh_catalog_aggregates(table_name, connection)
+            refresh_product_matches(table_name, connection)
+            refresh_price_changes(table_name, connection)
+            refresh_search_index(table_name, connection)
+        except _PipelineError:
+            return
+        except Exception as e:
+            fail(f"Database stage failed: {e}")
+        finally:
+            if connection is not None and connection.is_connected():
+                if failed.is_set():
+                    try:
+                        connection.cursor().execute(f"DROP TABLE IF EXISTS `{staging_table}`")
+                    except Exception:
+                        pass
+                connection.close()
+
+    threads = [threading.Thread(target=ocr_stage, name="ocr")]
+    threads += [threading.Thread(target=llm_stage, name=f"llm-{i}") for i in range(llm_workers)]
+    threads.append(threading.Thread(target=db_stage, name="db"))
+    with stage("pipeline", method=config["method"]):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    dedup = None
+    if page_index is not None:
+        dedup = page_index.stats()
+        page_index.close()
+
+    if errors:
+        return {"success": False, "error": "; ".join(errors), "failed_pages": failed_pages}
+
+    print(f"✅ Inserted {state['inserted']} products into '{table_name}'", file=sys.stderr)
+    result = {
+        "success": True,
+        "table_name": table_name,
+        "pages": state["num_pages"],
+        "products_extracted": state["products"],
+        "products_inserted": state["inserted"],
+        "failed_pages": failed_pages,
+        "dedup": dedup,
+        "message": f"Successfully created table '{table_name}' and inserted {state['inserted']} products",
+    }
+    metrics = get_metrics()
+    if metrics is not None:
+        result["metrics"] = metrics
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR, extract and load a catalog PDF with overlapping stages.")
+    parser.add_argument("pdf_path")
+    parser.add_argument("--name", help="original PDF file name (used for the table name)")
+    parser.add_argument("--llm-workers", type=int, default=4, help="pages sent to the LLM concurrently")
+    parser.add_argument("--queue-size", type=int, default=4, help="capacity of each inter-stage queue")
+    parser.add_argument("--resume", action="store_true", help="reuse pages checkpointed by an earlier run on this PDF")
+    parser.add_argument("--fetch", action="store_true", help="include the loaded rows in the output (like fetch_catalog_data.py)")
+    args = parser.parse_args()
+
+    result = run_catalog_pipeline(args.pdf_path, args.name, args.llm_workers, args.queue_size,
+                                  resume=args.resume)
+    if result["success"] and args.fetch:
+        from fetch_catalog_data import fetch_catalog_data
+        fetched = fetch_catalog_data(result["table_name"])
+        if fetched["success"]:
+            result["data"] = fetched["data"]
+
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    sys.exit(0 if result["success"] else 1)
+
+
+if __name__ == "__main__":
+    main()
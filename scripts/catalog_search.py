@@ -0,0 +1,335 @@
+"""
+Full-text product search across all ingested catalogs.
+
+create_catalog_table (and the streaming pipeline) index every catalog they
+load into a local SQLite FTS5 sidecar (CATALOG_SEARCH_INDEX, default
+<repo>/.cache/search_index.sqlite3). One index covers every catalog, so a
+query costs the same however many catalog tables exist, and it never
+touches MySQL.
+
+Queries are accent- and case-insensitive ("creme" finds "Crème") and every
+word matches as a prefix ("choc" finds "chocolat"); all words must match.
+Results are ranked with BM25, a match in Product weighing more than one in
+Brand, Famille or Rayon.
+
+Usage:
+  python catalog_search.py <query> [--catalog <table_name>] [--page N] [--per-page N]
+  python catalog_search.py --index <table_name>
+  python catalog_search.py --rebuild
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from pathlib import Path
+import mysql.connector
+from fetch_catalog_data import build_column_plan, convert_row, decimal_date_handler
+from database import get_connection
+
+# Product keys indexed for search, with their BM25 weights
+SEARCH_FIELDS = [
+    ('Product', 10.0),
+    ('Brand', 5.0),
+    ('Famille', 2.0),
+    ('Sous-famille', 2.0),
+    ('Rayon', 1.0),
+]
+
+_FTS_COLUMNS = ['product', 'brand', 'famille', 'sous_famille', 'rayon']
+# Indexed too, so restricting a search to one catalog uses the index
+_CATALOG_COLUMN = 'catalog_table'
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 200
+
+# Rows read from MySQL and written to the index per batch
+INDEX_BATCH_SIZE = 1000
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS entries (
+        rowid INTEGER PRIMARY KEY,
+        catalog_table TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        product TEXT, brand TEXT, famille TEXT, sous_famille TEXT, rayon TEXT,
+        data TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS entries_catalog ON entries (catalog_table)",
+    """
+    CREATE TABLE IF NOT EXISTS catalogs (
+        catalog_table TEXT PRIMARY KEY,
+        products INTEGER NOT NULL,
+        indexed_at REAL NOT NULL
+    )
+    """,
+    # External-content index over entries, kept in sync by triggers
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+        {', '.join(_FTS_COLUMNS + [_CATALOG_COLUMN])},
+        content='entries', content_rowid='rowid',
+        tokenize="unicode61 remove_diacritics 2 tokenchars '_'", prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+        INSERT INTO entries_fts(rowid, {', '.join(_FTS_COLUMNS + [_CATALOG_COLUMN])})
+        VALUES (new.rowid, {', '.join('new.' + c for c in _FTS_COLUMNS + [_CATALOG_COLUMN])});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+        INSERT INTO entries_fts(entries_fts, rowid, {', '.join(_FTS_COLUMNS + [_CATALOG_COLUMN])})
+        VALUES ('delete', old.rowid, {', '.join('old.' + c for c in _FTS_COLUMNS + [_CATALOG_COLUMN])});
+    END
+    """,
+]
+
+def get_index_path():
+    """Return the search index path (CATALOG_SEARCH_INDEX, default <repo>/.cache/search_index.sqlite3)."""
+    default_path = Path(__file__).resolve().parent.parent / ".cache" / "search_index.sqlite3"
+    return Path(os.getenv("CATALOG_SEARCH_INDEX", str(default_path)))
+
+def open_search_index(path=None):
+    """Open (and create if needed) the search index."""
+    path = Path(path or get_index_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(path), timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    for statement in _SCHEMA:
+        connection.execute(statement)
+    connection.commit()
+    return connection
+
+def build_match_query(query, catalog=None):
+    """
+    Turn a user query into an FTS5 MATCH expression: every word must match,
+    as a prefix, in the searchable columns. Operators and quotes typed by
+    the user are not interpreted.
+
+    Args:
+        query: Free-text query
+        catalog: Catalog table name to restrict to
+
+    Returns:
+        MATCH expression, or None if the query has no words
+    """
+    words = re.findall(r"\w+", query or "")
+    if not words:
+        return None
+    terms = " ".join(f'"{word}"*' for word in words)
+    expression = f"{{{' '.join(_FTS_COLUMNS)}}} : ({terms})"
+    if catalog:
+        # Table names are single tokens ("_" is a token character)
+        expression += f' AND {_CATALOG_COLUMN} : "{catalog.replace(chr(34), "")}"'
+    return expression
+
+def index_products(index, table_name, products):
+    """
+    Replace the indexed products of one catalog.
+
+    Args:
+        index: Connection from open_search_index()
+        table_name: Catalog table the products belong to
+        products: Iterable of (product id, product dictionary)
+
+    Returns:
+        Number of products indexed
+    """
+    count = 0
+    with index:
+        index.execute("DELETE FROM entries WHERE catalog_table = ?", (table_name,))
+        batch = []
+        for product_id, product in products:
+            batch.append((table_name, product_id) +
+                         tuple(_text(product.get(field)) for field, _ in SEARCH_FIELDS) +
+                         (json.dumps(product, ensure_ascii=False, default=decimal_date_handler),))
+            if len(batch) >= INDEX_BATCH_SIZE:
+                count += _insert_entries(index, batch)
+                batch = []
+        count += _insert_entries(index, batch)
+        index.execute("INSERT OR REPLACE INTO catalogs VALUES (?, ?, ?)", (table_name, count, time.time()))
+    return count
+
+def _text(value):
+    return str(value) if value is not None else None
+
+def _insert_entries(index, batch):
+    index.executemany(
+        f"INSERT INTO entries (catalog_table, product_id, {', '.join(_FTS_COLUMNS)}, data) "
+        f"VALUES (?, ?, {', '.join('?' for _ in _FTS_COLUMNS)}, ?)",
+        batch,
+    )
+    return len(batch)
+
+def remove_catalog(index, table_name):
+    """Drop a catalog from the index."""
+    with index:
+        index.execute("DELETE FROM entries WHERE catalog_table = ?", (table_name,))
+        index.execute("DELETE FROM catalogs WHERE catalog_table = ?", (table_name,))
+
+def _read_catalog_products(connection, table_name):
+    """Yield (id, product dictionary) for every row of a catalog table, as fetch_catalog_data formats them."""
+    cursor = connection.cursor(buffered=False)
+    try:
+        cursor.execute(f"SELECT `id`, t.* FROM `{table_name}` t ORDER BY `id`")
+        plan = build_column_plan(cursor.description)
+        while True:
+            rows = cursor.fetchmany(INDEX_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0], convert_row(row, plan)
+    finally:
+        cursor.close()
+
+def index_catalog_table(connection, table_name, index=None):
+    """
+    (Re)index one catalog table from MySQL.
+
+    Args:
+        connection: Open MySQL connection
+        table_name: Catalog table to index
+        index: Search index connection (default: open and close one)
+
+    Returns:
+        Number of products indexed
+    """
+    own_index = index is None
+    if own_index:
+        index = open_search_index()
+    try:
+        return index_products(index, table_name, _read_catalog_products(connection, table_name))
+    finally:
+        if own_index:
+            index.close()
+
+def refresh_search_index(table_name, connection=None):
+    """
+    Index a catalog after it was ingested. Failures are only reported: the
+    catalog itself is already loaded.
+
+    Args:
+        table_name: Catalog table that was just (re)loaded
+        connection: Connection to reuse (default: a pooled one, closed after)
+
+    Returns:
+        Number of products indexed, or None on failure
+    """
+    own_connection = connection is None
+    try:
+        if own_connection:
+            connection = get_connection()
+        count = index_catalog_table(connection, table_name)
+        print(f"✅ Indexed {count} products of '{table_name}' for search", file=sys.stderr)
+        return count
+    except (mysql.connector.Error, sqlite3.Error, OSError) as err:
+        print(f"Warning: Could not index '{table_name}' for search: {err}", file=sys.stderr)
+        return None
+    finally:
+        if own_connection and connection is not None and connection.is_connected():
+            connection.close()
+
+def rebuild_search_index(connection):
+    """Index every catalog table and drop catalogs that no longer exist."""
+    from catalog_analytics import list_catalog_tables
+    cursor = connection.cursor()
+    try:
+        catalogs = list_catalog_tables(cursor)
+    finally:
+        cursor.close()
+    index = open_search_index()
+    try:
+        stale = {name for (name,) in index.execute("SELECT catalog_table FROM catalogs")} - set(catalogs)
+        for table_name in stale:
+            remove_catalog(index, table_name)
+        products = sum(index_catalog_table(connection, table_name, index) for table_name in catalogs)
+    finally:
+        index.close()
+    return {"catalogs": len(catalogs), "removed": len(stale), "products": products}
+
+def search_products(query, catalog=None, page=1, per_page=DEFAULT_PER_PAGE, index=None):
+    """
+    Search products across all indexed catalogs.
+
+    Args:
+        query: Free-text query (e.g., "creme dessert choc")
+        catalog: Catalog table name to restrict to (default: all)
+        page: 1-based page number
+        per_page: Results per page (at most MAX_PER_PAGE)
+        index: Search index connection (default: open and close one)
+
+    Returns:
+        Dictionary with success status, "data" (products with their
+        catalog_table, product_id and score, best first), "total", "page"
+        and "per_page"
+    """
+    page = max(int(page), 1)
+    per_page = min(max(int(per_page), 1), MAX_PER_PAGE)
+    match = build_match_query(query, catalog)
+    if match is None:
+        return {"success": True, "data": [], "total": 0, "page": page, "per_page": per_page}
+
+    own_index = index is None
+    try:
+        if own_index:
+            index = open_search_index()
+        weights = ", ".join([str(weight) for _, weight in SEARCH_FIELDS] + ["0"])
+        # Rank in the FTS index alone; join only the rows of the page
+        rows = index.execute(
+            f"SELECT e.catalog_table, e.product_id, e.data, hits.score FROM ("
+            f" SELECT rowid, bm25(entries_fts, {weights}) AS score FROM entries_fts"
+            f" WHERE entries_fts MATCH ? ORDER BY score LIMIT ? OFFSET ?"
+            f") hits JOIN entries e ON e.rowid = hits.rowid ORDER BY hits.score",
+            (match, per_page, (page - 1) * per_page),
+        ).fetchall()
+        total = index.execute("SELECT COUNT(*) FROM entries_fts WHERE entries_fts MATCH ?", (match,)).fetchone()[0]
+    except sqlite3.Error as err:
+        return {"success": False, "error": f"Search index error: {err}"}
+    finally:
+        if own_index and index is not None:
+            index.close()
+
+    data = []
+    for catalog_table, product_id, product_json, score in rows:
+        product = json.loads(product_json)
+        product.update({"catalog_table": catalog_table, "product_id": product_id, "score": round(-score, 4)})
+        data.append(product)
+    return {"success": True, "data": data, "total": total, "page": page, "per_page": per_page}
+
+def main():
+    parser = argparse.ArgumentParser(description="Search products across all catalogs.")
+    parser.add_argument("query", nargs="?", help="words to search for (accents and case are ignored)")
+    parser.add_argument("--catalog", help="only this catalog table")
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--per-page", type=int, default=DEFAULT_PER_PAGE)
+    parser.add_argument("--index", metavar="TABLE_NAME", help="(re)index one catalog table from MySQL")
+    parser.add_argument("--rebuild", action="store_true", help="(re)index every catalog table from MySQL")
+    args = parser.parse_args()
+
+    if args.index or args.rebuild:
+        connection = None
+        try:
+            connection = get_connection()
+            if args.index:
+                result = {"success": True, "products": index_catalog_table(connection, args.index)}
+            else:
+                result = dict(success=True, **rebuild_search_index(connection))
+        except (mysql.connector.Error, sqlite3.Error) as err:
+            result = {"success": False, "error": str(err)}
+        finally:
+            if connection is not None and connection.is_connected():
+                connection.close()
+    elif args.query:
+        result = search_products(args.query, args.catalog, args.page, args.per_page)
+    else:
+        parser.error("a query, --index or --rebuild is required")
+
+    print(json.dumps(result, ensure_ascii=False, default=decimal_date_handler))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
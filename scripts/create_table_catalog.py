@@ -4,8 +4,12 @@ import json
 import re
 import mysql.connector
 from mysql.connector import errorcode
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal
 from pathlib import Path
+from catalog_columns import INTERNAL_COLUMNS, sanitize_column_name
+from database import get_connection, forget_table
+from result_cache import bump_table_version
 
 def sanitize_table_name(filename):
     """
@@ -56,44 +60,233 @@ def sanitize_table_name(filename):
     # Make lowercase (MySQL best practice)
     return name.lower()
 
-def get_mysql_type_for_field(field_name, sample_value):
+# Values the LLM uses to mean "no value"
+NULL_SENTINELS = frozenset(['', 'null', 'None', '-'])
+
+# Longest string kept in a VARCHAR column before switching to TEXT
+MAX_VARCHAR_LENGTH = 1024
+
+# DECIMAL(10, 3) holds up to 9,999,999.999
+MAX_DECIMAL_VALUE = Decimal('9999999.999')
+
+# Number of rows sent per multi-row INSERT
+INSERT_BATCH_SIZE = 500
+
+def is_null_value(value):
+    """Return True for None and the null sentinels produced by the LLM."""
+    return value is None or (isinstance(value, str) and value.strip() in NULL_SENTINELS)
+
+def parse_decimal_string(value):
+    """
+    Parse a price or number to a Decimal suitable for a DECIMAL(10, 3) column.
+
+    Currency letters and spaces are removed, and a single comma is read as
+    the decimal separator (e.g., "17,800 DT" -> 17.800 TND).
+
+    Args:
+        value: JSON number or price string
+
+    Returns:
+        Decimal, or None if the value is not a plain number
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = Decimal(str(value))
+    else:
+        text = re.sub(r'(?i)\s+|TND|DT', '', str(value))
+        if not re.fullmatch(r'-?\d+([.,]\d+)?', text):
+            return None
+        number = Decimal(text.replace(',', '.'))
+    if abs(number) > MAX_DECIMAL_VALUE:
+        return None
+    return number
+
+def is_date_field(field_name):
+    """Return True if a field holds dates, based on its name."""
+    return 'date' in field_name.lower()
+
+def is_price_field(field_name):
+    """Return True if a field holds prices, based on its name."""
+    field_lower = field_name.lower()
+    return 'price' in field_lower or 'prix' in field_lower
+
+def infer_catalog_schema(json_data):
+    """
+    Infer the table columns from every product in a single pass.
+
+    Columns are the union of all product keys, in first-seen order. Keys
+    that sanitize to the same column name share a column. For each column
+    the pass records the longest value and whether every non-null value is
+    a number, so types can be as tight as the data allows.
+
+    Args:
+        json_data: List of product dictionaries
+
+    Returns:
+        List of column dictionaries with "name", "keys" and "type"
     """
-    Determine appropriate MySQL column type based on field name and sample value.
+    columns = {}
+    for product in json_data:
+        if not isinstance(product, dict):
+            continue
+        for key, value in product.items():
+            col_name = sanitize_column_name(key)
+            if not col_name or col_name in INTERNAL_COLUMNS:
+                continue
+
+            column = columns.get(col_name)
+            if column is None:
+                column = columns[col_name] = {
+                    "name": col_name,
+                    "keys": [],
+                    "field": key,
+                    "max_length": 0,
+                    "non_null": 0,
+                    "all_numbers": True,
+                    "all_decimals": True,
+                }
+            if key not in column["keys"]:
+                column["keys"].append(key)
+
+            if is_null_value(value):
+                continue
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+
+            column["non_null"] += 1
+            column["max_length"] = max(column["max_length"], len(str(value)))
+            if column["all_numbers"] and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                column["all_numbers"] = False
+            if column["all_decimals"] and parse_decimal_string(value) is None:
+                column["all_decimals"] = False
+
+    schema = []
+    for column in columns.values():
+        column["type"] = get_mysql_type_for_field(column["field"], column)
+        schema.append(column)
+    return schema
+
+def get_mysql_type_for_field(field_name, stats):
+    """
+    Determine appropriate MySQL column type based on field name and the
+    statistics gathered over all of its values.
     
     Args:
         field_name: Name of the field
-        sample_value: Sample value from the JSON data
+        stats: Column dictionary from infer_catalog_schema
         
     Returns:
         MySQL column type definition
     """
     field_lower = field_name.lower()
+    has_values = stats["non_null"] > 0
     
     # Date fields
-    if 'date' in field_lower:
+    if is_date_field(field_name):
         return 'DATE'
     
-    # Price fields
-    if 'price' in field_lower or 'prix' in field_lower:
+    # Price fields (kept as text if any value is not a plain number)
+    if is_price_field(field_name) and stats["all_decimals"]:
         return 'DECIMAL(10, 3)'  # Supports up to 9,999,999.999 TND
     
     # URL fields
     if 'url' in field_lower or 'link' in field_lower:
         return 'TEXT'
     
-    # Check sample value if available
-    if sample_value is not None:
-        # Try to detect if it's a number
-        if isinstance(sample_value, (int, float)):
-            return 'DECIMAL(10, 3)'
-        
-        # For strings, check length
-        str_value = str(sample_value)
-        if len(str_value) > 255:
-            return 'TEXT'
+    # Numeric fields
+    if has_values and stats["all_numbers"] and stats["all_decimals"]:
+        return 'DECIMAL(10, 3)'
     
-    # Default to VARCHAR(255)
-    return 'VARCHAR(255)'
+    # Strings: as narrow as the longest value
+    if stats["max_length"] > MAX_VARCHAR_LENGTH:
+        return 'TEXT'
+    return f'VARCHAR({max(stats["max_length"], 1)})'
+
+def normalize_date_value(value):
+    """
+    Normalize a date value to a MySQL DATE string, or None if it is not a
+    valid date.
+    """
+    text = str(value).strip()
+    try:
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        pass
+
+    parsed = parse_date_string(text)
+    if parsed is None:
+        return None
+    try:
+        return date.fromisoformat(parsed).isoformat()
+    except ValueError:
+        print(f"Warning: Invalid date '{value}'", file=sys.stderr)
+        return None
+
+def normalize_column_values(column, values):
+    """
+    Normalize all values of one column in a single pass.
+
+    Null sentinels become None, dates are parsed with parse_date_string and
+    DECIMAL columns get Decimal values. Dates repeat heavily in a catalog,
+    so each distinct date string is only parsed once.
+
+    Args:
+        column: Column dictionary from infer_catalog_schema
+        values: Raw values of the column, one per product
+
+    Returns:
+        List of normalized values
+    """
+    col_type = column["type"]
+    normalized = [None if is_null_value(value) else value for value in values]
+
+    if col_type == 'DATE':
+        parsed_dates = {}
+        for i, value in enumerate(normalized):
+            if value is not None:
+                if value not in parsed_dates:
+                    parsed_dates[value] = normalize_date_value(value)
+                normalized[i] = parsed_dates[value]
+    elif col_type.startswith('DECIMAL'):
+        normalized = [None if value is None else parse_decimal_string(value) for value in normalized]
+    else:
+        normalized = [
+            json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+            for value in normalized
+        ]
+
+    return normalized
+
+def build_catalog_rows(json_data, schema, pdf_filename):
+    """
+    Build the rows to insert, normalizing values column by column.
+
+    Args:
+        json_data: List of product dictionaries
+        schema: Columns from infer_catalog_schema
+        pdf_filename: Value for the source_file column
+
+    Returns:
+        List of row tuples in schema order, followed by source_file
+    """
+    products = [product for product in json_data if isinstance(product, dict)]
+    value_columns = []
+    for column in schema:
+        keys = column["keys"]
+        if len(keys) == 1:
+            key = keys[0]
+            raw = [product.get(key) for product in products]
+        else:
+            # Several keys map to this column: take the first non-null one
+            raw = [
+                next((product[key] for key in keys if not is_null_value(product.get(key))), None)
+                for product in products
+            ]
+        value_columns.append(normalize_column_values(column, raw))
+
+    value_columns.append([pdf_filename] * len(products))
+    return list(zip(*value_columns))
 
 def parse_date_string(date_str):
     """
@@ -127,24 +320,112 @@ def parse_date_string(date_str):
     
     return None
 
-def create_catalog_table(json_data, pdf_filename):
+def create_table_from_schema(cursor, table_name, schema):
+    """
+    Create a catalog table with the given product columns plus the id,
+    created_at and source_file metadata columns.
+
+    Args:
+        cursor: MySQL cursor
+        table_name: Name of the table to create
+        schema: Columns from infer_catalog_schema
+    """
+    columns = []
+    
+    # Add an auto-increment ID as primary key
+    columns.append("id INT AUTO_INCREMENT PRIMARY KEY")
+    
+    # Create columns based on JSON keys
+    for column in schema:
+        columns.append(f"`{column['name']}` {column['type']}")
+    
+    # Add metadata columns
+    columns.append("created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+    columns.append("source_file VARCHAR(255)")
+    
+    create_table_query = f"""
+    CREATE TABLE `{table_name}` (
+        {', '.join(columns)}
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """
+    
+    cursor.execute(create_table_query)
+    forget_table(table_name)
+
+def insert_catalog_rows(connection, table_name, schema, rows):
+    """
+    Insert rows in multi-row batches; a failing batch is retried row by row
+    so one bad product does not lose the others. Does not commit.
+
+    Args:
+        connection: MySQL connection
+        table_name: Target table
+        schema: Columns the rows were built for
+        rows: Row tuples from build_catalog_rows
+
+    Returns:
+        Number of rows inserted
+    """
+    # Prepare column names for INSERT
+    data_columns = [column["name"] for column in schema]
+    
+    placeholders = ', '.join(['%s'] * (len(data_columns) + 1))  # +1 for source_file
+    columns_str = ', '.join([f"`{col}`" for col in data_columns] + ["`source_file`"])
+    
+    insert_query = f"""
+    INSERT INTO `{table_name}` ({columns_str})
+    VALUES ({placeholders})
+    """
+    
+    cursor = connection.cursor()
+    insert_cursor = connection.cursor(prepared=True)
+    inserted_count = 0
+    try:
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            batch = rows[start:start + INSERT_BATCH_SIZE]
+            try:
+                cursor.executemany(insert_query, batch)
+                inserted_count += len(batch)
+                continue
+            except mysql.connector.Error as err:
+                print(f"Warning: Batch insert failed, retrying row by row: {err}", file=sys.stderr)
+
+            # Insert each product of the failed batch through a prepared statement
+            for values in batch:
+                try:
+                    insert_cursor.execute(insert_query, values)
+                    inserted_count += 1
+                except mysql.connector.Error as err:
+                    print(f"Warning: Failed to insert product: {err}", file=sys.stderr)
+                    print(f"Product data: {dict(zip(data_columns, values))}", file=sys.stderr)
+                    # Continue with other products
+    finally:
+        insert_cursor.close()
+        cursor.close()
+    
+    return inserted_count
+
+def invalidate_table(table_name):
+    """Invalidate cached fetch results after a table was (re)written."""
+    forget_table(table_name)
+    try:
+        bump_table_version(table_name)
+    except OSError as e:
+        print(f"Warning: Could not invalidate fetch cache for '{table_name}': {e}", file=sys.stderr)
+
+def create_catalog_table(json_data, pdf_filename, refresh_derived=True):
     """
     Create a MySQL table from catalog JSON data.
     
     Args:
         json_data: List of product dictionaries
         pdf_filename: Name of the PDF file (used for table name)
+        refresh_derived: Also update the analytics, product matches, price
+            changes and search index from the new table
         
     Returns:
         Dictionary with success status and message
     """
-    # Database connection parameters
-    host = os.getenv("MYSQL_HOST", "localhost")
-    port = int(os.getenv("MYSQL_PORT", "3306"))
-    user = os.getenv("MYSQL_USER", "mon_user")
-    password = os.getenv("MYSQL_PASSWORD", "motdepasse_user")
-    database = os.getenv("MYSQL_DATABASE", "ma_base")
-
     connection = None
     
     try:
@@ -165,95 +446,49 @@ def create_catalog_table(json_data, pdf_filename):
         table_name = sanitize_table_name(pdf_filename)
         print(f"Creating table: {table_name}", file=sys.stderr)
         
-        # Connect to MySQL
-        connection = mysql.connector.connect(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            database=database
-        )
+        # Get a pooled connection
+        connection = get_connection()
         cursor = connection.cursor()
         
-        # Analyze the JSON structure to determine columns
-        # Use the first item as a template
-        sample_product = json_data[0]
-        columns = []
-        
-        # Add an auto-increment ID as primary key
-        columns.append("id INT AUTO_INCREMENT PRIMARY KEY")
-        
-        # Create columns based on JSON keys
-        for key in sample_product.keys():
-            # Sanitize column name
-            col_name = re.sub(r'[^\w]', '_', key).lower()
-            col_name = re.sub(r'_+', '_', col_name).strip('_')
-            
-            # Determine column type
-            col_type = get_mysql_type_for_field(key, sample_product[key])
-            
-            columns.append(f"{col_name} {col_type}")
-        
-        # Add metadata columns
-        columns.append("created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-        columns.append("source_file VARCHAR(255)")
+        # Infer columns and types from every product, not just the first one
+        schema = infer_catalog_schema(json_data)
+        if not schema:
+            return {
+                "success": False,
+                "error": "No product fields found in JSON data"
+            }
         
+        # Invalidate cached fetch results before the old data goes away, so a
+        # rewrite that fails after the DROP cannot leave them being served
+        invalidate_table(table_name)
+
         # Create the table (drop if exists to replace old data)
         drop_table_query = f"DROP TABLE IF EXISTS `{table_name}`"
         cursor.execute(drop_table_query)
-        
-        create_table_query = f"""
-        CREATE TABLE `{table_name}` (
-            {', '.join(columns)}
-        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-        """
-        
-        cursor.execute(create_table_query)
+        create_table_from_schema(cursor, table_name, schema)
         print(f"✅ Table '{table_name}' created successfully", file=sys.stderr)
         
-        # Insert data
-        # Prepare column names for INSERT
-        data_columns = [re.sub(r'[^\w]', '_', key).lower() for key in sample_product.keys()]
-        data_columns = [re.sub(r'_+', '_', col).strip('_') for col in data_columns]
-        
-        placeholders = ', '.join(['%s'] * (len(data_columns) + 1))  # +1 for source_file
-        columns_str = ', '.join([f"`{col}`" for col in data_columns] + ["`source_file`"])
-        
-        insert_query = f"""
-        INSERT INTO `{table_name}` ({columns_str})
-        VALUES ({placeholders})
-        """
-        
-        # Insert each product
-        inserted_count = 0
-        for product in json_data:
-            values = []
-            for key in sample_product.keys():
-                value = product.get(key)
-                
-                # Handle date fields
-                if 'date' in key.lower() and value:
-                    value = parse_date_string(value)
-                
-                # Handle empty/null values
-                if value in ['', 'null', 'None', '-']:
-                    value = None
-                
-                values.append(value)
-            
-            # Add source file
-            values.append(pdf_filename)
-            
-            try:
-                cursor.execute(insert_query, values)
-                inserted_count += 1
-            except mysql.connector.Error as err:
-                print(f"Warning: Failed to insert product: {err}", file=sys.stderr)
-                print(f"Product data: {product}", file=sys.stderr)
-                # Continue with other products
-        
+        # Normalize values column-wise, then insert in multi-row batches
+        rows = build_catalog_rows(json_data, schema, pdf_filename)
+        inserted_count = insert_catalog_rows(connection, table_name, schema, rows)
         connection.commit()
+
+        # Results cached while the table was being loaded are stale as well
+        invalidate_table(table_name)
         print(f"✅ Inserted {inserted_count} products into '{table_name}'", file=sys.stderr)
+
+        # Recompute this catalog's dashboard aggregates, match its products
+        # across catalogs, record its price changes and index it for search
+        # (imported here: catalog_analytics uses this module's parsers)
+        if refresh_derived:
+            from catalog_analytics import refresh_catalog_aggregates
+            from product_matching import refresh_product_matches
+            from price_changes import refresh_price_changes
+            from catalog_search import refresh_search_index
+            refresh_catalog_aggregates(table_name, connection)
+            refresh_product_matches(table_name, connection)
+            refresh_price_changes(table_name, connection)
+            refresh_search_index(table_name, connection)
         
         return {
             "success": True,
@@ -0,0 +1,115 @@
+"""
+Shared MySQL access for the catalog scripts.
+
+Reads the MYSQL_* environment variables and hands out connections. One-shot
+CLIs (spawned once per request by the Next.js routes) open a single plain
+connection. Long-lived processes (the upload queue workers) call
+enable_pool() to get them from a process-wide MySQLConnectionPool instead,
+so they only pay the TCP + auth handshake when the pool is first filled.
+Mirrors lib/database.ts.
+"""
+import os
+import time
+import mysql.connector
+from mysql.connector import pooling
+
+# How long a positive table-existence lookup is trusted, in seconds
+TABLE_CACHE_TTL = 60.0
+
+# Connections in the pool once enabled (MYSQL_POOL_SIZE)
+DEFAULT_POOL_SIZE = 2
+
+_pool = None
+_pool_size = 0
+_table_cache = {}
+
+def get_db_config():
+    """
+    Return the MySQL connection parameters from the environment.
+
+    Returns:
+        Dictionary of mysql.connector.connect() keyword arguments
+    """
+    return {
+        "host": os.getenv("MYSQL_HOST", "localhost"),
+        "port": int(os.getenv("MYSQL_PORT", "3306")),
+        "user": os.getenv("MYSQL_USER", "mon_user"),
+        "password": os.getenv("MYSQL_PASSWORD", "motdepasse_user"),
+        "database": os.getenv("MYSQL_DATABASE", "ma_base"),
+    }
+
+def enable_pool(size=None):
+    """
+    Serve get_connection() from a connection pool in this process. Only
+    worth it in long-lived processes: the pool opens all of its connections
+    when it is created.
+
+    Args:
+        size: Connections in the pool (default: MYSQL_POOL_SIZE, else 2)
+    """
+    global _pool_size
+    _pool_size = size or int(os.getenv("MYSQL_POOL_SIZE", str(DEFAULT_POOL_SIZE)))
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = pooling.MySQLConnectionPool(
+            pool_name="catalog",
+            pool_size=_pool_size or DEFAULT_POOL_SIZE,
+            **get_db_config()
+        )
+    return _pool
+
+def get_connection():
+    """
+    Get a connection: a plain one, or one from the pool after enable_pool().
+
+    Calling close() on a pooled connection hands it back to the pool
+    instead of closing the socket.
+    """
+    if _pool_size:
+        return get_pool().get_connection()
+    return mysql.connector.connect(**get_db_config())
+
+def table_exists(connection, table_name):
+    """
+    Check whether a table exists in the current database.
+
+    Positive answers are cached for TABLE_CACHE_TTL seconds so repeated
+    fetches of the same table skip the lookup round trip. Negative answers
+    are never cached, so tables created by another process show up at once.
+
+    Args:
+        connection: Open MySQL connection
+        table_name: Name of the table to look up
+
+    Returns:
+        True if the table exists
+    """
+    checked_at = _table_cache.get(table_name)
+    if checked_at is not None and time.monotonic() - checked_at < TABLE_CACHE_TTL:
+        return True
+
+    cursor = connection.cursor(prepared=True)
+    try:
+        cursor.execute(
+            "SELECT 1 FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = %s",
+            (table_name,)
+        )
+        exists = cursor.fetchone() is not None
+    finally:
+        cursor.close()
+
+    if exists:
+        _table_cache[table_name] = time.monotonic()
+    else:
+        _table_cache.pop(table_name, None)
+    return exists
+
+def forget_table(table_name):
+    """
+    Drop a table from the existence cache (call after DROP/CREATE TABLE).
+    """
+    _table_cache.pop(table_name, None)
@@ -0,0 +1,263 @@
+"""
+Columnar export of catalog tables for analysis.
+
+Streams rows from MySQL in chunks (unbuffered cursor, constant memory) into
+Parquet or Arrow IPC files with the table's real types: DECIMAL columns
+become decimal128 with the same precision and scale, DATE columns date32,
+TIMESTAMP columns timestamps; nothing is turned into text the way the JSON
+fetch path does. Each table is written to its own file, since every catalog
+table has its own schema (columns are inferred from its products).
+
+With --partition-by-source, a table is written as a hive-partitioned
+dataset (<table>/source_file=<pdf>/part-0.parquet, the file name
+URL-encoded), which pandas and pyarrow.dataset read back as one frame with
+the original source_file column.
+
+Requires pyarrow.
+
+Usage:
+  python export_catalog.py <table_name> [--out DIR] [--format parquet|arrow] [--partition-by-source]
+  python export_catalog.py --all [--out DIR] [--format parquet|arrow] [--partition-by-source]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from urllib.parse import quote
+import mysql.connector
+from database import get_connection, table_exists
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Rows pulled from the server and written per record batch
+EXPORT_CHUNK_SIZE = 10000
+
+FORMATS = {
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+def read_table_columns(cursor, table_name):
+    """
+    Return the columns of a table with their SQL types.
+
+    Returns:
+        List of (column name, data type, numeric precision, numeric scale)
+    """
+    cursor.execute(
+        "SELECT column_name, data_type, numeric_precision, numeric_scale FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s ORDER BY ordinal_position",
+        (table_name,),
+    )
+    return [(name, data_type.lower(), precision, scale) for name, data_type, precision, scale in cursor.fetchall()]
+
+def arrow_type(data_type, precision=None, scale=None):
+    """Arrow type for a MySQL column type."""
+    if data_type == 'decimal':
+        return pa.decimal128(int(precision or 10), int(scale or 0))
+    if data_type == 'date':
+        return pa.date32()
+    if data_type in ('datetime', 'timestamp'):
+        return pa.timestamp('s')
+    if data_type in ('tinyint', 'smallint', 'mediumint', 'int', 'integer'):
+        return pa.int32()
+    if data_type == 'bigint':
+        return pa.int64()
+    if data_type in ('float', 'double'):
+        return pa.float64()
+    return pa.string()
+
+def arrow_schema(columns):
+    """Arrow schema for the columns returned by read_table_columns."""
+    return pa.schema([pa.field(name, arrow_type(data_type, precision, scale))
+                      for name, data_type, precision, scale in columns])
+
+def rows_to_batch(rows, schema):
+    """Convert a chunk of tuple rows to a record batch (column by column)."""
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    arrays = []
+    for values, field in zip(columns, schema):
+        if pa.types.is_string(field.type):
+            values = [value if value is None or isinstance(value, str) else str(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+class BatchWriter:
+    """
+    Writes record batches to one Parquet or Arrow IPC file, or to one file
+    per source_file value when partitioning.
+    """
+
+    def __init__(self, path, schema, output_format="parquet", partition_column=None):
+        self.path = path
+        self.schema = schema
+        self.output_format = output_format
+        self.partition_column = partition_column
+        self.writers = {}
+        self.rows = 0
+
+    def _open(self, path, schema):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if self.output_format == "parquet":
+            return pq.ParquetWriter(path, schema, compression="zstd")
+        return pa.ipc.new_file(path, schema)
+
+    def _writer_for(self, key):
+        writer = self.writers.get(key)
+        if writer is None:
+            if self.partition_column is None:
+                path, schema = self.path, self.schema
+            else:
+                # Hive-style directory; the partition value lives in the path, URL-encoded
+                # like pyarrow.dataset expects, so it reads back unchanged
+                value = "__HIVE_DEFAULT_PARTITION__" if key is None else quote(str(key), safe="")
+                path = os.path.join(self.path, f"{self.partition_column}={value}",
+                                    f"part-0{FORMATS[self.output_format]}")
+                schema = self.schema.remove(self.schema.get_field_index(self.partition_column))
+            writer = self.writers[key] = self._open(path, schema)
+        return writer
+
+    def write(self, batch):
+        self.rows += batch.num_rows
+        if self.partition_column is None:
+            self._writer_for(None).write_batch(batch)
+            return
+        index = self.schema.get_field_index(self.partition_column)
+        keys = batch.column(index).to_pylist()
+        data = batch.drop_columns([self.partition_column])
+        for key in dict.fromkeys(keys):
+            part = data if len(set(keys)) == 1 else data.filter(pa.array([k == key for k in keys]))
+            self._writer_for(key).write_batch(part)
+
+    def close(self):
+        """Close every file; returns their paths."""
+        if not self.writers:
+            # Empty table: still write a file with the schema
+            self._writer_for(None)
+        for writer in self.writers.values():
+            writer.close()
+        if self.partition_column is None:
+            return [self.path]
+        return [os.path.join(root, name) for root, _, names in os.walk(self.path) for name in names]
+
+def export_table(connection, table_name, out_dir, output_format="parquet", partition_by_source=False,
+                 chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Export one catalog table.
+
+    Args:
+        connection: Open MySQL connection
+        table_name: Catalog table to export
+        out_dir: Directory for the output
+        output_format: "parquet" or "arrow"
+        partition_by_source: Write one file per source_file value
+        chunk_size: Rows fetched and written per batch
+
+    Returns:
+        Dictionary with the table name, row count, files and total bytes
+    """
+    started = time.perf_counter()
+    cursor = connection.cursor()
+    try:
+        columns = read_table_columns(cursor, table_name)
+    finally:
+        cursor.close()
+    schema = arrow_schema(columns)
+    partition_column = 'source_file' if partition_by_source and 'source_file' in schema.names else None
+    path = os.path.join(out_dir, table_name if partition_column else table_name + FORMATS[output_format])
+    if partition_column and os.path.isdir(path):
+        # Partitions of a previous export would otherwise mix with this one
+        shutil.rmtree(path)
+    writer = BatchWriter(path, schema, output_format, partition_column)
+
+    # Unbuffered cursor: rows stay on the server until fetched
+    cursor = connection.cursor(buffered=False)
+    try:
+        column_list = ", ".join(f"`{name}`" for name in schema.names)
+        cursor.execute(f"SELECT {column_list} FROM `{table_name}` ORDER BY `id`")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            writer.write(rows_to_batch(rows, schema))
+    finally:
+        cursor.close()
+        files = writer.close()
+
+    return {
+        "table_name": table_name,
+        "rows": writer.rows,
+        "files": files,
+        "bytes": sum(os.path.getsize(f) for f in files),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+def export_catalogs(table_names, out_dir, output_format="parquet", partition_by_source=False,
+                    chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Export catalog tables (all of them when table_names is None).
+
+    Returns:
+        Dictionary with success status and one entry per exported table
+    """
+    if pa is None:
+        return {"success": False, "error": "pyarrow is not installed (pip install pyarrow)"}
+    if output_format not in FORMATS:
+        return {"success": False, "error": f"Unknown output format '{output_format}'"}
+
+    connection = None
+    try:
+        connection = get_connection()
+        if table_names is None:
+            from catalog_analytics import list_catalog_tables
+            cursor = connection.cursor()
+            try:
+                table_names = sorted(list_catalog_tables(cursor))
+            finally:
+                cursor.close()
+        tables = []
+        for table_name in table_names:
+            if not table_exists(connection, table_name):
+                return {"success": False, "error": f"Table '{table_name}' does not exist"}
+            result = export_table(connection, table_name, out_dir, output_format, partition_by_source, chunk_size)
+            print(f"✅ Exported {result['rows']} rows of '{table_name}' ({result['bytes']} bytes)", file=sys.stderr)
+            tables.append(result)
+        return {"success": True, "tables": tables}
+    except mysql.connector.Error as err:
+        error_msg = f"Database error: {err}"
+        print(f"❌ {error_msg}", file=sys.stderr)
+        return {"success": False, "error": error_msg}
+    except (OSError, pa.ArrowException) as e:
+        error_msg = f"Export failed: {e}"
+        print(f"❌ {error_msg}", file=sys.stderr)
+        return {"success": False, "error": error_msg}
+    finally:
+        if connection is not None and connection.is_connected():
+            connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Export catalog tables to Parquet or Arrow IPC.")
+    parser.add_argument("table_name", nargs="?", help="catalog table to export")
+    parser.add_argument("--all", action="store_true", help="export every catalog table")
+    parser.add_argument("--out", default="export", help="output directory (default: ./export)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--partition-by-source", action="store_true",
+                        help="write one file per source PDF (hive-style source_file=... directories)")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="rows per batch")
+    args = parser.parse_args()
+    if not args.all and not args.table_name:
+        parser.error("a table name or --all is required")
+
+    result = export_catalogs(None if args.all else [args.table_name], args.out, args.format,
+                             args.partition_by_source, args.chunk_size)
+    print(json.dumps(result, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
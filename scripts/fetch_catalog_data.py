@@ -1,10 +1,14 @@
-import os
 import sys
 import json
+from functools import lru_cache
+from operator import itemgetter
 import mysql.connector
-from mysql.connector import errorcode
+from mysql.connector import errorcode, FieldType
 from decimal import Decimal
 from datetime import date, datetime
+from catalog_columns import INTERNAL_COLUMNS, original_field_name
+from database import get_connection, table_exists, forget_table
+from result_cache import get_cached, put_cached, get_table_version
 
 def decimal_date_handler(obj):
     """
@@ -16,6 +20,81 @@ def decimal_date_handler(obj):
         return obj.isoformat()
     raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
 
+# Number of rows pulled from the server per round trip in stream mode
+STREAM_CHUNK_SIZE = 1000
+
+@lru_cache(maxsize=4096)
+def _format_date(value):
+    """Format a DATE value back to DD/MM/YYYY (promo dates repeat across a catalog)."""
+    return value.strftime('%d/%m/%Y')
+
+# Per-type value converters, keyed by cursor.description type code
+_CONVERTERS = {
+    FieldType.DATE: _format_date,
+    FieldType.NEWDATE: _format_date,
+    FieldType.DECIMAL: str,
+    FieldType.NEWDECIMAL: str,
+}
+
+def build_column_plan(description):
+    """
+    Compute how to convert rows of a result set, once per query.
+
+    Internal columns (id, created_at, source_file) are skipped, column names
+    are mapped back to their original product keys (e.g., price_before_tnd ->
+    Price Before (TND)), and columns whose MySQL type needs formatting get a
+    converter (dates to DD/MM/YYYY, Decimals to strings).
+
+    Args:
+        description: cursor.description of the executed query
+
+    Returns:
+        Tuple of (value getter, output names, [(output name, converter)])
+    """
+    indices = []
+    names = []
+    conversions = []
+    for index, column in enumerate(description):
+        name, type_code = column[0], column[1]
+        if name.lower() in INTERNAL_COLUMNS:
+            continue
+        output_name = original_field_name(name)
+        indices.append(index)
+        names.append(output_name)
+        converter = _CONVERTERS.get(type_code)
+        if converter is not None:
+            conversions.append((output_name, converter))
+
+    if len(indices) == 1:
+        # itemgetter with a single index returns a bare value, not a tuple
+        only = indices[0]
+        getter = lambda row: (row[only],)
+    elif indices:
+        getter = itemgetter(*indices)
+    else:
+        getter = lambda row: ()
+
+    return getter, names, conversions
+
+def convert_row(row, plan):
+    """
+    Convert a tuple row to the product dictionary expected by the frontend.
+
+    Args:
+        row: Tuple row returned by a (non-dictionary) cursor
+        plan: Column plan from build_column_plan()
+
+    Returns:
+        Product dictionary
+    """
+    getter, names, conversions = plan
+    product = dict(zip(names, getter(row)))
+    for name, converter in conversions:
+        value = product[name]
+        if value is not None:
+            product[name] = converter(value)
+    return product
+
 def fetch_catalog_data(table_name):
     """
     Fetch all data from a catalog table.
@@ -26,29 +105,15 @@ def fetch_catalog_data(table_name):
     Returns:
         Dictionary with success status and data
     """
-    # Database connection parameters
-    host = os.getenv("MYSQL_HOST", "localhost")
-    port = int(os.getenv("MYSQL_PORT", "3306"))
-    user = os.getenv("MYSQL_USER", "mon_user")
-    password = os.getenv("MYSQL_PASSWORD", "motdepasse_user")
-    database = os.getenv("MYSQL_DATABASE", "ma_base")
-
     connection = None
     
     try:
-        # Connect to MySQL
-        connection = mysql.connector.connect(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            database=database
-        )
-        cursor = connection.cursor(dictionary=True)
+        # Get a pooled connection
+        connection = get_connection()
+        cursor = connection.cursor()
         
         # Check if table exists
-        cursor.execute("SHOW TABLES LIKE %s", (table_name,))
-        if not cursor.fetchone():
+        if not table_exists(connection, table_name):
             return {
                 "success": False,
                 "error": f"Table '{table_name}' does not exist"
@@ -61,56 +126,8 @@ def fetch_catalog_data(table_name):
         rows = cursor.fetchall()
         
         # Convert rows to the expected format
-        # Remove id, created_at, source_file columns for frontend display
-        products = []
-        for row in rows:
-            product = {}
-            for key, value in row.items():
-                # Skip internal columns
-                if key.lower() in ['id', 'created_at', 'source_file']:
-                    continue
-                
-                # Convert column names back to original format
-                # (e.g., price_before_tnd -> Price Before (TND))
-                original_key = key
-                
-                # Common conversions
-                if key == 'brand':
-                    original_key = 'Brand'
-                elif key == 'product':
-                    original_key = 'Product'
-                elif key == 'source':
-                    original_key = 'Source'
-                elif key == 'rayon':
-                    original_key = 'Rayon'
-                elif key == 'famille':
-                    original_key = 'Famille'
-                elif key == 'sous_famille':
-                    original_key = 'Sous-famille'
-                elif key == 'grammage':
-                    original_key = 'Grammage'
-                elif key == 'price_before_tnd':
-                    original_key = 'Price Before (TND)'
-                elif key == 'price_after_tnd':
-                    original_key = 'Price After (TND)'
-                elif key == 'url':
-                    original_key = 'URL'
-                elif key == 'promo_date_debut':
-                    original_key = 'promo_date_debut'
-                elif key == 'promo_date_fin':
-                    original_key = 'promo_date_fin'
-                
-                # Format dates back to DD/MM/YYYY if needed
-                if isinstance(value, date) and not isinstance(value, datetime):
-                    value = value.strftime('%d/%m/%Y')
-                
-                # Convert Decimal to string for prices
-                if isinstance(value, Decimal):
-                    value = str(value)
-                
-                product[original_key] = value
-            
-            products.append(product)
+        plan = build_column_plan(cursor.description)
+        products = [convert_row(row, plan) for row in rows]
         
         return {
             "success": True,
@@ -119,6 +136,9 @@ def fetch_catalog_data(table_name):
         }
         
     except mysql.connector.Error as err:
+        if err.errno == errorcode.ER_NO_SUCH_TABLE:
+            # Dropped since the existence check was cached
+            forget_table(table_name)
         error_msg = f"Database error: {err}"
         print(f"❌ {error_msg}", file=sys.stderr)
         return {
@@ -139,28 +159,189 @@ def fetch_catalog_data(table_name):
             cursor.close()
             connection.close()
 
+def stream_catalog_data(table_name, out=None, output_format="ndjson", chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Stream all data from a catalog table to a file object with constant memory.
+
+    Uses an unbuffered cursor and fetchmany() so that only one chunk of rows
+    is held in memory at a time, and writes each product as soon as it has
+    been converted.
+
+    In "json" format the output is always one JSON document: an error after
+    the data array was opened closes it and adds "success": false and the
+    error after the rows written so far (the later "success" key wins in
+    JSON.parse and json.loads). An "ndjson" stream that fails is simply cut
+    short; consumers must check the returned success flag (the exit status
+    of the command line).
+
+    Args:
+        table_name: Name of the table to fetch from
+        out: Writable text file object (defaults to sys.stdout)
+        output_format: "ndjson" (one product per line) or "json" (same
+            envelope as fetch_catalog_data, written incrementally)
+        chunk_size: Number of rows fetched per round trip
+
+    Returns:
+        Dictionary with success status and row count
+    """
+    if out is None:
+        out = sys.stdout
+
+    if output_format not in ("ndjson", "json"):
+        return {
+            "success": False,
+            "error": f"Unknown output format '{output_format}'"
+        }
+
+    connection = None
+    cursor = None
+    count = 0
+    envelope_open = False
+
+    def failed(error_msg):
+        result = {
+            "success": False,
+            "error": error_msg,
+            "count": count
+        }
+        if output_format == "json":
+            # Leave a parseable document that reports the failure
+            error_json = json.dumps(error_msg, ensure_ascii=False)
+            try:
+                if envelope_open:
+                    out.write(f'], "count": {count}, "success": false, "error": {error_json}}}\n')
+                else:
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+            except (OSError, ValueError):
+                # The output itself is what failed
+                pass
+        return result
+
+    try:
+        # Get a pooled connection
+        connection = get_connection()
+
+        # Check if table exists
+        if not table_exists(connection, table_name):
+            return failed(f"Table '{table_name}' does not exist")
+
+        # Unbuffered cursor: rows stay on the server until fetched
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(f"SELECT * FROM `{table_name}` ORDER BY id")
+        plan = build_column_plan(cursor.description)
+
+        if output_format == "json":
+            out.write('{"success": true, "data": [')
+            envelope_open = True
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                line = json.dumps(convert_row(row, plan), ensure_ascii=False, default=decimal_date_handler)
+                if output_format == "json":
+                    out.write(line if count == 0 else ", " + line)
+                else:
+                    out.write(line + "\n")
+                count += 1
+            out.flush()
+
+        if output_format == "json":
+            out.write(f'], "count": {count}}}\n')
+            envelope_open = False
+            out.flush()
+
+        return {
+            "success": True,
+            "count": count
+        }
+
+    except mysql.connector.Error as err:
+        if err.errno == errorcode.ER_NO_SUCH_TABLE:
+            # Dropped since the existence check was cached
+            forget_table(table_name)
+        error_msg = f"Database error: {err}"
+        print(f"❌ {error_msg}", file=sys.stderr)
+        return failed(error_msg)
+
+    except Exception as e:
+        error_msg = f"Unexpected error: {str(e)}"
+        print(f"❌ {error_msg}", file=sys.stderr)
+        return failed(error_msg)
+
+    finally:
+        if connection and connection.is_connected():
+            if cursor:
+                cursor.close()
+            connection.close()
+
+def fetch_catalog_json(table_name, use_cache=True):
+    """
+    Fetch a catalog table as serialized JSON, going through the result cache.
+
+    A cache hit returns the stored bytes without touching MySQL. Only
+    successful results are cached.
+
+    Args:
+        table_name: Name of the table to fetch from
+        use_cache: Set to False to always query MySQL
+
+    Returns:
+        Tuple of (success flag, UTF-8 encoded JSON bytes)
+    """
+    if use_cache:
+        cached = get_cached(table_name)
+        if cached is not None:
+            return True, cached
+
+    # Read the stamp before fetching so a concurrent rewrite invalidates us
+    version = get_table_version(table_name)
+    result = fetch_catalog_data(table_name)
+    payload = json.dumps(result, ensure_ascii=False, default=decimal_date_handler).encode("utf-8")
+
+    if use_cache and result["success"]:
+        put_cached(table_name, None, version, payload)
+
+    return result["success"], payload
+
 def main():
     """
     Main function to process command line arguments.
-    Expects: python fetch_catalog_data.py <table_name>
+    Expects: python fetch_catalog_data.py <table_name> [--stream [ndjson|json]] [--no-cache]
     """
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+
+    if not args or args[0].startswith("--"):
         print(json.dumps({
             "success": False,
-            "error": "Usage: python fetch_catalog_data.py <table_name>"
+            "error": "Usage: python fetch_catalog_data.py <table_name> [--stream [ndjson|json]] [--no-cache]"
         }))
         sys.exit(1)
-    
-    table_name = sys.argv[1]
-    
-    # Fetch the data
-    result = fetch_catalog_data(table_name)
+
+    table_name = args[0]
+
+    # Export mode: write rows incrementally instead of building one document
+    if "--stream" in args:
+        idx = args.index("--stream")
+        output_format = args[idx + 1] if idx + 1 < len(args) else "ndjson"
+        result = stream_catalog_data(table_name, sys.stdout, output_format)
+        if not result["success"]:
+            print(result["error"], file=sys.stderr)
+        else:
+            print(f"✅ Streamed {result['count']} products from '{table_name}'", file=sys.stderr)
+        sys.exit(0 if result["success"] else 1)
+
+    # Fetch the data (served from the result cache when the table is unchanged)
+    success, payload = fetch_catalog_json(table_name, use_cache="--no-cache" not in args)
     
     # Output result as JSON
-    print(json.dumps(result, ensure_ascii=False, default=decimal_date_handler))
+    sys.stdout.buffer.write(payload + b"\n")
+    sys.stdout.buffer.flush()
     
     # Exit with appropriate code
-    sys.exit(0 if result["success"] else 1)
+    sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,25 +1,15 @@
-import os
 import mysql.connector
 from mysql.connector import errorcode
+from database import get_db_config, get_connection
 
 def init_database():
     # Database connection parameters
-    host = os.getenv("MYSQL_HOST", "localhost")
-    port = int(os.getenv("MYSQL_PORT", "3306"))
-    user = os.getenv("MYSQL_USER", "mon_user")
-    password = os.getenv("MYSQL_PASSWORD", "motdepasse_user")
-    database = os.getenv("MYSQL_DATABASE", "ma_base")
+    database = get_db_config()["database"]
 
     connection = None
     try:
         # Connect to MySQL
-        connection = mysql.connector.connect(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            database=database
-        )
+        connection = get_connection()
         print("✅ Connected to MySQL database")
 
         cursor = connection.cursor()
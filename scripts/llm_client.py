@@ -0,0 +1,365 @@
+"""
+Shared LLM client for catalog extraction.
+
+Every extraction call in the process goes through one AsyncAzureOpenAI client,
+so its pool of keep-alive HTTPS connections is reused instead of paying a new
+TLS handshake per call. The client runs on a background event loop, which lets
+the synchronous callers (ocr.py, the batch runner, pipeline threads) share it.
+
+Requests are paced by token buckets sized from the deployment quota (requests
+and tokens per minute). Throttled (429) and transient failures are retried
+with jittered exponential backoff; a Retry-After from the server is honored
+and pauses every request, not only the one that was throttled. stream()
+yields the completion text as it arrives.
+
+Environment:
+  AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT   required
+  AZURE_OPENAI_API_VERSION
+  LLM_RPM, LLM_TPM        requests / tokens per minute (0 = no limit)
+  LLM_MAX_RETRIES         retries per request (default 6)
+  LLM_TIMEOUT_S           timeout of one attempt (default 600)
+  LLM_MAX_CONNECTIONS     size of the connection pool (default 16)
+
+For local testing, point AZURE_OPENAI_ENDPOINT at llm_stub_server.py.
+"""
+import os
+import time
+import queue
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from ocr_metrics import stage, record_event
+
+DEFAULT_API_VERSION = "2023-05-15"
+
+# Output tokens reserved against the TPM budget when max_tokens is not given
+DEFAULT_EXPECTED_OUTPUT_TOKENS = 4096
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 60.0
+# Azure enforces quotas over short windows, so buckets hold ~10s worth only
+BURST_SECONDS = 10.0
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_default_client: Optional["LLMClient"] = None
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Background event loop shared by all clients (started on first use)."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Rough prompt size: about 4 characters per token for JSON-heavy prompts."""
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4 + 4 * len(messages)
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Parse retry-after-ms / Retry-After (seconds or HTTP date) from response headers."""
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Bucket refilled continuously at per_minute / 60 per second, holding burst_s worth."""
+
+    def __init__(self, per_minute: float, burst_s: float = BURST_SECONDS):
+        self.rate = float(per_minute) / 60.0
+        self.capacity = max(1.0, self.rate * burst_s)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until amount is available (requests bigger than the bucket wait for a full one)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        # May go below zero when a request turned out bigger than estimated
+        self._refill()
+        self.level -= amount
+
+
+class RateLimiter:
+    """Paces requests against RPM and TPM budgets; lives on the client's event loop."""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> float:
+        """Wait for room for one request of about `tokens` tokens; returns the seconds waited."""
+        start = time.monotonic()
+        # The lock makes waiters go in arrival order instead of racing each refill
+        async with self._lock:
+            while True:
+                delay = max(
+                    self.paused_until - time.monotonic(),
+                    self.requests.delay_for(1) if self.requests else 0.0,
+                    self.tokens.delay_for(tokens) if self.tokens else 0.0,
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+        return time.monotonic() - start
+
+    def settle(self, estimated: int, actual: int):
+        """Correct the token budget once the real usage is known."""
+        if self.tokens and actual:
+            self.tokens.take(actual - estimated)
+
+    def pause(self, seconds: float):
+        """Hold every request for `seconds` (after a 429 with Retry-After)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class LLMClient:
+    """
+    Chat completion client with connection reuse, rate limiting and retries.
+    Use get_llm_client() for the process-wide instance configured from the
+    environment.
+    """
+
+    def __init__(
+        self,
+        api_key: str = None,
+        endpoint: str = None,
+        api_version: str = None,
+        rpm: float = None,
+        tpm: float = None,
+        max_retries: int = None,
+        timeout_s: float = None,
+        max_connections: int = None
+    ):
+        self.api_key = api_key or os.getenv("AZURE_OPENAI_API_KEY")
+        self.endpoint = endpoint or os.getenv("AZURE_OPENAI_ENDPOINT")
+        missing = [name for name, value in (("AZURE_OPENAI_API_KEY", self.api_key),
+                                            ("AZURE_OPENAI_ENDPOINT", self.endpoint)) if not value]
+        if missing:
+            raise RuntimeError(f"LLM client not configured: set {' and '.join(missing)}")
+        self.api_version = api_version or os.getenv("AZURE_OPENAI_API_VERSION", DEFAULT_API_VERSION)
+        self.rpm = float(os.getenv("LLM_RPM", "0")) if rpm is None else rpm
+        self.tpm = float(os.getenv("LLM_TPM", "0")) if tpm is None else tpm
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "6")) if max_retries is None else max_retries
+        self.timeout_s = float(os.getenv("LLM_TIMEOUT_S", "600")) if timeout_s is None else timeout_s
+        self.max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "16")) if max_connections is None else max_connections
+        self.loop = _get_loop()
+        self._client = None
+        self._limiter = None
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "requests": 0, "attempts": 0, "retries": 0, "throttled": 0, "failures": 0,
+            "rate_limit_wait_s": 0.0, "latency_s": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+        }
+
+    def _setup(self):
+        # Runs on the loop: the HTTP client and limiter belong to it
+        if self._client is None:
+            import httpx
+            from openai import AsyncAzureOpenAI
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.timeout_s, connect=10.0),
+            )
+            self._client = AsyncAzureOpenAI(
+                api_key=self.api_key, azure_endpoint=self.endpoint, api_version=self.api_version,
+                max_retries=0, http_client=http_client,
+            )
+            self._limiter = RateLimiter(self.rpm, self.tpm)
+
+    def _add_stats(self, **amounts):
+        with self._stats_lock:
+            for key, value in amounts.items():
+                self.stats[key] += value
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counters since the client was created."""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["rate_limit_wait_s"] = round(stats["rate_limit_wait_s"], 3)
+        stats["latency_s"] = round(stats["latency_s"], 3)
+        return stats
+
+    async def _request(self, messages: List[Dict[str, Any]], model: str, estimate: int, **kwargs):
+        """Send one request, retrying throttled and transient failures; returns the response."""
+        import openai
+        self._setup()
+        self._add_stats(requests=1)
+        attempt = 0
+        while True:
+            waited = await self._limiter.acquire(estimate)
+            start = time.perf_counter()
+            status = None
+            retry_after = None
+            try:
+                resp = await self._client.chat.completions.create(model=model, messages=messages, **kwargs)
+            except openai.APIStatusError as e:
+                status = e.status_code
+                retry_after = retry_after_seconds(e.response.headers)
+                error = e
+            except openai.APIConnectionError as e:
+                status = "connection_error"
+                error = e
+            latency = time.perf_counter() - start
+            self._add_stats(attempts=1, rate_limit_wait_s=waited, latency_s=latency)
+            record_event("llm_attempt", model=model, attempt=attempt + 1, status=status or 200,
+                         latency_s=round(latency, 3), rate_limit_wait_s=round(waited, 3))
+            if status is None:
+                return resp
+
+            retryable = status == "connection_error" or status in RETRY_STATUS_CODES
+            if not retryable or attempt >= self.max_retries:
+                self._add_stats(failures=1)
+                raise error
+            if retry_after is not None:
+                # Small jitter so throttled callers do not come back in lockstep
+                delay = retry_after + random.uniform(0, 0.1 * retry_after + 0.05)
+            else:
+                delay = random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+            if status == 429:
+                self._add_stats(throttled=1)
+                self._limiter.pause(delay)
+            self._add_stats(retries=1)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _complete(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> str:
+        estimate = estimate_tokens(messages) + (kwargs.get("max_tokens") or DEFAULT_EXPECTED_OUTPUT_TOKENS)
+        resp = await self._request(messages, model, estimate, **kwargs)
+        usage = getattr(resp, "usage", None)
+        if usage is not None:
+            self._limiter.settle(estimate, usage.total_tokens or 0)
+            self._add_stats(prompt_tokens=usage.prompt_tokens or 0,
+                            completion_tokens=usage.completion_tokens or 0)
+        return resp.choices[0].message.content
+
+    async def _stream(self, messages: List[Dict[str, Any]], model: str, **kwargs):
+        # Only the request itself is retried: once text has been handed out,
+        # starting over would duplicate it
+        estimate = estimate_tokens(messages) + (kwargs.get("max_tokens") or DEFAULT_EXPECTED_OUTPUT_TOKENS)
+        # The last chunk then carries the usage, to settle the TPM budget like complete()
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        resp = await self._request(messages, model, estimate, stream=True, **kwargs)
+        usage = None
+        received = 0
+        try:
+            async for chunk in resp:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    received += len(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            if usage is not None:
+                self._limiter.settle(estimate, usage.total_tokens or 0)
+                self._add_stats(prompt_tokens=usage.prompt_tokens or 0,
+                                completion_tokens=usage.completion_tokens or 0)
+            else:
+                # Cut off before the usage chunk: settle on what was sent and received
+                self._limiter.settle(estimate, estimate_tokens(messages) + received // 4)
+
+    async def acomplete(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> str:
+        """Async chat completion; safe to await from any event loop."""
+        future = asyncio.run_coroutine_threadsafe(self._complete(messages, model, **kwargs), self.loop)
+        return await asyncio.wrap_future(future)
+
+    def complete(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> str:
+        """
+        Blocking chat completion, usable from any thread.
+
+        Args:
+            messages: Chat messages
+            model: Deployment name
+            **kwargs: Passed to chat.completions.create (temperature, max_tokens, ...)
+
+        Returns:
+            The assistant message text
+        """
+        with stage("llm_request", model=model):
+            return asyncio.run_coroutine_threadsafe(self._complete(messages, model, **kwargs), self.loop).result()
+
+    def stream(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> Iterator[str]:
+        """
+        Blocking streaming chat completion, usable from any thread.
+        Same arguments as complete(); yields the assistant text as it arrives.
+        """
+        pieces: "queue.Queue" = queue.Queue()
+
+        async def pump():
+            try:
+                async for piece in self._stream(messages, model, **kwargs):
+                    pieces.put(("text", piece))
+            except BaseException as e:
+                pieces.put(("error", e))
+                if not isinstance(e, Exception):
+                    raise
+            else:
+                pieces.put(("done", None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                kind, value = pieces.get()
+                if kind == "text":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            # The caller stopped early: stop reading the response
+            future.cancel()
+
+
+def get_llm_client() -> LLMClient:
+    """The process-wide client, configured from the environment."""
+    global _default_client
+    with _loop_lock:
+        client = _default_client
+    if client is None:
+        client = LLMClient()
+        with _loop_lock:
+            if _default_client is None:
+                _default_client = client
+            client = _default_client
+    return client
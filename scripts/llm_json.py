@@ -0,0 +1,136 @@
+"""
+Incremental parsing of the product array returned by the LLM.
+
+ProductArrayParser is fed the completion text piece by piece (as it streams
+in) and hands out each object of the top-level JSON array as soon as its
+closing brace arrives. A malformed object is repaired when the fault is a
+known one (unquoted dates as in the prompt examples, trailing commas) and
+skipped otherwise, without losing the objects around it; a truncated tail
+only loses the object it cuts off.
+"""
+import re
+import json
+from typing import Any, Dict, List
+
+# "promo_date_debut": 13/08/2025, -- the prompt's own examples leave dates unquoted
+_BARE_DATE = re.compile(r'(:\s*)(\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4})(\s*[,}\]])')
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+# Objects are never this long; past it, assume a quote went missing
+MAX_OBJECT_CHARS = 20000
+
+
+def repair_object(text: str) -> str:
+    """Fix the malformations LLMs commonly produce in an object's JSON text."""
+    text = _BARE_DATE.sub(r'\1"\2"\3', text)
+    return _TRAILING_COMMA.sub(r'\1', text)
+
+
+class ProductArrayParser:
+    """
+    Streaming parser for a JSON array of objects.
+
+    Text before the opening bracket (prose, a ```json fence) is ignored, and
+    so is a bracketed aside in that prose ("[the]"): an array whose first
+    item is not an object makes the parser look for the next bracket.
+    feed() returns the objects completed by each piece of text; finish()
+    reports what was repaired, skipped or cut off, and whether text
+    followed the array.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.trailing = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.current: List[str] = []
+        self.count = 0
+        self.repaired = 0
+        self.malformed: List[str] = []
+
+    def _close_object(self, out: List[Dict[str, Any]]):
+        text = "".join(self.current)
+        self.current = []
+        try:
+            value = json.loads(text)
+        except ValueError:
+            try:
+                value = json.loads(repair_object(text))
+                self.repaired += 1
+            except ValueError:
+                self.malformed.append(text[:200])
+                return
+        if isinstance(value, dict):
+            self.count += 1
+            out.append(value)
+
+    def _drop_object(self):
+        self.malformed.append("".join(self.current)[:200])
+        self.current = []
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Consume the next piece of text; return the objects it completed."""
+        out: List[Dict[str, Any]] = []
+        for ch in text:
+            if self.finished:
+                if not ch.isspace():
+                    self.trailing = True
+                    break
+                continue
+            if not self.started:
+                self.started = ch == "["
+                continue
+            if self.depth == 0:
+                if ch == "{":
+                    self.depth = 1
+                    self.current = ["{"]
+                elif ch == "]":
+                    self.finished = True
+                elif not (ch.isspace() or ch == ",") and not self.count and not self.malformed:
+                    # Not an array of objects: a bracket in the prose before the answer
+                    self.started = False
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                elif ch == "\n":
+                    # JSON strings cannot contain raw newlines: a quote is
+                    # missing. Drop this object and resync on the next one.
+                    self._drop_object()
+                    continue
+                self.current.append(ch)
+                continue
+
+            self.current.append(ch)
+            if ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self._close_object(out)
+            if len(self.current) > MAX_OBJECT_CHARS:
+                self._drop_object()
+        return out
+
+    def finish(self) -> Dict[str, Any]:
+        """Summary once the text is complete."""
+        return {
+            "products": self.count,
+            "repaired": self.repaired,
+            "malformed": len(self.malformed),
+            "truncated": self.started and not self.finished,
+            "trailing_text": self.trailing,
+        }
+
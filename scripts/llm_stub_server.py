@@ -0,0 +1,197 @@
+"""
+Local stand-in for the Azure OpenAI chat completions endpoint.
+
+Answers every POST .../chat/completions with a product array after an
+optional delay (streamed as server-sent events when the request asks for
+it), and simulates throttling: requests over --rpm in the last minute, or
+every --throttle-every'th request, get a 429 with Retry-After. --malformed
+answers with an unquoted date, a broken object and a cut-off tail;
+--drop-stream closes the connection halfway through a streamed answer. Used to
+exercise llm_client.py and llm_json.py without a real deployment.
+
+Usage:
+  python llm_stub_server.py [--port 8089] [--rpm N] [--throttle-every N]
+                            [--retry-after S] [--latency-ms MS]
+                            [--products N] [--malformed] [--drop-stream]
+  AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8089 python ocr.py catalog.pdf
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_PRODUCT = {"Brand": "STUB", "Product": "Produit de test", "Rayon": None, "Famille": None, "Sous-famille": None,
+                "Grammage": None, "Price Before (TND)": "2,500", "Price After (TND)": "1,990", "URL": None,
+                "promo_date_debut": None, "promo_date_fin": None}
+
+
+def stub_answer(products: int = 1, malformed: bool = False) -> str:
+    """The assistant text: a JSON array of products, optionally damaged."""
+    items = [json.dumps(dict(STUB_PRODUCT, Product=f"Produit de test {i+1}"), ensure_ascii=False)
+             for i in range(products)]
+    if not malformed:
+        return "[\n" + ",\n".join(items) + "\n]"
+    damaged = items + [
+        '{"Brand": "STUB", "Product": "Date sans guillemets", "promo_date_debut": 13/08/2025}',
+        '{"Brand": "STUB, "Product": "Guillemet manquant"}',
+        '{"Brand": "STUB", "Product": "Coupé',
+    ]
+    return "[\n" + ",\n".join(damaged)
+
+
+class StubState:
+    def __init__(self, rpm: int = 0, throttle_every: int = 0, retry_after: float = 1.0, latency_ms: float = 0,
+                 products: int = 1, malformed: bool = False, drop_stream: bool = False):
+        self.products = products
+        self.malformed = malformed
+        self.drop_stream = drop_stream
+        self.rpm = rpm
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.latency_s = latency_ms / 1000.0
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.requests = 0
+        self.throttled = 0
+        self.connections = set()
+
+    def admit(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            over_rpm = self.rpm and len(self.recent) >= self.rpm
+            forced = self.throttle_every and self.requests % self.throttle_every == 0
+            if over_rpm or forced:
+                self.throttled += 1
+                return False
+            self.recent.append(now)
+            return True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        state = self.server.state
+        with state.lock:
+            state.connections.add(self.client_address)
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.split("?")[0].endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        if not state.admit():
+            self._send_json(429, {"error": {"code": "429", "message": "Rate limit exceeded (stub)"}},
+                            {"Retry-After": f"{state.retry_after:g}"})
+            return
+        if state.latency_s:
+            time.sleep(state.latency_s)
+        content = stub_answer(state.products, state.malformed)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4
+        if request.get("stream"):
+            usage = (request.get("stream_options") or {}).get("include_usage")
+            self._send_stream(request.get("model", "stub"), content, prompt_tokens if usage else None)
+            return
+        self._send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                      "total_tokens": prompt_tokens + len(content) // 4},
+        })
+
+    def _send_stream(self, model: str, content: str, prompt_tokens: int = None, piece_size: int = 16):
+        events = []
+        for i in range(0, len(content), piece_size):
+            events.append({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                           "model": model, "choices": [{"index": 0, "finish_reason": None,
+                                                        "delta": {"content": content[i:i + piece_size]}}]})
+        events.append({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": [{"index": 0, "finish_reason": "stop", "delta": {}}]})
+        if prompt_tokens is not None:
+            # stream_options={"include_usage": true}: a last chunk with the usage and no choices
+            events.append({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                           "model": model, "choices": [],
+                           "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                                     "total_tokens": prompt_tokens + len(content) // 4}})
+        chunks = [f"data: {json.dumps(event)}\n\n".encode("utf-8") for event in events] + [b"data: [DONE]\n\n"]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(sum(len(chunk) for chunk in chunks)))
+        self.end_headers()
+        if self.server.state.drop_stream:
+            chunks = chunks[:len(chunks) // 2]
+            self.close_connection = True
+        for chunk in chunks:
+            self.wfile.write(chunk)
+            self.wfile.flush()
+            if self.server.state.latency_s:
+                # Spread the answer over time like a model generating tokens
+                time.sleep(self.server.state.latency_s / len(chunks))
+
+
+def start_stub_server(port: int = 0, **options) -> ThreadingHTTPServer:
+    """
+    Start the stub in a background thread.
+
+    Args:
+        port: Port to listen on (0 picks a free one; see server.server_port)
+        **options: rpm, throttle_every, retry_after, latency_ms, products,
+            malformed, drop_stream (see StubState)
+
+    Returns:
+        The running server; its .state holds request counters. Call
+        shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Azure OpenAI endpoint that simulates throttling.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--rpm", type=int, default=0, help="answer 429 above this many requests per minute")
+    parser.add_argument("--throttle-every", type=int, default=0, help="answer 429 to every Nth request")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay before each answer")
+    parser.add_argument("--products", type=int, default=1, help="products in each answer")
+    parser.add_argument("--malformed", action="store_true", help="damage the answer like a sloppy model would")
+    parser.add_argument("--drop-stream", action="store_true", help="cut streamed answers off halfway")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.port, rpm=args.rpm, throttle_every=args.throttle_every,
+                               retry_after=args.retry_after, latency_ms=args.latency_ms,
+                               products=args.products, malformed=args.malformed, drop_stream=args.drop_stream)
+    print(f"Stub LLM endpoint on http://127.0.0.1:{server.server_port}", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,58 +9,77 @@ Dependencies:
   pip install PyMuPDF opencv-python-headless numpy pillow pytesseract pandas openai paddleocr paddlepaddle
   (paddleocr optional; if missing we fallback to pytesseract)
   Install system Tesseract binary for pytesseract.
-Set OPENAI_API_KEY env var to enable LLM step.
+Set AZURE_OPENAI_API_KEY / AZURE_OPENAI_ENDPOINT for the LLM step (see llm_client.py).
 """
 import os
 import sys
 import json
 import re
+import time
 import argparse
-from typing import List, Dict, Any, Tuple
+import importlib.util
+import multiprocessing
+from typing import Callable, List, Dict, Any, Tuple, Union
 import numpy as np
 import fitz
-import cv2
-
-# pytesseract (fallback)
-_have_tesseract = True
-try:
-    import pytesseract
-except Exception:
-    _have_tesseract = False
-
-
-try:
-    from paddleocr import PaddleOCR  # will raise if paddleocr/paddlepaddle missing
-    _have_paddle = True
-except Exception as _paddle_e:
-    # import failed — print reason and fall back to basic OCR
-    import sys
-    print(f"PaddleOCR not available: {_paddle_e}. Falling back to basic OCR.", file=sys.stderr)
-    _have_paddle = False
+from ocr_metrics import (
+    stage, record_event, record_fallback, enable_metrics, metrics_enabled, get_metrics,
+    merge_records, write_chrome_trace,
+)
+from ocr_jobs import open_job, load_page_checkpoint, save_page_checkpoint, load_checkpoint, save_checkpoint
+from page_dedup import PageFingerprint, open_page_index, config_variant, is_reusable
+from page_language import detect_page_language, configured_language, tesseract_lang, paddle_lang
+from llm_json import ProductArrayParser
+from upload_archive import archive_enabled, archive_upload
+
+# OCR backends (cv2, pytesseract, paddleocr) are imported on first use, not here:
+# paddle alone costs seconds per process and the spatial path never needs it.
+# find_spec only checks that the package is installed, without importing it.
+_have_tesseract = importlib.util.find_spec("pytesseract") is not None
+_have_paddle = importlib.util.find_spec("paddleocr") is not None
+_PaddleOCR = None
+
+
+def load_paddle_ocr_class():
+    """Import PaddleOCR on first use; returns the class or None if unavailable."""
+    global _PaddleOCR, _have_paddle
+    if _PaddleOCR is None and _have_paddle:
+        try:
+            from paddleocr import PaddleOCR  # will raise if paddleocr/paddlepaddle missing
+            _PaddleOCR = PaddleOCR
+        except Exception as _paddle_e:
+            # import failed — print reason and fall back to basic OCR
+            print(f"PaddleOCR not available: {_paddle_e}. Falling back to basic OCR.", file=sys.stderr)
+            _have_paddle = False
+    return _PaddleOCR
 
 
 # ----- Paddle instance cache (copied logic) -----
+# One warm instance per language: pages are OCRed with the model of their
+# detected language (see page_language)
 _PADDLE_INSTANCES: Dict[str, Any] = {}
 def get_paddle_ocr(lang: str = "en", **kwargs):
     """
-    Return a cached PaddleOCR instance.
-    The cache key is generated from the language and all other provided keyword arguments,
-    ensuring that a unique instance is created for each unique configuration.
+    Return the cached PaddleOCR instance for a language.
+    The cache holds at most one instance per language. It is reused while the
+    other keyword arguments stay the same; a call with different options
+    replaces that language's instance instead of adding a second one.
     """
-    if not _have_paddle:
+    PaddleOCR = load_paddle_ocr_class()
+    if PaddleOCR is None:
         raise RuntimeError("PaddleOCR not installed (pip install paddleocr)")
 
-    # Create a stable cache key from all configuration options
-    # We sort the items to ensure that the key is consistent regardless of argument order
-    config_items = sorted(kwargs.items())
-    cache_key = (lang,) + tuple(config_items)
+    # Options of the cached instance, sorted so argument order does not matter
+    config_items = tuple(sorted(kwargs.items()))
 
-    if cache_key not in _PADDLE_INSTANCES:
-        print(f"Initializing new PaddleOCR instance for lang='{lang}' with config: {kwargs}")
+    cached = _PADDLE_INSTANCES.get(lang)
+    if cached is None or cached[0] != config_items:
+        # stderr: stdout carries the JSON result
+        print(f"Initializing new PaddleOCR instance for lang='{lang}' with config: {kwargs}", file=sys.stderr)
         # Pass all the keyword arguments directly to the constructor
-        _PADDLE_INSTANCES[cache_key] = PaddleOCR(lang=lang, **kwargs)
+        _PADDLE_INSTANCES[lang] = (config_items, PaddleOCR(lang=lang, **kwargs))
 
-    return _PADDLE_INSTANCES[cache_key]
+    return _PADDLE_INSTANCES[lang][1]
 
 
 # ----- grouping and product-extraction helpers (copied/adapted) -----
@@ -173,21 +192,27 @@ def extract_with_paddle(page, language: str, dpi: int, paddle_options: dict) ->
     """PaddleOCR-based extraction with simple preprocessing & layout grouping."""
     if not _have_paddle:
         raise RuntimeError("PaddleOCR not available; install paddleocr or choose another method.")
+    import cv2
 
-    pix = page.get_pixmap(dpi=dpi)
-    img_data = pix.tobytes("png")
-    nparr = np.frombuffer(img_data, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    page_no = page.number + 1
+    with stage("render", page=page_no, backend="paddle_ocr"):
+        pix = page.get_pixmap(dpi=dpi)
+        img_data = pix.tobytes("png")
+        nparr = np.frombuffer(img_data, np.uint8)
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
     # Preprocess: denoise -> grayscale -> back to RGB for Paddle
-    gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
-    denoised = cv2.fastNlMeansDenoising(gray, h=8)
-    enhanced = cv2.cvtColor(denoised, cv2.COLOR_GRAY2RGB)
+    with stage("preprocess", page=page_no, backend="paddle_ocr"):
+        gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+        denoised = cv2.fastNlMeansDenoising(gray, h=8)
+        enhanced = cv2.cvtColor(denoised, cv2.COLOR_GRAY2RGB)
 
-    ocr = get_paddle_ocr(language, **paddle_options)
+    with stage("model_load", page=page_no, backend="paddle_ocr"):
+        ocr = get_paddle_ocr(paddle_lang(language), **paddle_options)
     # paddleocr's ocr method returns nested lists; call synchronously
-    ocr_result = ocr.ocr(enhanced, cls=True)
+    with stage("ocr", page=page_no, backend="paddle_ocr"):
+        ocr_result = ocr.ocr(enhanced, cls=True)
 
     text_blocks = []
     if ocr_result and ocr_result[0]:
@@ -209,7 +234,8 @@ def extract_with_paddle(page, language: str, dpi: int, paddle_options: dict) ->
                     "center_y": int((y1 + y2) / 2),
                     "center_x": int((x1 + x2) / 2)
                 })
-    structured = group_text_blocks_into_products_improved(text_blocks, img_rgb.shape)
+    with stage("group", page=page_no, backend="paddle_ocr"):
+        structured = group_text_blocks_into_products_improved(text_blocks, img_rgb.shape)
     return {
         "method": "paddle_ocr",
         "text_blocks": text_blocks,
@@ -222,7 +248,9 @@ def extract_with_paddle(page, language: str, dpi: int, paddle_options: dict) ->
 
 def extract_with_spatial_pymupdf(page, language: str, dpi: int) -> Dict[str, Any]:
     """PyMuPDF's spatial extraction; fallback to enhanced Tesseract if few blocks found."""
-    page_dict = page.get_text("dict")
+    page_no = page.number + 1
+    with stage("text_extract", page=page_no, backend="spatial_pymupdf"):
+        page_dict = page.get_text("dict")
     structured_blocks = []
     for block in page_dict.get("blocks", []):
         if block.get("type") != 0:
@@ -245,9 +273,11 @@ def extract_with_spatial_pymupdf(page, language: str, dpi: int) -> Dict[str, Any
             })
     if len(structured_blocks) < 5:
         # fallback to enhanced tesseract if spatial poor
+        record_fallback(page_no, "spatial_pymupdf", "tesseract_enhanced", f"only {len(structured_blocks)} text blocks")
         return extract_with_enhanced_tesseract(page, language, dpi)
     page_rect = page.rect
-    structured = group_text_blocks_into_products_improved(structured_blocks, (int(page_rect.height), int(page_rect.width)))
+    with stage("group", page=page_no, backend="spatial_pymupdf"):
+        structured = group_text_blocks_into_products_improved(structured_blocks, (int(page_rect.height), int(page_rect.width)))
     return {
         "method": "spatial_pymupdf",
         "text_blocks": structured_blocks,
@@ -260,24 +290,24 @@ def extract_with_spatial_pymupdf(page, language: str, dpi: int) -> Dict[str, Any
 
 def extract_with_enhanced_tesseract(page, language: str, dpi: int) -> Dict[str, Any]:
     """Enhanced Tesseract that outputs word-level boxes and groups them."""
-    pix = page.get_pixmap(dpi=dpi)
-    img_data = pix.tobytes("png")
-    nparr = np.frombuffer(img_data, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-    tess_lang = language
-    if language == "en":
-        tess_lang = "eng"
-    elif language == "fr":
-        tess_lang = "fra"
-    elif language == "ar":
-        tess_lang = "ara"
+    import cv2
+    import pytesseract
+    page_no = page.number + 1
+    with stage("render", page=page_no, backend="tesseract_enhanced"):
+        pix = page.get_pixmap(dpi=dpi)
+        img_data = pix.tobytes("png")
+        nparr = np.frombuffer(img_data, np.uint8)
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+    with stage("preprocess", page=page_no, backend="tesseract_enhanced"):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    tess_lang = tesseract_lang(language)
 
     try:
-        df = pytesseract.image_to_data(binary, lang=tess_lang, output_type=pytesseract.Output.DATAFRAME)
+        with stage("ocr", page=page_no, backend="tesseract_enhanced"):
+            df = pytesseract.image_to_data(binary, lang=tess_lang, output_type=pytesseract.Output.DATAFRAME)
         df = df[df.conf > 30]
         df = df[df.text.notna()]
         df = df[df.text.str.strip() != ""]
@@ -290,7 +320,8 @@ def extract_with_enhanced_tesseract(page, language: str, dpi: int) -> Dict[str,
                 "center_x": int(row['left'] + row['width'] / 2),
                 "center_y": int(row['top'] + row['height'] / 2)
             })
-        structured = group_text_blocks_into_products_improved(text_blocks, img.shape)
+        with stage("group", page=page_no, backend="tesseract_enhanced"):
+            structured = group_text_blocks_into_products_improved(text_blocks, img.shape)
         return {
             "method": "tesseract_enhanced",
             "text_blocks": text_blocks,
@@ -302,21 +333,26 @@ def extract_with_enhanced_tesseract(page, language: str, dpi: int) -> Dict[str,
     except Exception as e:
         # on failure, fallback to basic OCR
         print(f"Enhanced Tesseract failed: {e}. Falling back to basic OCR.", file=sys.stderr)
+        record_fallback(page_no, "tesseract_enhanced", "tesseract_basic", str(e))
         return extract_with_basic_ocr(page, language, dpi)
 
 
 def extract_with_basic_ocr(page, language: str, dpi: int) -> Dict[str, Any]:
     """Simple fallback that returns plain text for the page (no blocks)."""
-    pix = page.get_pixmap(dpi=dpi)
-    img_data = pix.tobytes("png")
-    nparr = np.frombuffer(img_data, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    tess_lang = language
-    if language == "en":
-        tess_lang = "eng"
-    elif language == "fr":
-        tess_lang = "fra"
-    text = pytesseract.image_to_string(img, lang=tess_lang) if _have_tesseract else ""
+    import cv2
+    page_no = page.number + 1
+    with stage("render", page=page_no, backend="tesseract_basic"):
+        pix = page.get_pixmap(dpi=dpi)
+        img_data = pix.tobytes("png")
+        nparr = np.frombuffer(img_data, np.uint8)
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    tess_lang = tesseract_lang(language)
+    with stage("ocr", page=page_no, backend="tesseract_basic"):
+        if _have_tesseract:
+            import pytesseract
+            text = pytesseract.image_to_string(img, lang=tess_lang)
+        else:
+            text = ""
     return {
         "method": "tesseract_basic",
         "text_blocks": [],
@@ -328,43 +364,40 @@ def extract_with_basic_ocr(page, language: str, dpi: int) -> Dict[str, Any]:
 
 
 # ----- main perform_ocr_on_pdf_enhanced (synchronous wrapper) -----
-def perform_ocr_on_pdf_enhanced(
-    file_path: str,
-    language: str = "en",
-    method: str = "paddle",
-    dpi: int = 400,
-    paddle_options: dict = None
-) -> Dict[str, Any]:
+def ocr_page(page, language: str, method: str, dpi: int, paddle_options: dict) -> Dict[str, Any]:
     """
-    Main entry: similar behavior to server_ocr2.perform_ocr_on_pdf_enhanced but synchronous.
-    Accepts method in {"paddle","spatial","hybrid","tesseract"} and custom paddle_options.
+    OCR a single PyMuPDF page with the given method, falling back to cheaper
+    methods on failure. Shared by perform_ocr_on_pdf_enhanced and the batch runner.
+    With language "auto", the page's language is detected first (see page_language).
     """
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File not found: {file_path}")
-
-    # Ensure paddle_options is a dictionary
-    if paddle_options is None:
-        paddle_options = {}
-
-    doc = fitz.open(file_path)
-    results = {}
-    for page_num in range(len(doc)):
-        page = doc[page_num]
+    page_num = page.number
+    # Set when a failure forced a cheaper method; such pages are redone on resume
+    degraded = None
+    with stage("page", page=page_num + 1, method=method) as page_info:
+        if language == "auto":
+            with stage("detect_language", page=page_num + 1):
+                language = detect_page_language(page)
         try:
             if method == "paddle" and _have_paddle:
                 try:
                     page_result = extract_with_paddle(page, language, dpi, paddle_options)
                 except Exception as e:
                     print(f"Paddle failed on page {page_num+1}: {e}. Falling back to spatial.", file=sys.stderr)
+                    record_fallback(page_num + 1, "paddle_ocr", "spatial_pymupdf", str(e))
+                    degraded = {"from": method, "to": "spatial", "reason": f"paddle failed: {e}"}
                     page_result = extract_with_spatial_pymupdf(page, language, dpi)
             elif method == "spatial":
                 page_result = extract_with_spatial_pymupdf(page, language, dpi)
+            elif method == "basic":
+                page_result = extract_with_basic_ocr(page, language, dpi)
             elif method == "hybrid":
                 spatial_result = extract_with_spatial_pymupdf(page, language, dpi)
                 if len(spatial_result.get("text", "").strip()) < 100 and _have_paddle:
                     try:
                         page_result = extract_with_paddle(page, language, dpi, paddle_options)
-                    except Exception:
+                    except Exception as e:
+                        record_fallback(page_num + 1, "paddle_ocr", spatial_result["method"], str(e))
+                        degraded = {"from": method, "to": "spatial", "reason": f"paddle failed: {e}"}
                         page_result = spatial_result
                 else:
                     page_result = spatial_result
@@ -372,28 +405,300 @@ def perform_ocr_on_pdf_enhanced(
                 # tesseract fallback
                 page_result = extract_with_enhanced_tesseract(page, language, dpi)
         except Exception as e:
+            if method == "basic":
+                raise
             # ensure at least basic OCR
             print(f"Page {page_num+1} processing error: {e}. Using basic OCR.", file=sys.stderr)
+            record_fallback(page_num + 1, method, "tesseract_basic", str(e))
+            degraded = {"from": method, "to": "basic", "reason": str(e)}
             page_result = extract_with_basic_ocr(page, language, dpi)
-        results[f"page_{page_num+1}"] = page_result
-    doc.close()
-    return {"pdf_path": os.path.abspath(file_path), "num_pages": len(results), "pages": results}
+        if degraded is not None:
+            page_result["degraded"] = degraded
+        page_info["backend"] = page_result.get("method")
+        page_info["language"] = page_result["language"] = language
+    return page_result
+
+
+# ----- per-page and per-document time budgets -----
+# Paddle inference, Tesseract and rendering a huge image cannot be interrupted
+# from Python, so budgeted pages are OCRed in a child process that is killed
+# when a page overruns; the page is then retried with a cheaper method.
+# A budget of 0 disables it (both 0: OCR in-process, as before).
+PAGE_BUDGET_S = float(os.getenv("OCR_PAGE_BUDGET_S", "60"))
+DOC_BUDGET_S = float(os.getenv("OCR_DOC_BUDGET_S", "240"))
+# Budget of each cheaper retry after an overrun
+DEGRADED_PAGE_BUDGET_S = float(os.getenv("OCR_DEGRADED_PAGE_BUDGET_S", "20"))
+
+DEGRADE_TO = {"paddle": "spatial", "hybrid": "spatial", "spatial": "basic", "tesseract": "basic"}
+
+
+class PageAborted(Exception):
+    """A page overran its time budget or crashed its worker."""
+
+
+def _page_worker_main(conn, pdf: Union[str, bytes], language: str, dpi: int, paddle_options: dict, with_metrics: bool):
+    """Child process: OCR the requested pages until told to stop."""
+    doc = open_pdf(pdf) if pdf is not None else None
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            page_num, method, switch_to = request
+            recorder = enable_metrics() if with_metrics else None
+            try:
+                if switch_to is not None:
+                    if doc is not None:
+                        doc.close()
+                    doc = open_pdf(switch_to)
+                reply = ("ok", ocr_page(doc[page_num], language, method, dpi, paddle_options))
+            except Exception as e:
+                reply = ("error", str(e))
+            records = (recorder.started, recorder.stages, recorder.events) if recorder else None
+            conn.send(reply + (records,))
+    finally:
+        if doc is not None:
+            doc.close()
+
+
+class PageWorker:
+    """Runs pages of a PDF in a child process, killing it on overrun."""
+
+    def __init__(self, pdf: Union[str, bytes, None], language: str, dpi: int, paddle_options: dict):
+        self.pdf = pdf
+        self.args = (language, dpi, paddle_options)
+        self.process = None
+        self.conn = None
+        self._switch = False
+
+    def _start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_page_worker_main, args=(child_conn, self.pdf) + self.args + (metrics_enabled(),), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self._switch = False
+
+    def use(self, pdf: Union[str, bytes]):
+        """Take the following pages from another PDF; the child keeps its loaded models."""
+        if pdf != self.pdf:
+            self.pdf = pdf
+            self._switch = True
+
+    def run(self, page_num: int, method: str, budget_s: float = None) -> Dict[str, Any]:
+        """OCR one page; raises PageAborted if it takes longer than budget_s."""
+        if self.process is None:
+            self._start()
+        self.conn.send((page_num, method, self.pdf if self._switch else None))
+        self._switch = False
+        if not self.conn.poll(budget_s):
+            self.kill()
+            raise PageAborted(f"exceeded its {budget_s:g}s budget")
+        try:
+            status, payload, records = self.conn.recv()
+        except EOFError:
+            self.kill()
+            raise PageAborted("crashed the OCR worker")
+        if records:
+            merge_records(*records)
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.conn.close()
+            self.process = None
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.conn.send(None)
+                self.process.join(timeout=5)
+            except (OSError, ValueError):
+                pass
+            self.kill()
+
+
+def _skipped_page(page, reason: str) -> Dict[str, Any]:
+    # "error" makes a resumed job (ocr_jobs) try the page again
+    return {
+        "method": "skipped",
+        "error": reason,
+        "text_blocks": [],
+        "structured_products": [],
+        "text": "",
+        "page_width": int(page.rect.width),
+        "page_height": int(page.rect.height)
+    }
+
+
+def ocr_page_with_budget(worker: PageWorker, page, method: str, page_budget_s: float, doc_deadline: float = None) -> Dict[str, Any]:
+    """
+    OCR a page in the worker within its time budget. On overrun the page is
+    retried with the next cheaper method (DEGRADE_TO) on a shorter budget;
+    the result then carries a "degraded" entry with the reason. Pages left
+    when the document budget is spent are skipped.
+    """
+    page_no = page.number + 1
+    current = method
+    reason = None
+    while True:
+        remaining = doc_deadline - time.perf_counter() if doc_deadline is not None else None
+        if remaining is not None and remaining <= 0:
+            reason = reason or "document time budget exhausted"
+            record_fallback(page_no, current, "skipped", reason)
+            result = _skipped_page(page, reason)
+            break
+        budget = page_budget_s if current == method else DEGRADED_PAGE_BUDGET_S
+        if not budget or (remaining is not None and remaining < budget):
+            budget = remaining
+        try:
+            result = worker.run(page.number, current, budget)
+            break
+        except RuntimeError as e:
+            if current == method:
+                raise
+            # The cheaper method failed outright; give up on this page only
+            reason = f"{reason}; {current} failed: {e}"
+            record_fallback(page_no, current, "skipped", reason)
+            result = _skipped_page(page, reason)
+            break
+        except PageAborted as e:
+            reason = f"{current} {e}"
+            cheaper = DEGRADE_TO.get(current, "skipped")
+            print(f"Page {page_no}: {reason}. Falling back to {cheaper}.", file=sys.stderr)
+            record_fallback(page_no, current, cheaper, reason)
+            if cheaper == "skipped":
+                result = _skipped_page(page, reason)
+                break
+            current = cheaper
+    if current != method:
+        result["degraded"] = {"from": method, "to": current, "reason": reason}
+    return result
+
+
+def open_pdf(pdf: Union[str, bytes]):
+    """Open a PDF given as a path, or in memory when given its bytes."""
+    if isinstance(pdf, (bytes, bytearray)):
+        return fitz.open(stream=pdf, filetype="pdf")
+    return fitz.open(pdf)
+
+
+def perform_ocr_on_pdf_enhanced(
+    file_path: Union[str, bytes],
+    language: str = "en",
+    method: str = "paddle",
+    dpi: int = 400,
+    paddle_options: dict = None,
+    job_dir=None,
+    page_budget_s: float = None,
+    doc_budget_s: float = None,
+    page_index=None
+) -> Dict[str, Any]:
+    """
+    Main entry: similar behavior to server_ocr2.perform_ocr_on_pdf_enhanced but synchronous.
+    Accepts method in {"paddle","spatial","hybrid","tesseract","basic"} and custom paddle_options.
+    file_path may also be the PDF's bytes (e.g. read from stdin); it is then
+    opened in memory and nothing is written to disk.
+    With a job_dir (see ocr_jobs.open_job), each page is checkpointed as soon as it
+    is done and pages already checkpointed there are not OCRed again.
+    page_budget_s / doc_budget_s default to PAGE_BUDGET_S / DOC_BUDGET_S; see
+    ocr_page_with_budget for what happens to pages that overrun them.
+    With a page_index (see page_dedup), pages already OCRed in this or an
+    earlier catalog reuse the stored result.
+    """
+    in_memory = isinstance(file_path, (bytes, bytearray))
+    if not in_memory and not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    # Ensure paddle_options is a dictionary
+    if paddle_options is None:
+        paddle_options = {}
+
+    if page_budget_s is None:
+        page_budget_s = PAGE_BUDGET_S
+    if doc_budget_s is None:
+        doc_budget_s = DOC_BUDGET_S
+    doc_deadline = time.perf_counter() + doc_budget_s if doc_budget_s > 0 else None
+    worker = None
+    if page_budget_s > 0 or doc_deadline is not None:
+        worker = PageWorker(file_path, language, dpi, paddle_options)
+
+    variant = config_variant({"method": method, "dpi": dpi, "language": language})
+
+    doc = open_pdf(file_path)
+    results = {}
+    try:
+        for page_num in range(len(doc)):
+            page_result = load_page_checkpoint(job_dir, page_num, "ocr")
+            fingerprint = None
+            if page_result is None and page_index is not None:
+                fingerprint = PageFingerprint(doc[page_num])
+                page_result = page_index.lookup(fingerprint, "ocr", variant)
+                if page_result is not None:
+                    record_event("dedup_hit", page=page_num + 1, kind="ocr")
+                    save_page_checkpoint(job_dir, page_num, "ocr", page_result)
+            if page_result is None:
+                if worker is None:
+                    page_result = ocr_page(doc[page_num], language, method, dpi, paddle_options)
+                else:
+                    page_result = ocr_page_with_budget(worker, doc[page_num], method, page_budget_s, doc_deadline)
+                save_page_checkpoint(job_dir, page_num, "ocr", page_result)
+                if fingerprint is not None and is_reusable(page_result):
+                    page_index.store(fingerprint, "ocr", variant, page_result)
+            elif fingerprint is None:
+                record_event("checkpoint_hit", page=page_num + 1, kind="ocr")
+            results[f"page_{page_num+1}"] = page_result
+    finally:
+        if worker is not None:
+            worker.close()
+        doc.close()
+    pdf_path = None if in_memory else os.path.abspath(file_path)
+    return {"pdf_path": pdf_path, "num_pages": len(results), "pages": results}
 
 
 # ----- simple LLM extraction (optional) -----
-def llm_extract_products_from_ocr(ocr_json: Dict[str, Any], openai_model: str = "gpt-4.1") -> List[Dict[str, Any]]:
-# def llm_extract_products_from_ocr(ocr_json: Dict[str, Any], max_tokens: int, openai_model: str = "gpt-4.1") -> List[Dict[str, Any]]:
+class PartialProducts(list):
+    """Products parsed before a streamed completion failed; error says why. Not to be checkpointed."""
+
+    def __init__(self, products: List[Dict[str, Any]], error: str):
+        super().__init__(products)
+        self.error = error
+
+
+def is_complete_extraction(products) -> bool:
     """
-    Send OCR JSON to an LLM asking for strict JSON product list.
-    This mirrors earlier PoC logic.
+    Whether an extraction result may be checkpointed or reused: a non-empty,
+    non-partial product list. An empty list is more often a misread answer
+    than a page without products, so --resume asks the LLM again.
     """
-    from openai import AzureOpenAI
+    return isinstance(products, list) and bool(products) and not isinstance(products, PartialProducts)
 
 
-    AZURE_KEY = "wpgAi1JyVuZ6vc76jiJ0lzITy8J8SAJH"
-    AZURE_ENDPOINT = "https://eyq-incubator.europe.fabric.ey.com/eyq/eu/api"
-    API_VERSION = "2023-05-15"
-    client = AzureOpenAI(api_key=AZURE_KEY, azure_endpoint=AZURE_ENDPOINT, api_version=API_VERSION)
+def llm_extract_products_from_ocr(
+    ocr_json: Dict[str, Any],
+    openai_model: str = "gpt-4.1",
+    on_product: Callable[[Dict[str, Any]], None] = None,
+    stream: bool = None
+) -> List[Dict[str, Any]]:
+# def llm_extract_products_from_ocr(ocr_json: Dict[str, Any], max_tokens: int, openai_model: str = "gpt-4.1") -> List[Dict[str, Any]]:
+    """
+    Send OCR JSON to an LLM asking for strict JSON product list.
+    This mirrors earlier PoC logic. Calls go through the shared client in
+    llm_client (connection reuse, rate limiting, retries on 429s).
+
+    By default (LLM_STREAM=0 to disable) the completion is streamed and
+    products are parsed as they arrive (llm_json); on_product, if given, is
+    called with each one immediately. Malformed objects are repaired or
+    skipped and a truncated tail only loses the object it cuts off, instead
+    of failing the whole catalog. If the stream breaks off after some products
+    were parsed, those are returned as a PartialProducts.
+    """
+    from llm_client import get_llm_client
 
 
     system = {
@@ -581,36 +886,104 @@ def llm_extract_products_from_ocr(ocr_json: Dict[str, Any], openai_model: str =
         )
     }
     user = {"role": "user", "content": "OCR JSON:\n\n" + json.dumps(ocr_json)}
-    resp = client.chat.completions.create(
-                                        model=openai_model, 
-                                        messages=[system, user], 
-                                        temperature=0.0, 
-                                        # max_tokens=max_tokens
-                                    )
-    
-    assistant_text = resp.choices[0].message.content
-    try:
-        parsed = json.loads(assistant_text)
+    if stream is None:
+        stream = os.getenv("LLM_STREAM", "1") != "0"
+    client = get_llm_client()
+
+    if not stream:
+        with stage("llm", model=openai_model):
+            assistant_text = client.complete(
+                                            [system, user],
+                                            model=openai_model,
+                                            temperature=0.0,
+                                            # max_tokens=max_tokens
+                                        )
+        try:
+            parsed = json.loads(assistant_text)
+        except Exception:
+            # salvage every complete object of the array
+            parser = ProductArrayParser()
+            parsed = parser.feed(assistant_text)
+            if not parsed:
+                raise RuntimeError("LLM did not return valid JSON: " + assistant_text)
+            _report_salvage(parser.finish())
+        if on_product is not None and isinstance(parsed, list):
+            for product in parsed:
+                on_product(product)
         return parsed
-    except Exception:
-        # salvage first top-level array substring
-        txt = assistant_text.strip()
-        first = txt.find("[")
-        last = txt.rfind("]")
-        if first != -1 and last != -1 and last > first:
-            return json.loads(txt[first:last+1])
-        raise RuntimeError("LLM did not return valid JSON: " + assistant_text)
-
-
-def process_pdf_file(pdf_path):
-    """Process a single PDF file and return the JSON result"""
+
+    parser = ProductArrayParser()
+    products: List[Dict[str, Any]] = []
+    head = []
+    head_chars = 0
+    with stage("llm", model=openai_model, streaming=True) as info:
+        start = time.perf_counter()
+        try:
+            for piece in client.stream([system, user], model=openai_model, temperature=0.0):
+                if head_chars < 500:
+                    head.append(piece)
+                    head_chars += len(piece)
+                for product in parser.feed(piece):
+                    if not products:
+                        info["first_product_s"] = round(time.perf_counter() - start, 3)
+                    products.append(product)
+                    if on_product is not None:
+                        on_product(product)
+        except Exception as e:
+            if not products:
+                raise
+            # on_product has already seen these; keep them rather than failing the catalog
+            info.update(parser.finish(), partial=True)
+            print(f"LLM stream failed after {len(products)} products: {e}", file=sys.stderr)
+            record_event("llm_partial", model=openai_model, products=len(products), error=str(e))
+            return PartialProducts(products, str(e))
+        summary = parser.finish()
+        info.update(summary)
+    if not parser.started:
+        raise RuntimeError("LLM did not return a JSON array: " + "".join(head)[:500])
+    if not products and summary["trailing_text"]:
+        # An empty array followed by more text: most likely brackets in prose
+        raise RuntimeError("LLM answer has no products: " + "".join(head)[:500])
+    _report_salvage(summary)
+    return products
+
+
+def _report_salvage(summary: Dict[str, Any]):
+    if summary["repaired"] or summary["malformed"] or summary["truncated"]:
+        print(f"LLM output was malformed: kept {summary['products']} products "
+              f"({summary['repaired']} repaired), skipped {summary['malformed']} objects"
+              f"{', tail cut off' if summary['truncated'] else ''}.", file=sys.stderr)
+
+
+def process_pdf_file(pdf_path, resume: bool = False):
+    """
+    Process a single PDF file (a path, or the PDF's bytes) and return the JSON result.
+    When metrics are enabled (see ocr_metrics), a "metrics" section is added.
+    With resume, OCR pages and the extraction checkpointed by an earlier
+    attempt on the same PDF are reused instead of being redone.
+    """
+    result = _process_pdf_file(pdf_path, resume)
+    metrics = get_metrics()
+    if metrics is not None:
+        result["metrics"] = metrics
+    return result
+
+
+def get_ocr_config(workers: int = None) -> Dict[str, Any]:
+    """
+    OCR settings used by process_pdf_file and the batch runner.
+    With several OCR workers in one machine, each gets a share of the cores
+    (workers defaults to OCR_WORKERS, set by the ocr_queue worker pool).
+    """
+    if workers is None:
+        workers = int(os.getenv("OCR_WORKERS", "1"))
     METHOD = "spatial"
     DPI = 400
-    LANG = "en"
+    LANG = configured_language()
 
     # --- RECOMMENDED CONFIGURATION FOR QUALITY & SPEED ON CPU ---
     import multiprocessing
-    cpu_cores = multiprocessing.cpu_count()
+    cpu_cores = max(1, multiprocessing.cpu_count() // max(1, workers))
 
     paddle_config = {
         "ocr_version": "PP-OCRv4",
@@ -618,40 +991,103 @@ def process_pdf_file(pdf_path):
         "text_recognition_batch_size": cpu_cores,
         "dipshit" : True,
     }
+    return {"method": METHOD, "dpi": DPI, "language": LANG, "paddle_options": paddle_config}
+
+
+def _process_pdf_file(pdf_path, resume: bool = False):
+    config = get_ocr_config()
 
-    if not os.path.exists(pdf_path):
+    if isinstance(pdf_path, (bytes, bytearray)):
+        if not pdf_path:
+            return {"ok": False, "error": "empty PDF input"}
+    elif not os.path.exists(pdf_path):
         return {"ok": False, "error": "file not found", "path": pdf_path}
 
+    try:
+        job_dir = open_job(pdf_path, config, resume=resume)
+    except OSError as e:
+        # Checkpoints are an optimization; never fail the job over them
+        print(f"Checkpointing disabled: {e}", file=sys.stderr)
+        job_dir = None
+
+    page_index = open_page_index()
     try:
         ocr_out = perform_ocr_on_pdf_enhanced(
             pdf_path,
-            language=LANG,
-            method=METHOD,
-            dpi=DPI,
-            paddle_options=paddle_config
+            language=config["language"],
+            method=config["method"],
+            dpi=config["dpi"],
+            paddle_options=config["paddle_options"],
+            job_dir=job_dir,
+            page_index=page_index
         )
     except Exception as e:
         return {"ok": False, "error": "OCR failed", "detail": str(e)}
+    finally:
+        if page_index is not None:
+            dedup = page_index.stats()
+            page_index.close()
 
     try:
-        res = llm_extract_products_from_ocr({"ok": True, "ocr": ocr_out},
-                                            openai_model="gpt-4.1",
-                                            # max_tokens=10000
-                                            )
-        return {"ok": True, "products": res}
+        res = load_checkpoint(job_dir, "products")
+        if res is None:
+            res = llm_extract_products_from_ocr({"ok": True, "ocr": ocr_out},
+                                                openai_model="gpt-4.1",
+                                                # max_tokens=10000
+                                                )
+            if is_complete_extraction(res):
+                save_checkpoint(job_dir, "products", res)
+        result = {"ok": True, "products": res}
+        if isinstance(res, PartialProducts):
+            # --resume asks the LLM again
+            result.update(partial=True, detail=res.error)
+        if page_index is not None:
+            result["dedup"] = dedup
+        return result
         # json.dumps(res, ensure_ascii=False, indent=2)
     except Exception as e:
         return {"ok": False, "error": "LLM extraction failed", "detail": str(e)}
 
 # Keep your original main() function for standalone testing
+def read_pdf_input(fd: int = None) -> bytes:
+    """Read the PDF bytes from an inherited file descriptor, or from stdin."""
+    if fd is not None:
+        with os.fdopen(fd, "rb") as f:
+            return f.read()
+    return sys.stdin.buffer.read()
+
+
 def main():
     # PDF_PATH = r"C:\Users\VM764NY\Downloads\catalogue-special_froid.pdf"
-    
-    # If called with a command line argument, use that instead
-    if len(sys.argv) > 1:
-        PDF_PATH = sys.argv[1]
-    
-    result = process_pdf_file(PDF_PATH)
+    parser = argparse.ArgumentParser(description="OCR a catalog PDF and extract products with an LLM.")
+    parser.add_argument("pdf_path", nargs="?",
+                        help="PDF file, or - to read the PDF from stdin (processed in memory)")
+    parser.add_argument("--fd", type=int, help="read the PDF from this inherited file descriptor instead")
+    parser.add_argument("--name", help="original file name of a PDF read from stdin/--fd (for the upload archive)")
+    parser.add_argument("--metrics", action="store_true", default=os.getenv("OCR_METRICS") == "1",
+                        help="add per-page, per-stage timings to the output JSON (or set OCR_METRICS=1)")
+    parser.add_argument("--trace", default=os.getenv("OCR_TRACE_FILE"),
+                        help="also write a Chrome trace JSON profile to this path (or set OCR_TRACE_FILE)")
+    parser.add_argument("--resume", action="store_true", default=os.getenv("OCR_RESUME") == "1",
+                        help="reuse pages checkpointed by an earlier run on the same PDF (or set OCR_RESUME=1)")
+    args = parser.parse_args()
+    if args.pdf_path is None and args.fd is None:
+        parser.error("a PDF path, - (stdin) or --fd is required")
+    PDF_PATH = args.pdf_path
+
+    if args.pdf_path == "-" or args.fd is not None:
+        PDF_PATH = read_pdf_input(args.fd)
+        if archive_enabled() and PDF_PATH:
+            archive_upload(PDF_PATH, args.name)
+
+    if args.metrics or args.trace:
+        enable_metrics()
+
+    result = process_pdf_file(PDF_PATH, resume=args.resume)
+    if args.trace and "metrics" in result:
+        write_chrome_trace(args.trace, result["metrics"])
+        if not args.metrics:
+            del result["metrics"]
     print(json.dumps(result, ensure_ascii=False, indent=2))
 
 if __name__ == "__main__":
@@ -0,0 +1,315 @@
+"""
+Batch OCR for many catalog PDFs at once.
+
+Pages from every PDF are scheduled onto one pool of long-lived worker
+processes, so a large catalog does not leave cores idle at the tail and each
+worker loads its OCR models once for the whole batch. As soon as all pages of
+a file are done, its LLM extraction (and optional table creation) runs in a
+thread while the pool keeps OCRing other files. Each file gets its own
+result JSON, shaped like the output of ocr.py.
+
+Each page gets the OCR_PAGE_BUDGET_S budget of ocr.py and is retried with a
+cheaper method on overrun. OCR_DOC_BUDGET_S does not apply: the pages of a
+file are spread over the pool, and a batch has no request timeout to meet.
+
+Pages and extractions are checkpointed per file (see ocr_jobs); with
+--resume, a rerun only OCRs the pages that are missing, failed or degraded.
+Pages already OCRed in this batch or an earlier one are reused (see
+page_dedup).
+
+Usage:
+  python ocr_batch.py <directory_or_glob> [--output-dir DIR] [--workers N]
+                      [--to-db] [--no-llm] [--resume]
+"""
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+import argparse
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List
+
+import fitz
+
+import ocr
+from ocr_jobs import open_job, load_page_checkpoint, save_page_checkpoint, load_checkpoint, save_checkpoint
+from page_dedup import PageFingerprint, open_page_index, config_variant, is_reusable
+from page_language import DEFAULT_LANGUAGE, paddle_lang
+
+# Open documents kept per worker; pages of several files are interleaved
+_WORKER_DOC_CACHE_SIZE = 8
+
+_worker_config: Dict[str, Any] = {}
+_worker_docs: "OrderedDict[str, Any]" = OrderedDict()
+_worker_index = None
+_worker_pages = None
+
+
+def find_pdfs(target: str) -> List[str]:
+    """Return the PDF files in a directory, or matching a glob pattern."""
+    if os.path.isdir(target):
+        paths = [str(p) for p in Path(target).iterdir() if p.suffix.lower() == ".pdf"]
+    else:
+        paths = [p for p in glob.glob(target, recursive=True) if p.lower().endswith(".pdf")]
+    return sorted(os.path.abspath(p) for p in paths)
+
+
+def output_names(pdf_paths: List[str]) -> Dict[str, str]:
+    """
+    Result file name of each PDF: <stem>.json, or <stem>-<path hash>.json
+    when several PDFs share a stem (compared case-insensitively, as on Windows).
+    """
+    stems = Counter(Path(path).stem.lower() for path in pdf_paths)
+    names = {}
+    for path in pdf_paths:
+        stem = Path(path).stem
+        if stems[stem.lower()] > 1:
+            stem += "-" + hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:8]
+        names[path] = stem + ".json"
+    return names
+
+
+def _init_worker(config: Dict[str, Any]):
+    """Worker initializer: keep the config, open the dedup index and warm up the OCR model once."""
+    global _worker_index, _worker_pages
+    _worker_config.update(config)
+    _worker_index = open_page_index()
+    if ocr.PAGE_BUDGET_S > 0:
+        # Pages run in a child that is killed on overrun (ocr.ocr_page_with_budget);
+        # it loads the models on its first page and keeps them across files
+        _worker_pages = ocr.PageWorker(None, config["language"], config["dpi"], config["paddle_options"])
+    elif config["method"] in ("paddle", "hybrid") and ocr._have_paddle:
+        try:
+            # Other languages' models load on the first page that needs them
+            language = DEFAULT_LANGUAGE if config["language"] == "auto" else config["language"]
+            ocr.get_paddle_ocr(paddle_lang(language), **config["paddle_options"])
+        except Exception as e:
+            print(f"PaddleOCR warm-up failed: {e}", file=sys.stderr)
+
+
+def _open_document(pdf_path: str):
+    doc = _worker_docs.pop(pdf_path, None)
+    if doc is None:
+        doc = fitz.open(pdf_path)
+        while len(_worker_docs) >= _WORKER_DOC_CACHE_SIZE:
+            _, old = _worker_docs.popitem(last=False)
+            old.close()
+    _worker_docs[pdf_path] = doc
+    return doc
+
+
+def _ocr_page_task(pdf_path: str, page_num: int):
+    """
+    Runs in a worker process: OCR one page of one PDF, unless a copy of the
+    page was seen before. The last item says whether the page index had it
+    (None when the index is disabled).
+    """
+    config = _worker_config
+    hit = None if _worker_index is None else False
+    try:
+        page = _open_document(pdf_path)[page_num]
+        if _worker_index is not None:
+            fingerprint = PageFingerprint(page)
+            result = _worker_index.lookup(fingerprint, "ocr", config_variant(config))
+            if result is not None:
+                return pdf_path, page_num, result, True
+        if _worker_pages is not None:
+            _worker_pages.use(pdf_path)
+            result = ocr.ocr_page_with_budget(_worker_pages, page, config["method"], ocr.PAGE_BUDGET_S)
+        else:
+            result = ocr.ocr_page(page, config["language"], config["method"], config["dpi"], config["paddle_options"])
+        if _worker_index is not None and is_reusable(result):
+            _worker_index.store(fingerprint, "ocr", config_variant(config), result)
+    except Exception as e:
+        # Even basic OCR failed; keep the rest of the file
+        print(f"Page {page_num+1} of {pdf_path} failed: {e}", file=sys.stderr)
+        result = {"method": "failed", "error": str(e), "text_blocks": [], "structured_products": [],
+                  "text": "", "page_width": 0, "page_height": 0}
+    return pdf_path, page_num, result, hit
+
+
+def _finish_file(pdf_path: str, ocr_out: Dict[str, Any], out_path: str, use_llm: bool, to_db: bool,
+                 job_dir=None, dedup: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Runs in a thread: LLM extraction, optional DB insert, write the result file."""
+    if use_llm:
+        try:
+            products = load_checkpoint(job_dir, "products")
+            if products is None:
+                products = ocr.llm_extract_products_from_ocr({"ok": True, "ocr": ocr_out}, openai_model="gpt-4.1")
+                if ocr.is_complete_extraction(products):
+                    save_checkpoint(job_dir, "products", products)
+            result = {"ok": True, "products": products}
+            if isinstance(products, ocr.PartialProducts):
+                result.update(partial=True, detail=products.error)
+        except Exception as e:
+            result = {"ok": False, "error": "LLM extraction failed", "detail": str(e)}
+    else:
+        result = {"ok": True, "ocr": ocr_out}
+
+    if to_db and result["ok"] and use_llm:
+        from create_table_catalog import create_catalog_table
+        result["db"] = create_catalog_table(result["products"], os.path.basename(pdf_path))
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return {
+        "pdf": pdf_path,
+        "output": out_path,
+        "ok": result["ok"] and result.get("db", {"success": True})["success"],
+        "pages": ocr_out["num_pages"],
+        "dedup": dedup,
+    }
+
+
+def run_batch(
+    pdf_paths: List[str],
+    output_dir: str,
+    workers: int = None,
+    use_llm: bool = True,
+    to_db: bool = False,
+    llm_workers: int = 4,
+    resume: bool = False
+) -> Dict[str, Any]:
+    """
+    OCR every page of every PDF on one worker pool and write per-file results.
+
+    Args:
+        pdf_paths: PDF files to process
+        output_dir: Directory receiving one <pdf stem>.json per file (see output_names)
+        workers: OCR worker processes (default: one per core)
+        use_llm: Run LLM product extraction on each file's OCR output
+        to_db: Also create the catalog table for each file (requires use_llm)
+        llm_workers: Files finished concurrently (LLM calls, DB inserts)
+        resume: Reuse pages and extractions checkpointed by an earlier run
+
+    Returns:
+        Summary with per-file status, total pages and pages/second
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    config = ocr.get_ocr_config(workers)
+    out_names = output_names(pdf_paths)
+
+    # Flatten pages from all files; biggest files first so their pages are
+    # spread over the pool early instead of running alone at the end
+    page_counts = {}
+    for path in pdf_paths:
+        try:
+            with fitz.open(path) as doc:
+                page_counts[path] = len(doc)
+        except Exception as e:
+            print(f"❌ Cannot open {path}: {e}", file=sys.stderr)
+
+    job_dirs = {}
+    for path in page_counts:
+        try:
+            job_dirs[path] = open_job(path, config, resume=resume)
+        except OSError as e:
+            print(f"Checkpointing disabled for {path}: {e}", file=sys.stderr)
+            job_dirs[path] = None
+
+    # Pages checkpointed by an earlier run are not scheduled again
+    pages: Dict[str, Dict[str, Any]] = {path: {} for path in page_counts}
+    tasks = []
+    for path in sorted(page_counts, key=page_counts.get, reverse=True):
+        for n in range(page_counts[path]):
+            cached = load_page_checkpoint(job_dirs[path], n, "ocr")
+            if cached is None:
+                tasks.append((path, n))
+            else:
+                pages[path][n] = cached
+
+    pending = {path: page_counts[path] - len(pages[path]) for path in page_counts if page_counts[path]}
+    dedup_lookups = {path: 0 for path in page_counts}
+    dedup_hits = {path: 0 for path in page_counts}
+    files = []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config,)) as pool, \
+            ThreadPoolExecutor(max_workers=llm_workers) as finisher:
+        finishing = []
+
+        def finish(path):
+            ocr_out = {
+                "pdf_path": path,
+                "num_pages": page_counts[path],
+                "pages": {f"page_{n+1}": pages[path][n] for n in range(page_counts[path])},
+            }
+            del pages[path]
+            lookups = dedup_lookups[path]
+            # None when the page index is disabled or no page had to be OCRed
+            dedup = {"lookups": lookups, "hits": dedup_hits[path],
+                     "hit_rate": round(dedup_hits[path] / lookups, 3)} if lookups else None
+            out_path = os.path.join(output_dir, out_names[path])
+            finishing.append((path, finisher.submit(_finish_file, path, ocr_out, out_path, use_llm, to_db,
+                                                    job_dirs[path], dedup)))
+
+        for path in [path for path, count in pending.items() if count == 0]:
+            finish(path)
+        futures = [pool.submit(_ocr_page_task, path, n) for path, n in tasks]
+        for future in as_completed(futures):
+            path, page_num, result, hit = future.result()
+            pages[path][page_num] = result
+            if hit is not None:
+                dedup_lookups[path] += 1
+                dedup_hits[path] += hit
+            if "error" not in result:
+                save_page_checkpoint(job_dirs[path], page_num, "ocr", result)
+            pending[path] -= 1
+            if pending[path] == 0:
+                finish(path)
+        ocr_seconds = time.perf_counter() - start
+        for path, future in finishing:
+            try:
+                files.append(future.result())
+            except Exception as e:
+                # e.g. the result file could not be written; the other files still count
+                print(f"❌ Finishing {path} failed: {e}", file=sys.stderr)
+                files.append({"pdf": path, "output": None, "ok": False, "error": str(e),
+                              "pages": page_counts[path], "dedup": None})
+
+    total_pages = sum(page_counts.values())
+    total_lookups = sum(dedup_lookups.values())
+    elapsed = time.perf_counter() - start
+    return {
+        "files": files,
+        "failed": [path for path in pdf_paths if not page_counts.get(path)] + [f["pdf"] for f in files if not f["ok"]],
+        "total_pages": total_pages,
+        "dedup_hit_rate": round(sum(dedup_hits.values()) / total_lookups, 3) if total_lookups else None,
+        "ocr_seconds": round(ocr_seconds, 3),
+        "total_seconds": round(elapsed, 3),
+        "ocr_pages_per_second": round(total_pages / ocr_seconds, 2) if ocr_seconds else None,
+        "pages_per_second": round(total_pages / elapsed, 2) if elapsed else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR many catalog PDFs on one worker pool.")
+    parser.add_argument("target", help="directory or glob pattern of PDFs")
+    parser.add_argument("--output-dir", default="ocr_results", help="where per-file JSON results go")
+    parser.add_argument("--workers", type=int, default=None, help="OCR worker processes (default: CPU count)")
+    parser.add_argument("--no-llm", action="store_true", help="only OCR; write raw OCR output per file")
+    parser.add_argument("--resume", action="store_true", help="reuse pages checkpointed by an earlier run")
+    parser.add_argument("--to-db", action="store_true", help="create the catalog table for each file")
+    args = parser.parse_args()
+
+    pdf_paths = find_pdfs(args.target)
+    if not pdf_paths:
+        print(json.dumps({"ok": False, "error": f"No PDF files found for '{args.target}'"}))
+        sys.exit(1)
+
+    summary = run_batch(pdf_paths, args.output_dir, workers=args.workers,
+                        use_llm=not args.no_llm, to_db=args.to_db and not args.no_llm,
+                        resume=args.resume)
+    print(f"✅ {summary['total_pages']} pages from {len(pdf_paths)} files in {summary['total_seconds']}s "
+          f"({summary['pages_per_second']} pages/s)", file=sys.stderr)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Checkpointing for long catalog jobs.
+
+Each run gets a directory under OCR_JOBS_DIR (default <repo>/.cache/jobs),
+named after a hash of the PDF content plus a run id. A retry of the same
+upload finds the latest run even though the route saves it under a new file
+name, and two uploads of the same PDF processed at once never share or
+delete each other's checkpoints. Per-page OCR results and extraction
+results are written there atomically as soon as they finish; with resume
+enabled, only pages without a checkpoint (or whose checkpoint recorded an
+error or a degraded fallback) are redone.
+
+Layout:
+  <jobs_dir>/<job_id>.<run>/job.json                 pdf path, OCR config, timestamps
+  <jobs_dir>/<job_id>.<run>/pages/0001.ocr.json      OCR result of page 1
+  <jobs_dir>/<job_id>.<run>/pages/0001.products.json extracted products of page 1
+  <jobs_dir>/<job_id>.<run>/products.json            whole-document extraction
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import threading
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+# Finished or abandoned jobs older than this are removed
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+
+def get_jobs_dir() -> Path:
+    default_dir = Path(__file__).resolve().parent.parent / ".cache" / "jobs"
+    return Path(os.getenv("OCR_JOBS_DIR", str(default_dir)))
+
+
+def job_id_for_file(pdf_path: Union[str, bytes]) -> str:
+    """Content hash of a PDF (a path, or its bytes), used as its job id."""
+    if isinstance(pdf_path, (bytes, bytearray)):
+        return hashlib.sha256(pdf_path).hexdigest()[:32]
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def _write_json(path: Path, data: Any):
+    # Write then rename so a killed process never leaves a truncated checkpoint
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_json(path: Path) -> Optional[Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(path: Path, data: Any):
+    # A checkpoint that cannot be written only costs redoing the work later
+    try:
+        _write_json(path, data)
+    except OSError as e:
+        print(f"Could not write checkpoint {path}: {e}", file=sys.stderr)
+
+
+def prune_jobs(max_age_seconds: float = JOB_RETENTION_SECONDS):
+    """Remove job directories that have not been touched for max_age_seconds."""
+    jobs_dir = get_jobs_dir()
+    if not jobs_dir.is_dir():
+        return
+    cutoff = time.time() - max_age_seconds
+    for job_dir in jobs_dir.iterdir():
+        try:
+            if job_dir.is_dir() and (job_dir / "job.json").stat().st_mtime < cutoff:
+                shutil.rmtree(job_dir, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def job_runs(job_id: str) -> List[Path]:
+    """Run directories of a job, newest first."""
+    jobs_dir = get_jobs_dir()
+    if not jobs_dir.is_dir():
+        return []
+    runs = []
+    for run_dir in jobs_dir.glob(f"{job_id}.*"):
+        meta = _read_json(run_dir / "job.json")
+        if meta is not None:
+            runs.append((meta.get("created", 0), run_dir))
+    return [run_dir for _, run_dir in sorted(runs, key=lambda run: run[0], reverse=True)]
+
+
+def open_job(pdf_path: Union[str, bytes], ocr_config: Dict[str, Any], resume: bool = False, job_id: str = None) -> Path:
+    """
+    Create a checkpoint directory for a run on a PDF, or reopen the latest
+    one when resuming.
+
+    A run only resumes from checkpoints made with the same OCR config.
+    Other runs are left alone (prune_jobs removes them once they are old).
+
+    Args:
+        pdf_path: PDF being processed (a path, or its bytes when read from stdin)
+        ocr_config: Method, dpi, language and paddle options of this run
+        resume: Reuse the latest run's checkpoints and only redo what is missing
+        job_id: Explicit job id (defaults to the PDF content hash)
+
+    Returns:
+        The run directory
+    """
+    prune_jobs()
+    job_id = job_id or job_id_for_file(pdf_path)
+    config = json.loads(json.dumps(ocr_config, default=str))
+
+    job_dir = None
+    meta = None
+    if resume:
+        for run_dir in job_runs(job_id):
+            meta = _read_json(run_dir / "job.json")
+            if meta is not None and meta.get("ocr_config") == config:
+                job_dir = run_dir
+                print(f"Resuming job {job_id} ({run_dir.name})", file=sys.stderr)
+                break
+        else:
+            if meta is not None:
+                print(f"OCR config changed since job {job_id} was checkpointed; starting over.", file=sys.stderr)
+            meta = None
+
+    if job_dir is None:
+        run = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        job_dir = get_jobs_dir() / f"{job_id}.{run}"
+        meta = {"job_id": job_id, "run": run, "created": time.time(), "ocr_config": config}
+    meta["pdf_path"] = None if isinstance(pdf_path, (bytes, bytearray)) else os.path.abspath(pdf_path)
+    meta["updated"] = time.time()
+    _write_json(job_dir / "job.json", meta)
+    return job_dir
+
+
+def _page_path(job_dir: Path, page_num: int, kind: str) -> Path:
+    return job_dir / "pages" / f"{page_num + 1:04d}.{kind}.json"
+
+
+def load_page_checkpoint(job_dir: Optional[Path], page_num: int, kind: str) -> Optional[Any]:
+    """
+    Return a saved per-page result ("ocr" or "products"), or None if the
+    page still has to be done (no checkpoint, or it recorded an error or a
+    degraded fallback).
+    """
+    if job_dir is None:
+        return None
+    data = _read_json(_page_path(job_dir, page_num, kind))
+    if isinstance(data, dict) and (data.get("error") or data.get("degraded")):
+        return None
+    return data
+
+
+def save_page_checkpoint(job_dir: Optional[Path], page_num: int, kind: str, data: Any):
+    """Persist a per-page result as soon as it is available."""
+    if job_dir is not None:
+        _save(_page_path(job_dir, page_num, kind), data)
+
+
+def load_checkpoint(job_dir: Optional[Path], name: str) -> Optional[Any]:
+    """Return a saved whole-document result, or None."""
+    if job_dir is None:
+        return None
+    data = _read_json(job_dir / f"{name}.json")
+    if isinstance(data, dict) and data.get("error"):
+        return None
+    return data
+
+
+def save_checkpoint(job_dir: Optional[Path], name: str, data: Any):
+    """Persist a whole-document result."""
+    if job_dir is not None:
+        _save(job_dir / f"{name}.json", data)
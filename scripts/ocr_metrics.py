@@ -0,0 +1,221 @@
+"""
+Per-stage timing and resource instrumentation for the OCR pipeline.
+
+Stages are wrapped in `with stage("render", page=3):` blocks. When metrics
+are disabled (the default) a stage costs one global lookup; when enabled each
+stage records wall time, CPU time, the process-wide peak RSS at its end and
+how much the stage raised that peak, and fallbacks between OCR backends are
+recorded as events. The result is returned by get_metrics() for
+the output JSON and can be written as a Chrome trace (chrome://tracing,
+Perfetto) with write_chrome_trace().
+"""
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_recorder: Optional["MetricsRecorder"] = None
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far, in bytes."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+    try:
+        import psutil
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    except Exception:
+        return None
+
+
+class MetricsRecorder:
+    """Collects stage timings and events for one run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Dict[str, Any]] = []
+        self.events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_stage(self, record: Dict[str, Any]):
+        with self._lock:
+            self.stages.append(record)
+
+    def add_event(self, record: Dict[str, Any]):
+        with self._lock:
+            self.events.append(record)
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals per stage name plus the raw per-page records."""
+        totals: Dict[str, Dict[str, Any]] = {}
+        for record in self.stages:
+            total = totals.setdefault(record["stage"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0})
+            total["count"] += 1
+            total["wall_s"] += record["wall_s"]
+            total["cpu_s"] += record["cpu_s"]
+        for total in totals.values():
+            total["wall_s"] = round(total["wall_s"], 6)
+            total["cpu_s"] = round(total["cpu_s"], 6)
+        peak = _peak_rss_bytes()
+        return {
+            "wall_s": round(time.perf_counter() - self.started, 6),
+            "peak_rss_mb": round(peak / (1024 * 1024), 1) if peak else None,
+            "totals": totals,
+            "stages": list(self.stages),
+            "events": list(self.events),
+        }
+
+
+def enable_metrics() -> MetricsRecorder:
+    """Start recording metrics (discarding anything recorded before)."""
+    global _recorder
+    _recorder = MetricsRecorder()
+    return _recorder
+
+
+def disable_metrics():
+    """Stop recording metrics."""
+    global _recorder
+    _recorder = None
+
+
+def metrics_enabled() -> bool:
+    return _recorder is not None
+
+
+@contextmanager
+def stage(name: str, page: Optional[int] = None, **attrs):
+    """
+    Time a pipeline stage.
+
+    Yields a dictionary the caller may add attributes to (e.g. the backend
+    that actually ran); it is stored with the stage record.
+    """
+    recorder = _recorder
+    if recorder is None:
+        yield attrs
+        return
+
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    start_peak = _peak_rss_bytes()
+    try:
+        yield attrs
+    finally:
+        end_wall = time.perf_counter()
+        peak = _peak_rss_bytes()
+        record = {
+            "stage": name,
+            "page": page,
+            "start_s": round(start_wall - recorder.started, 6),
+            "wall_s": round(end_wall - start_wall, 6),
+            "cpu_s": round(time.process_time() - start_cpu, 6),
+            # ru_maxrss covers the whole process, not this stage; the growth
+            # is only the stage's own when no other stage ran concurrently
+            "process_peak_rss_mb": round(peak / (1024 * 1024), 1) if peak else None,
+            "peak_rss_growth_mb": round((peak - start_peak) / (1024 * 1024), 1) if peak and start_peak else None,
+            "thread": threading.get_ident(),
+        }
+        if attrs:
+            record.update(attrs)
+        recorder.add_stage(record)
+
+
+def record_event(name: str, page: Optional[int] = None, **attrs):
+    """Record a point event such as a backend fallback."""
+    recorder = _recorder
+    if recorder is None:
+        return
+    record = {
+        "event": name,
+        "page": page,
+        "at_s": round(time.perf_counter() - recorder.started, 6),
+        "thread": threading.get_ident(),
+    }
+    record.update(attrs)
+    recorder.add_event(record)
+
+
+def record_fallback(page: Optional[int], from_method: str, to_method: str, reason: str):
+    """Record that a page fell back from one OCR backend to another."""
+    record_event("fallback", page=page, from_method=from_method, to_method=to_method, reason=reason)
+
+
+def merge_records(started: float, stages: List[Dict[str, Any]], events: List[Dict[str, Any]]):
+    """
+    Add stages and events recorded in another process (e.g. an OCR page
+    worker) to this run, shifting their times onto this run's clock.
+
+    Args:
+        started: perf_counter() at which the other recorder started
+        stages: Its stage records
+        events: Its event records
+    """
+    recorder = _recorder
+    if recorder is None:
+        return
+    offset = started - recorder.started
+    for record in stages:
+        recorder.add_stage(dict(record, start_s=round(record["start_s"] + offset, 6)))
+    for record in events:
+        recorder.add_event(dict(record, at_s=round(record["at_s"] + offset, 6)))
+
+
+def get_metrics() -> Optional[Dict[str, Any]]:
+    """Return the metrics section for the output JSON, or None if disabled."""
+    recorder = _recorder
+    return recorder.summary() if recorder is not None else None
+
+
+def write_chrome_trace(path: str, metrics: Optional[Dict[str, Any]] = None):
+    """
+    Write recorded stages and events in Chrome trace event format.
+
+    Args:
+        path: Output file path
+        metrics: Metrics from get_metrics() (defaults to the current run)
+    """
+    if metrics is None:
+        metrics = get_metrics()
+    if metrics is None:
+        return
+
+    pid = os.getpid()
+    trace_events = []
+    for record in metrics["stages"]:
+        args = {k: v for k, v in record.items() if k not in ("stage", "start_s", "wall_s", "thread")}
+        trace_events.append({
+            "name": record["stage"] if record.get("page") is None else f"{record['stage']} p{record['page']}",
+            "cat": "ocr",
+            "ph": "X",
+            "ts": int(record["start_s"] * 1e6),
+            "dur": int(record["wall_s"] * 1e6),
+            "pid": pid,
+            "tid": record["thread"],
+            "args": args,
+        })
+    for record in metrics["events"]:
+        args = {k: v for k, v in record.items() if k not in ("event", "at_s", "thread")}
+        trace_events.append({
+            "name": record["event"],
+            "cat": "ocr",
+            "ph": "i",
+            "s": "t",
+            "ts": int(record["at_s"] * 1e6),
+            "pid": pid,
+            "tid": record["thread"],
+            "args": args,
+        })
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
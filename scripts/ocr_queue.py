@@ -0,0 +1,368 @@
+"""
+Local queue for catalog uploads, processed by a fixed pool of workers.
+
+The upload route submits the PDF here and returns at once; a pool started
+with `python ocr_queue.py work` runs the jobs (OCR, LLM extraction, table
+creation) with a fixed number of worker processes, each given its share of
+the cores (see ocr.get_ocr_config), so concurrent uploads no longer run
+one full-machine OCR each. The route polls the job's status.
+
+Jobs live in a SQLite database (OCR_QUEUE_DB, default
+<repo>/.cache/ocr_queue.sqlite3); the submitted PDFs are kept next to it in
+queue/ until their job finishes. When a worker is free it takes:
+
+  1. a job from the normal lane before one from the low lane -- catalogs of
+     more than LOW_LANE_PAGES pages go to the low lane unless their job has
+     waited LOW_LANE_MAX_WAIT_S already;
+  2. among those, a job of the owner (user or brand) with the fewest
+     running jobs, then of the owner served least recently, so one owner
+     uploading many catalogs does not hold up everyone else;
+  3. the oldest such job.
+
+A job interrupted by a crash is requeued (and resumed from its checkpoints,
+see ocr_jobs) up to MAX_ATTEMPTS times.
+
+Usage:
+  python ocr_queue.py submit <pdf_path|-> [--name original.pdf] [--owner ID] [--lane normal|low]
+  python ocr_queue.py status <job_id>
+  python ocr_queue.py work [--workers N]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import sqlite3
+import argparse
+import multiprocessing
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import fitz
+
+from database import enable_pool
+from upload_archive import archive_enabled, archive_upload
+
+OCR_QUEUE_WORKERS = int(os.getenv("OCR_QUEUE_WORKERS", str(max(1, (os.cpu_count() or 1) // 4))))
+LOW_LANE_PAGES = int(os.getenv("OCR_LOW_LANE_PAGES", "40"))
+LOW_LANE_MAX_WAIT_S = float(os.getenv("OCR_LOW_LANE_MAX_WAIT_S", "1800"))
+MAX_ATTEMPTS = 2
+# Idle workers check for new jobs this often
+POLL_INTERVAL_S = 1.0
+# Finished jobs are forgotten after this long
+QUEUE_RETENTION_SECONDS = 7 * 24 * 3600
+# Workers still running this long after being asked to stop are killed
+STOP_TIMEOUT_S = 30.0
+
+LANES = ("normal", "low")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    " id TEXT PRIMARY KEY, owner TEXT NOT NULL, lane TEXT NOT NULL, name TEXT, pages INTEGER,"
+    " status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, worker_pid INTEGER,"
+    " created_at REAL NOT NULL, started_at REAL, finished_at REAL, result TEXT, error TEXT)",
+    "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lane, created_at)",
+    "CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, status)",
+)
+
+# Next job: normal lane (or a low-lane job that waited long enough), owner
+# with the fewest running jobs, owner served least recently, oldest job
+_CLAIM_QUERY = """
+    SELECT j.id FROM jobs j
+    WHERE j.status = 'queued'
+    ORDER BY
+        (j.lane = 'low' AND j.created_at > ?),
+        (SELECT COUNT(*) FROM jobs r WHERE r.owner = j.owner AND r.status = 'running'),
+        COALESCE((SELECT MAX(s.started_at) FROM jobs s WHERE s.owner = j.owner AND s.started_at IS NOT NULL), 0),
+        j.created_at
+    LIMIT 1
+"""
+
+
+def get_queue_path() -> Path:
+    default_path = Path(__file__).resolve().parent.parent / ".cache" / "ocr_queue.sqlite3"
+    return Path(os.getenv("OCR_QUEUE_DB", str(default_path)))
+
+
+def _pdf_path(job_id: str) -> Path:
+    return get_queue_path().parent / "queue" / f"{job_id}.pdf"
+
+
+def open_queue() -> sqlite3.Connection:
+    path = get_queue_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Autocommit; claims take the write lock explicitly (BEGIN IMMEDIATE)
+    conn = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    for statement in _SCHEMA:
+        conn.execute(statement)
+    return conn
+
+
+def submit_job(data: bytes, name: str = None, owner: str = None, lane: str = None) -> Dict[str, Any]:
+    """
+    Queue an uploaded PDF.
+
+    Args:
+        data: PDF bytes
+        name: Original file name (names the catalog table)
+        owner: User or brand the job is scheduled fairly against
+        lane: "normal" or "low" (default: by page count, see LOW_LANE_PAGES)
+
+    Returns:
+        Dictionary with success status, job id, lane and queue position
+    """
+    if not data:
+        return {"success": False, "error": "empty PDF input"}
+    try:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            pages = doc.page_count
+    except Exception as e:
+        return {"success": False, "error": f"Invalid PDF: {e}"}
+    if lane is None:
+        lane = "low" if pages > LOW_LANE_PAGES else "normal"
+    elif lane not in LANES:
+        return {"success": False, "error": f"Unknown lane '{lane}'"}
+
+    if archive_enabled():
+        archive_upload(data, name)
+
+    job_id = uuid.uuid4().hex
+    path = _pdf_path(job_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+    conn = open_queue()
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, owner, lane, name, pages, status, created_at) VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            (job_id, owner or "anonymous", lane, name or "upload.pdf", pages, time.time()),
+        )
+        status = _job_status(conn, job_id)
+    finally:
+        conn.close()
+    return {"success": True, "job": status}
+
+
+def _job_status(conn: sqlite3.Connection, job_id: str) -> Optional[Dict[str, Any]]:
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = {key: row[key] for key in ("id", "owner", "lane", "name", "pages", "status", "attempts",
+                                     "created_at", "started_at", "finished_at", "error")}
+    job["result"] = json.loads(row["result"]) if row["result"] else None
+    if row["status"] == "queued":
+        # Jobs ahead of this one: queued earlier in its lane, and for the low
+        # lane every queued normal job
+        job["position"] = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+            "((lane = ? AND created_at < ?) OR (? = 'low' AND lane = 'normal'))",
+            (row["lane"], row["created_at"], row["lane"]),
+        ).fetchone()[0] + 1
+    return job
+
+
+def get_job_status(job_id: str) -> Dict[str, Any]:
+    """Status of a job (queued/running/done/failed), with its result when done."""
+    conn = open_queue()
+    try:
+        job = _job_status(conn, job_id)
+    finally:
+        conn.close()
+    if job is None:
+        return {"success": False, "error": f"Unknown job '{job_id}'"}
+    return {"success": True, "job": job}
+
+
+def claim_job(conn: sqlite3.Connection, worker_pid: int) -> Optional[sqlite3.Row]:
+    """Mark the next job (see _CLAIM_QUERY) as running for this worker."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(_CLAIM_QUERY, (time.time() - LOW_LANE_MAX_WAIT_S,)).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ?, attempts = attempts + 1 "
+            "WHERE id = ?", (worker_pid, time.time(), row["id"]),
+        )
+        job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+        conn.execute("COMMIT")
+        return job
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def finish_job(conn: sqlite3.Connection, job_id: str, result: Dict[str, Any] = None, error: str = None):
+    conn.execute(
+        "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?, worker_pid = NULL WHERE id = ?",
+        ("failed" if error else "done", time.time(),
+         json.dumps(result, ensure_ascii=False) if result is not None else None, error, job_id),
+    )
+    try:
+        _pdf_path(job_id).unlink()
+    except OSError:
+        pass
+
+
+def requeue_interrupted(conn: sqlite3.Connection, worker_pid: int = None) -> int:
+    """
+    Requeue the running jobs of a worker that died (of every worker when
+    worker_pid is None, i.e. when a pool starts); jobs out of attempts fail.
+    """
+    condition, params = ("status = 'running'", ())
+    if worker_pid is not None:
+        condition, params = ("status = 'running' AND worker_pid = ?", (worker_pid,))
+    failed = conn.execute(
+        f"SELECT id FROM jobs WHERE {condition} AND attempts >= ?", params + (MAX_ATTEMPTS,),
+    ).fetchall()
+    for row in failed:
+        finish_job(conn, row["id"], error="worker stopped while processing the job")
+    return conn.execute(
+        f"UPDATE jobs SET status = 'queued', worker_pid = NULL WHERE {condition}", params,
+    ).rowcount
+
+
+def prune_queue(conn: sqlite3.Connection, max_age_seconds: float = QUEUE_RETENTION_SECONDS):
+    conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                 (time.time() - max_age_seconds,))
+
+
+def run_job(job: sqlite3.Row) -> Dict[str, Any]:
+    """
+    OCR a queued PDF and load its products into a catalog table.
+
+    Returns:
+        The create_table_catalog result (table name, products inserted)
+    """
+    import ocr
+    from create_table_catalog import create_catalog_table
+
+    # A retry resumes from the pages checkpointed by the interrupted attempt
+    ocr_result = ocr.process_pdf_file(str(_pdf_path(job["id"])), resume=job["attempts"] > 1)
+    if not ocr_result.get("ok") or not ocr_result.get("products"):
+        raise RuntimeError(ocr_result.get("detail") or ocr_result.get("error") or "no products extracted")
+    db_result = create_catalog_table(ocr_result["products"], job["name"])
+    if not db_result.get("success"):
+        raise RuntimeError(db_result.get("error") or "database insertion failed")
+    return db_result
+
+
+def _stop(signum, frame):
+    # Unwind normally, so finally blocks (page workers, the pool) clean up
+    raise SystemExit(0)
+
+
+def _worker_main(workers: int):
+    # Ctrl-C reaches the whole process group; the pool stops its workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _stop)
+    # Each worker sizes its OCR batches and native thread pools to its share of the cores
+    os.environ["OCR_WORKERS"] = str(workers)
+    threads = str(max(1, (os.cpu_count() or 1) // workers))
+    for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(variable, threads)
+
+    # Long-lived: reuse database connections across jobs
+    enable_pool()
+
+    conn = open_queue()
+    pid = os.getpid()
+    while True:
+        job = claim_job(conn, pid)
+        if job is None:
+            time.sleep(POLL_INTERVAL_S)
+            continue
+        print(f"Worker {pid}: job {job['id']} ({job['name']}, owner {job['owner']}, {job['lane']} lane)",
+              file=sys.stderr)
+        try:
+            finish_job(conn, job["id"], result=run_job(job))
+        except Exception as e:
+            finish_job(conn, job["id"], error=str(e))
+
+
+def run_pool(workers: int = OCR_QUEUE_WORKERS):
+    """
+    Run the queue with a fixed number of worker processes until interrupted.
+    A worker that dies is replaced and its job requeued.
+    """
+    workers = max(1, workers)
+    signal.signal(signal.SIGTERM, _stop)
+    conn = open_queue()
+    requeued = requeue_interrupted(conn)
+    if requeued:
+        print(f"Requeued {requeued} interrupted jobs", file=sys.stderr)
+    prune_queue(conn)
+
+    def start():
+        # Not a daemon: jobs OCR their pages in a child process (ocr.PageWorker),
+        # which daemonic processes may not start
+        process = multiprocessing.Process(target=_worker_main, args=(workers,))
+        process.start()
+        return process
+
+    pool = [start() for _ in range(workers)]
+    print(f"Queue running with {workers} workers", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(POLL_INTERVAL_S)
+            for i, process in enumerate(pool):
+                if not process.is_alive():
+                    print(f"Worker {process.pid} exited ({process.exitcode}), restarting", file=sys.stderr)
+                    requeue_interrupted(conn, process.pid)
+                    pool[i] = start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for process in pool:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT_S
+        for process in pool:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        requeue_interrupted(conn)
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue catalog uploads and process them with a worker pool.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    submit = commands.add_parser("submit", help="queue a PDF and print its job id")
+    submit.add_argument("pdf_path", help="PDF file, or - to read the PDF from stdin")
+    submit.add_argument("--name", help="original file name (default: the file's name)")
+    submit.add_argument("--owner", help="user or brand the upload is scheduled fairly against")
+    submit.add_argument("--lane", choices=LANES, help="default: low for catalogs over OCR_LOW_LANE_PAGES pages")
+    status = commands.add_parser("status", help="print a job's status as JSON")
+    status.add_argument("job_id")
+    work = commands.add_parser("work", help="process queued jobs until interrupted")
+    work.add_argument("--workers", type=int, default=OCR_QUEUE_WORKERS,
+                      help="worker processes (default: OCR_QUEUE_WORKERS, a quarter of the cores)")
+    args = parser.parse_args()
+
+    if args.command == "work":
+        run_pool(args.workers)
+        return
+    if args.command == "submit":
+        if args.pdf_path == "-":
+            data = sys.stdin.buffer.read()
+        else:
+            with open(args.pdf_path, "rb") as f:
+                data = f.read()
+        name = args.name or (None if args.pdf_path == "-" else os.path.basename(args.pdf_path))
+        result = submit_job(data, name, args.owner, args.lane)
+    else:
+        result = get_job_status(args.job_id)
+    print(json.dumps(result, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+
+if __name__ == "__main__":
+    main()
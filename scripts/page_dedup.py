@@ -0,0 +1,239 @@
+"""
+Page deduplication across and within catalogs.
+
+Retailer catalogs reuse identical pages (cover, legal notices, recurring
+brand spreads) from week to week and sometimes within one PDF. Each page gets
+a fingerprint:
+
+  stream_hash  hash of the page's content stream and of the Form XObjects it
+               draws, recursively (text and drawing commands; many generators
+               put a page's whole content in a form: "q /fzFrm0 Do Q")
+  image_hash   hash of the raw streams of the images it draws
+  text_hash    hash of the page's extracted text
+  phash        64-bit perceptual hash (DCT) of a 32x32 grayscale thumbnail
+
+OCR and extraction results are stored in a local SQLite index under that
+fingerprint. A page reuses a stored result when its content streams and
+extracted text are identical and either its images are byte-identical, or
+(for pages with a text layer) its thumbnail is within PHASH_MAX_DISTANCE
+bits of the stored one, e.g. the same page with re-compressed photos. Pages
+without a text layer (scans) need identical images, since prices live in
+the pixels.
+
+Set OCR_DEDUP=0 to disable, OCR_DEDUP_INDEX to move the index file.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+import fitz
+
+PHASH_MAX_DISTANCE = 4
+# Entries not reused for this long are dropped when the index is opened
+INDEX_RETENTION_SECONDS = 90 * 24 * 3600
+# Bumped when fingerprints change; older indexes are discarded
+INDEX_VERSION = 2
+
+_THUMB_SIZE = 32
+_dct_matrix = None
+
+
+def dedup_enabled() -> bool:
+    return os.getenv("OCR_DEDUP", "1") != "0"
+
+
+def get_index_path() -> Path:
+    default_path = Path(__file__).resolve().parent.parent / ".cache" / "page_index.sqlite3"
+    return Path(os.getenv("OCR_DEDUP_INDEX", str(default_path)))
+
+
+def _dct(size: int) -> np.ndarray:
+    global _dct_matrix
+    if _dct_matrix is None or _dct_matrix.shape[0] != size:
+        k = np.arange(size)[:, None]
+        n = np.arange(size)[None, :]
+        matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+        matrix[0] /= np.sqrt(2.0)
+        _dct_matrix = matrix
+    return _dct_matrix
+
+
+def perceptual_hash(page) -> int:
+    """64-bit DCT hash of a 32x32 grayscale rendering of the page."""
+    rect = page.rect
+    pix = page.get_pixmap(matrix=fitz.Matrix(_THUMB_SIZE / rect.width, _THUMB_SIZE / rect.height),
+                          colorspace=fitz.csGRAY, alpha=False)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    if img.shape != (_THUMB_SIZE, _THUMB_SIZE):
+        # Rounding of the page size can give 31 or 33 pixels
+        ys = np.linspace(0, img.shape[0] - 1, _THUMB_SIZE).astype(int)
+        xs = np.linspace(0, img.shape[1] - 1, _THUMB_SIZE).astype(int)
+        img = img[ys][:, xs]
+    dct = _dct(_THUMB_SIZE)
+    low = (dct @ img.astype(np.float64) @ dct.T)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+class PageFingerprint:
+    """Fingerprint of one page; the perceptual hash is computed on demand."""
+
+    def __init__(self, page):
+        self.page = page
+        doc = page.parent
+        contents = page.read_contents()
+        stream = hashlib.sha256(contents)
+        stream.update(f"{page.rect.width:.1f}x{page.rect.height:.1f}r{page.rotation}".encode())
+        # Form XObjects drawn by the page, nested ones included
+        for xref, name, _, _ in page.get_xobjects():
+            stream.update(name.encode())
+            stream.update(hashlib.sha256(doc.xref_stream(xref) or b"").digest())
+        images = hashlib.sha256()
+        self.has_images = False
+        for image in page.get_images(full=True):
+            self.has_images = True
+            images.update(hashlib.sha256(doc.xref_stream_raw(image[0]) or b"").digest())
+        text = " ".join(page.get_text("text").split())
+        self.stream_hash = stream.hexdigest()
+        self.image_hash = images.hexdigest()
+        self.text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        self.has_text = bool(text)
+        self._phash = None
+
+    @property
+    def phash(self) -> Optional[int]:
+        # Without images, equal content streams already mean equal pages
+        if self._phash is None and self.has_images and self.page is not None:
+            self._phash = perceptual_hash(self.page)
+        return self._phash
+
+    def detach(self) -> "PageFingerprint":
+        """Compute the perceptual hash now and drop the page, so the
+        fingerprint can be used after the document is closed or from
+        another thread."""
+        self.phash
+        self.page = None
+        return self
+
+
+class PageIndex:
+    """
+    SQLite index of OCR and extraction results by page fingerprint.
+    Safe to share between threads; counts lookups and hits for the job.
+    """
+
+    def __init__(self, path: Path = None):
+        path = Path(path or get_index_path())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS pages")
+            self._conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " stream_hash TEXT NOT NULL, image_hash TEXT NOT NULL, text_hash TEXT NOT NULL, phash TEXT,"
+            " has_text INTEGER NOT NULL, kind TEXT NOT NULL, variant TEXT NOT NULL,"
+            " result TEXT NOT NULL, used REAL NOT NULL,"
+            " PRIMARY KEY (stream_hash, image_hash, kind, variant))"
+        )
+        self._conn.execute("DELETE FROM pages WHERE used < ?", (time.time() - INDEX_RETENTION_SECONDS,))
+        self._conn.commit()
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, kind: str, hit: bool):
+        counts = self.counts.setdefault(kind, {"lookups": 0, "hits": 0})
+        counts["lookups"] += 1
+        counts["hits"] += hit
+
+    def lookup(self, fingerprint: PageFingerprint, kind: str, variant: str) -> Optional[Any]:
+        """
+        Return the stored result for a page matching the fingerprint, or None.
+
+        Args:
+            fingerprint: Fingerprint of the page
+            kind: "ocr" or "products"
+            variant: What else the result depends on (OCR config, LLM model)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT image_hash, phash, result FROM pages "
+                "WHERE stream_hash = ? AND text_hash = ? AND kind = ? AND variant = ?",
+                (fingerprint.stream_hash, fingerprint.text_hash, kind, variant),
+            ).fetchall()
+        match = None
+        for image_hash, phash, result in rows:
+            if image_hash == fingerprint.image_hash:
+                match = (image_hash, result)
+                break
+        if match is None and fingerprint.has_text:
+            # Near-duplicate images only where the prices are in the (identical) text layer
+            for image_hash, phash, result in rows:
+                if phash is not None and fingerprint.phash is not None and \
+                        bin(int(phash, 16) ^ fingerprint.phash).count("1") <= PHASH_MAX_DISTANCE:
+                    match = (image_hash, result)
+                    break
+        with self._lock:
+            self._count(kind, match is not None)
+            if match is None:
+                return None
+            self._conn.execute(
+                "UPDATE pages SET used = ? WHERE stream_hash = ? AND image_hash = ? AND kind = ? AND variant = ?",
+                (time.time(), fingerprint.stream_hash, match[0], kind, variant),
+            )
+            self._conn.commit()
+        return json.loads(match[1])
+
+    def store(self, fingerprint: PageFingerprint, kind: str, variant: str, result: Any):
+        """Store a result under the fingerprint (same arguments as lookup)."""
+        phash = fingerprint.phash
+        row = (fingerprint.stream_hash, fingerprint.image_hash, fingerprint.text_hash,
+               f"{phash:016x}" if phash is not None else None, int(fingerprint.has_text), kind, variant,
+               json.dumps(result, ensure_ascii=False), time.time())
+        try:
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Could not store page in dedup index: {e}", file=sys.stderr)
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookups, hits and hit rate per kind for this job."""
+        with self._lock:
+            return {
+                kind: dict(counts, hit_rate=round(counts["hits"] / counts["lookups"], 3) if counts["lookups"] else None)
+                for kind, counts in self.counts.items()
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_page_index() -> Optional[PageIndex]:
+    """Open the dedup index, or return None if dedup is disabled or unavailable."""
+    if not dedup_enabled():
+        return None
+    try:
+        return PageIndex()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Page dedup disabled: {e}", file=sys.stderr)
+        return None
+
+
+def config_variant(ocr_config: Dict[str, Any]) -> str:
+    """Key for the OCR settings a result depends on."""
+    return json.dumps({k: ocr_config[k] for k in ("method", "dpi", "language")}, sort_keys=True)
+
+
+def is_reusable(page_result: Dict[str, Any]) -> bool:
+    """Skipped, failed or degraded pages are not worth remembering."""
+    return not page_result.get("error") and not page_result.get("degraded")
@@ -0,0 +1,121 @@
+"""
+Per-page language detection for choosing the OCR model.
+
+Tunisian catalogs mix French and Arabic (and some English) from page to
+page, while a Paddle or Tesseract model only reads the scripts it was
+trained on. Before a page is OCRed, a cheap pass decides its language:
+
+  - pages with a text layer: letters of the PyMuPDF text are counted per
+    script (Arabic vs Latin), and Latin text is told apart as French or
+    English by accents and common words;
+  - scanned pages: Tesseract's script detection (OSD) runs on a low
+    resolution rendering, when Tesseract is installed.
+
+The result is a language code ("fr", "ar", "en") or, for a page with a
+significant share of both scripts, a combination with the dominant one
+first ("ar+fr"). Tesseract reads combinations in one pass ("ara+fra");
+Paddle gets the dominant language's model.
+
+OCR_LANG selects a fixed language instead of "auto".
+"""
+import os
+import re
+import sys
+from typing import Optional
+
+import fitz
+
+DEFAULT_LANGUAGE = "fr"
+# Share of letters a second script needs for the page to be read as mixed
+MIXED_SCRIPT_SHARE = 0.2
+# Fewer letters than this in the text layer: treat the page as a scan
+MIN_TEXT_LETTERS = 40
+OSD_DPI = 150
+
+_TESSERACT_LANGS = {"en": "eng", "fr": "fra", "ar": "ara"}
+_OSD_SCRIPTS = {"Arabic": "ar", "Latin": None}
+
+# Arabic, Arabic Supplement, presentation forms A and B
+_ARABIC = re.compile(r"[\u0600-\u06ff\u0750-\u077f\ufb50-\ufdff\ufe70-\ufeff]")
+_LATIN = re.compile(r"[A-Za-z\u00c0-\u024f]")
+_FRENCH_ACCENTS = re.compile(r"[éèêëàâçîïôûùœ]", re.IGNORECASE)
+_WORD = re.compile(r"[a-zà-ÿœ']+")
+_FRENCH_WORDS = {"le", "la", "les", "de", "des", "du", "et", "au", "aux", "pour", "avec", "en", "sur", "prix",
+                 "offre", "promo", "gratuit", "pièce", "lot", "l'unité"}
+_ENGLISH_WORDS = {"the", "and", "of", "for", "with", "to", "in", "on", "price", "offer", "free", "each", "pack",
+                  "buy", "get"}
+
+
+def tesseract_lang(language: str) -> str:
+    """Tesseract language string for a code ("ar+fr" -> "ara+fra")."""
+    return "+".join(_TESSERACT_LANGS.get(part, part) for part in language.split("+"))
+
+
+def paddle_lang(language: str) -> str:
+    """Paddle model for a code: the dominant language of a combination."""
+    return language.split("+")[0]
+
+
+def latin_language(text: str) -> str:
+    """French or English for Latin-script text."""
+    lowered = text.lower()
+    words = _WORD.findall(lowered)
+    french = sum(word in _FRENCH_WORDS for word in words) + len(_FRENCH_ACCENTS.findall(lowered))
+    english = sum(word in _ENGLISH_WORDS for word in words)
+    if english > french:
+        return "en"
+    return "fr" if french else DEFAULT_LANGUAGE
+
+
+def language_of_text(text: str) -> Optional[str]:
+    """
+    Language of a page's text layer.
+
+    Returns:
+        A language code, or None if the text has too few letters to tell
+    """
+    arabic = len(_ARABIC.findall(text))
+    latin = len(_LATIN.findall(text))
+    letters = arabic + latin
+    if letters < MIN_TEXT_LETTERS:
+        return None
+    latin_code = latin_language(text) if latin else None
+    if not latin or arabic / letters >= 1 - MIXED_SCRIPT_SHARE:
+        return "ar"
+    if arabic / letters < MIXED_SCRIPT_SHARE:
+        return latin_code
+    return f"ar+{latin_code}" if arabic >= latin else f"{latin_code}+ar"
+
+
+def language_of_image(page) -> Optional[str]:
+    """Script of a scanned page from Tesseract OSD on a low-res rendering (None if unknown)."""
+    try:
+        import pytesseract
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        pix = page.get_pixmap(dpi=OSD_DPI, colorspace=fitz.csGRAY, alpha=False)
+        image = Image.frombytes("L", (pix.width, pix.height), pix.samples, "raw", "L", pix.stride)
+        osd = pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        # No osd.traineddata, or too little text on the page
+        print(f"Script detection failed on page {page.number + 1}: {e}", file=sys.stderr)
+        return None
+    script = osd.get("script")
+    if script not in _OSD_SCRIPTS:
+        return None
+    return _OSD_SCRIPTS[script] or DEFAULT_LANGUAGE
+
+
+def detect_page_language(page, default: str = DEFAULT_LANGUAGE) -> str:
+    """Language code to OCR a PyMuPDF page with (see module docstring)."""
+    language = language_of_text(page.get_text("text"))
+    if language is None:
+        language = language_of_image(page)
+    return language or default
+
+
+def configured_language() -> str:
+    """OCR_LANG, or "auto" for detection per page."""
+    return os.getenv("OCR_LANG", "auto")
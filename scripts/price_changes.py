@@ -0,0 +1,394 @@
+"""
+Price-change detection between consecutive catalogs of a retailer.
+
+Ingest keeps a latest-price index (latest_prices): one row per retailer
+(the Source field) and canonical product (see product_matching; a canonical
+product never spans brands, so one brand's price is never compared with
+another's), holding
+the price and promo end date from the most recent catalog that listed it.
+Each new catalog is compared against that index in one pass over its own
+rows plus the index rows of its retailers -- earlier catalogs are never
+rescanned -- and the differences go to the change log (price_changes):
+
+  new          first time the retailer lists the product
+  drop / rise  the current price (Price After, else Price Before) changed
+  promo_ended  a product missing from the new catalog whose promotion ended
+               before the new catalog's first promo date
+
+Re-ingesting a catalog replaces its change log entries: index rows keep the
+values they had before that catalog (prev_*), which serve as its baseline.
+
+Usage:
+  python price_changes.py update <table_name>
+  python price_changes.py fetch [--catalog T] [--retailer R] [--type new|drop|rise|promo_ended]
+                                [--page N] [--per-page N]
+"""
+import sys
+import json
+import argparse
+from datetime import date
+from decimal import Decimal
+import mysql.connector
+from mysql.connector import errorcode
+from catalog_analytics import read_catalog_rows, price_value, date_value
+from create_table_catalog import is_null_value
+from database import get_connection
+from product_matching import match_catalog
+
+CHANGE_TYPES = ('new', 'drop', 'rise', 'promo_ended')
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+PRICE_FIELDS = ['id', 'Brand', 'Product', 'Source', 'Price Before (TND)', 'Price After (TND)',
+                'promo_date_debut', 'promo_date_fin']
+
+PRICE_TABLES = {
+    'latest_prices': """
+        CREATE TABLE IF NOT EXISTS `latest_prices` (
+            `retailer` VARCHAR(255) NOT NULL,
+            `canonical_id` INT NOT NULL,
+            `price` DECIMAL(10, 3) NOT NULL,
+            `promo_date_fin` DATE NULL,
+            `status` VARCHAR(8) NOT NULL,
+            `catalog_table` VARCHAR(64) NOT NULL,
+            `product_id` INT NOT NULL,
+            `brand` VARCHAR(255) NULL,
+            `product` VARCHAR(512) NULL,
+            `ended_by` VARCHAR(64) NULL,
+            `prev_price` DECIMAL(10, 3) NULL,
+            `prev_promo_date_fin` DATE NULL,
+            `prev_status` VARCHAR(8) NULL,
+            `prev_catalog_table` VARCHAR(64) NULL,
+            `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (`retailer`, `canonical_id`),
+            INDEX `idx_catalog` (`catalog_table`),
+            INDEX `idx_ended_by` (`ended_by`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+    'price_changes': """
+        CREATE TABLE IF NOT EXISTS `price_changes` (
+            `id` BIGINT AUTO_INCREMENT PRIMARY KEY,
+            `catalog_table` VARCHAR(64) NOT NULL,
+            `previous_catalog_table` VARCHAR(64) NULL,
+            `retailer` VARCHAR(255) NOT NULL,
+            `canonical_id` INT NOT NULL,
+            `change_type` VARCHAR(12) NOT NULL,
+            `brand` VARCHAR(255) NULL,
+            `product` VARCHAR(512) NULL,
+            `old_price` DECIMAL(10, 3) NULL,
+            `new_price` DECIMAL(10, 3) NULL,
+            `change_pct` DECIMAL(8, 2) NULL,
+            `promo_date_fin` DATE NULL,
+            `detected_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX `idx_catalog` (`catalog_table`, `id`),
+            INDEX `idx_retailer` (`retailer`, `id`),
+            INDEX `idx_type` (`change_type`, `id`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+}
+
+_INDEX_COLUMNS = ['retailer', 'canonical_id', 'price', 'promo_date_fin', 'status', 'catalog_table', 'product_id',
+                  'brand', 'product', 'ended_by', 'prev_price', 'prev_promo_date_fin', 'prev_status',
+                  'prev_catalog_table']
+
+def ensure_price_tables(cursor):
+    """Create the index and change log tables if they do not exist yet."""
+    for create_query in PRICE_TABLES.values():
+        cursor.execute(create_query)
+
+def _retailer(value):
+    if value is None or is_null_value(value):
+        return ''
+    return str(value).strip()[:255]
+
+def _truncate(value, length):
+    return str(value)[:length] if value is not None else None
+
+def _baseline(entry, table_name):
+    """
+    What a catalog is compared against for one index row: the row itself,
+    or (when that catalog already updated or ended it) its previous values.
+
+    Returns:
+        Dictionary with price, promo_date_fin, status and catalog_table, or
+        None if the product was unknown before this catalog
+    """
+    if entry['catalog_table'] == table_name:
+        if entry['prev_catalog_table'] is None:
+            return None
+        return {'price': entry['prev_price'], 'promo_date_fin': entry['prev_promo_date_fin'],
+                'status': entry['prev_status'], 'catalog_table': entry['prev_catalog_table']}
+    status = 'active' if entry['ended_by'] == table_name else entry['status']
+    return {'price': entry['price'], 'promo_date_fin': entry['promo_date_fin'], 'status': status,
+            'catalog_table': entry['catalog_table']}
+
+def detect_price_changes(table_name, products, index_entries, today=None):
+    """
+    Compare one catalog with the latest-price index.
+
+    Args:
+        table_name: Catalog table being ingested
+        products: Dictionaries with id, canonical_id and the PRICE_FIELDS
+        index_entries: latest_prices rows (dictionaries) of the catalog's
+            retailers, plus those this catalog already touched
+        today: Date used when the catalog has no promo dates
+
+    Returns:
+        (changes, upserts, deletes): change log rows, latest_prices rows to
+        write and (retailer, canonical_id) keys to remove
+    """
+    current = {}
+    starts = []
+    for product in products:
+        price = price_value(product.get('Price After (TND)'))
+        if price is None:
+            price = price_value(product.get('Price Before (TND)'))
+        start = date_value(product.get('promo_date_debut'))
+        if start is not None:
+            starts.append(start)
+        if price is None or product.get('canonical_id') is None:
+            continue
+        key = (_retailer(product.get('Source')), product['canonical_id'])
+        # The same product listed twice: keep its lowest price
+        if key not in current or price < current[key]['price']:
+            current[key] = dict(product, price=price, promo_date_fin=date_value(product.get('promo_date_fin')))
+    catalog_start = min(starts) if starts else (today or date.today())
+    retailers = {retailer for retailer, _ in current}
+    index = {(entry['retailer'], entry['canonical_id']): entry for entry in index_entries}
+
+    changes, upserts, deletes = [], [], []
+    for key, product in current.items():
+        entry = index.get(key)
+        base = _baseline(entry, table_name) if entry else None
+        if base is None:
+            change_type, old_price = 'new', None
+        elif product['price'] < base['price']:
+            change_type, old_price = 'drop', base['price']
+        elif product['price'] > base['price']:
+            change_type, old_price = 'rise', base['price']
+        else:
+            change_type = None
+        if change_type:
+            pct = round((product['price'] - old_price) / old_price * 100, 2) if old_price else None
+            changes.append((table_name, base['catalog_table'] if base else None, key[0], key[1], change_type,
+                            _truncate(product.get('Brand'), 255), _truncate(product.get('Product'), 512),
+                            old_price, product['price'], pct, product['promo_date_fin']))
+        upserts.append({
+            'retailer': key[0], 'canonical_id': key[1], 'price': product['price'],
+            'promo_date_fin': product['promo_date_fin'], 'status': 'active', 'catalog_table': table_name,
+            'product_id': product['id'], 'brand': _truncate(product.get('Brand'), 255),
+            'product': _truncate(product.get('Product'), 512), 'ended_by': None,
+            'prev_price': base['price'] if base else None,
+            'prev_promo_date_fin': base['promo_date_fin'] if base else None,
+            'prev_status': base['status'] if base else None,
+            'prev_catalog_table': base['catalog_table'] if base else None,
+        })
+
+    for key, entry in index.items():
+        if key in current:
+            continue
+        base = _baseline(entry, table_name)
+        if base is None:
+            # Only this catalog (ingested before) had listed it
+            deletes.append(key)
+            continue
+        restored = dict(entry, price=base['price'], promo_date_fin=base['promo_date_fin'],
+                        status=base['status'], catalog_table=base['catalog_table'], ended_by=None)
+        if entry['catalog_table'] == table_name:
+            restored.update(prev_price=None, prev_promo_date_fin=None, prev_status=None, prev_catalog_table=None)
+        ended = (key[0] in retailers and base['status'] == 'active' and base['promo_date_fin'] is not None
+                 and base['promo_date_fin'] < catalog_start)
+        if ended:
+            restored.update(status='ended', ended_by=table_name)
+            changes.append((table_name, base['catalog_table'], key[0], key[1], 'promo_ended', entry['brand'],
+                            entry['product'], base['price'], None, None, base['promo_date_fin']))
+        if any(restored[column] != entry[column] for column in _INDEX_COLUMNS):
+            upserts.append(restored)
+    return changes, upserts, deletes
+
+def read_canonical_ids(cursor, table_name):
+    """Canonical product of each row of a catalog table, as matched by product_matching."""
+    try:
+        cursor.execute("SELECT `product_id`, `canonical_id` FROM `product_matches` WHERE `catalog_table` = %s",
+                       (table_name,))
+    except mysql.connector.Error as err:
+        if err.errno == errorcode.ER_NO_SUCH_TABLE:
+            return {}
+        raise
+    return dict(cursor.fetchall())
+
+def update_price_index(connection, table_name):
+    """
+    Record the price changes of a freshly ingested catalog and update the
+    latest-price index. Matches the catalog's products first if
+    product_matching has not done it yet.
+
+    Args:
+        connection: Open MySQL connection
+        table_name: Catalog table that was just (re)loaded
+
+    Returns:
+        Dictionary with the number of changes per type
+    """
+    cursor = connection.cursor()
+    try:
+        ensure_price_tables(cursor)
+        products = read_catalog_rows(cursor, table_name, PRICE_FIELDS)
+        canonical_ids = read_canonical_ids(cursor, table_name)
+    finally:
+        cursor.close()
+    if products and not canonical_ids:
+        match_catalog(connection, table_name)
+        cursor = connection.cursor()
+        try:
+            canonical_ids = read_canonical_ids(cursor, table_name)
+        finally:
+            cursor.close()
+    for product in products:
+        product['canonical_id'] = canonical_ids.get(product['id'])
+
+    cursor = connection.cursor(dictionary=True)
+    try:
+        retailers = sorted({_retailer(product.get('Source')) for product in products})
+        conditions = ["`catalog_table` = %s", "`ended_by` = %s"]
+        params = [table_name, table_name]
+        if retailers:
+            conditions.insert(0, f"`retailer` IN ({', '.join(['%s'] * len(retailers))})")
+            params = retailers + params
+        cursor.execute(f"SELECT {', '.join(f'`{c}`' for c in _INDEX_COLUMNS)} FROM `latest_prices` "
+                       f"WHERE {' OR '.join(conditions)} FOR UPDATE", tuple(params))
+        changes, upserts, deletes = detect_price_changes(table_name, products, cursor.fetchall())
+
+        cursor.execute("DELETE FROM `price_changes` WHERE `catalog_table` = %s", (table_name,))
+        if changes:
+            cursor.executemany(
+                "INSERT INTO `price_changes` (`catalog_table`, `previous_catalog_table`, `retailer`, `canonical_id`, "
+                "`change_type`, `brand`, `product`, `old_price`, `new_price`, `change_pct`, `promo_date_fin`) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", changes)
+        if upserts:
+            columns = ", ".join(f"`{c}`" for c in _INDEX_COLUMNS)
+            updates = ", ".join(f"`{c}` = VALUES(`{c}`)" for c in _INDEX_COLUMNS[2:])
+            cursor.executemany(
+                f"INSERT INTO `latest_prices` ({columns}) VALUES ({', '.join(['%s'] * len(_INDEX_COLUMNS))}) "
+                f"ON DUPLICATE KEY UPDATE {updates}",
+                [tuple(row[c] for c in _INDEX_COLUMNS) for row in upserts])
+        if deletes:
+            cursor.executemany("DELETE FROM `latest_prices` WHERE `retailer` = %s AND `canonical_id` = %s", deletes)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    counts = {change_type: 0 for change_type in CHANGE_TYPES}
+    for change in changes:
+        counts[change[4]] += 1
+    return counts
+
+def refresh_price_changes(table_name, connection=None):
+    """
+    Detect price changes after a catalog was ingested. Failures are only
+    reported: the catalog itself is already loaded.
+
+    Returns:
+        The counts from update_price_index, or None on failure
+    """
+    own_connection = connection is None
+    try:
+        if own_connection:
+            connection = get_connection()
+        counts = update_price_index(connection, table_name)
+        print(f"✅ Price changes for '{table_name}': " +
+              ", ".join(f"{count} {change_type}" for change_type, count in counts.items()), file=sys.stderr)
+        return counts
+    except Exception as err:
+        print(f"Warning: Could not detect price changes for '{table_name}': {err}", file=sys.stderr)
+        return None
+    finally:
+        if own_connection and connection is not None and connection.is_connected():
+            connection.close()
+
+def fetch_price_changes(catalog=None, retailer=None, change_type=None, page=1, per_page=DEFAULT_PER_PAGE):
+    """
+    Read the change log, oldest first, one page at a time.
+
+    Args:
+        catalog: Only changes detected for this catalog table
+        retailer: Only changes for this retailer (Source)
+        change_type: Only this kind of change (see CHANGE_TYPES)
+        page: 1-based page number
+        per_page: Changes per page (at most MAX_PER_PAGE)
+
+    Returns:
+        Dictionary with success status, "data", "total", "page" and "per_page"
+    """
+    if change_type is not None and change_type not in CHANGE_TYPES:
+        return {"success": False, "error": f"Unknown change type '{change_type}'"}
+    page = max(int(page), 1)
+    per_page = min(max(int(per_page), 1), MAX_PER_PAGE)
+
+    conditions, params = [], []
+    for column, value in (('catalog_table', catalog), ('retailer', retailer), ('change_type', change_type)):
+        if value is not None:
+            conditions.append(f"`{column}` = %s")
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    connection = None
+    try:
+        connection = get_connection()
+        cursor = connection.cursor(dictionary=True)
+        ensure_price_tables(cursor)
+        cursor.execute(f"SELECT COUNT(*) AS total FROM `price_changes` {where}", tuple(params))
+        total = cursor.fetchone()['total']
+        cursor.execute(f"SELECT * FROM `price_changes` {where} ORDER BY `id` LIMIT %s OFFSET %s",
+                       tuple(params) + (per_page, (page - 1) * per_page))
+        data = []
+        for row in cursor.fetchall():
+            for column, value in row.items():
+                if isinstance(value, Decimal):
+                    row[column] = float(value)
+                elif isinstance(value, date):
+                    row[column] = value.isoformat()
+            data.append(row)
+        cursor.close()
+        return {"success": True, "data": data, "total": total, "page": page, "per_page": per_page}
+    except mysql.connector.Error as err:
+        return {"success": False, "error": f"Database error: {err}"}
+    finally:
+        if connection is not None and connection.is_connected():
+            connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect and list price changes between catalogs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    update = commands.add_parser("update", help="record the price changes of one catalog table")
+    update.add_argument("table_name")
+    fetch = commands.add_parser("fetch", help="print a page of the change log as JSON")
+    fetch.add_argument("--catalog", help="only changes detected for this catalog table")
+    fetch.add_argument("--retailer", help="only this retailer (Source)")
+    fetch.add_argument("--type", dest="change_type", choices=CHANGE_TYPES)
+    fetch.add_argument("--page", type=int, default=1)
+    fetch.add_argument("--per-page", type=int, default=DEFAULT_PER_PAGE)
+    args = parser.parse_args()
+
+    if args.command == "fetch":
+        result = fetch_price_changes(args.catalog, args.retailer, args.change_type, args.page, args.per_page)
+    else:
+        connection = None
+        try:
+            connection = get_connection()
+            result = {"success": True, "changes": update_price_index(connection, args.table_name)}
+        except (mysql.connector.Error, RuntimeError) as err:
+            result = {"success": False, "error": str(err)}
+        finally:
+            if connection is not None and connection.is_connected():
+                connection.close()
+
+    print(json.dumps(result, ensure_ascii=False, default=str))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+"""
+Cross-catalog product matching.
+
+Gives every product of every catalog table a canonical product id, so the
+same product can be compared across retailers and weeks. Names are
+normalized first: accents, case and punctuation are dropped, and the
+quantity is read from Grammage (or the name) into one form, so "1L",
+"1 l", "100cl" and "1000ml" all become "1000ml" and "6x1L" becomes
+"6x1000ml".
+
+Candidates are found with MinHash/LSH blocking instead of comparing every
+pair: each product gets a MinHash signature of the character trigrams of
+its normalized brand and name, and only products that share a band of that
+signature (and the same quantity and normalized brand) are compared: a
+shared product name never makes two brands one product. A product joins the most
+similar canonical product whose estimated Jaccard similarity reaches
+MATCH_THRESHOLD, or becomes a new canonical product.
+
+Canonical products and their signatures are stored in MySQL
+(canonical_products), with one product_matches row per catalog product, so
+a new catalog is matched against what is already there without
+re-matching older catalogs.
+
+Usage:
+  python product_matching.py match <table_name>
+  python product_matching.py rebuild
+  python product_matching.py show <canonical_id>
+"""
+import re
+import sys
+import json
+import zlib
+import argparse
+import unicodedata
+from collections import defaultdict
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import mysql.connector
+
+from catalog_columns import sanitize_column_name
+from database import get_connection
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+# Minimum estimated Jaccard similarity of trigram sets for a match
+MATCH_THRESHOLD = 0.6
+
+# Multiply-shift hash family: h(x) = ((a * x + b) mod 2**64) >> 32, a odd.
+# Seeded: stored signatures must stay comparable between runs.
+_rng = np.random.RandomState(20250813)
+_PERM_A = _rng.randint(0, 1 << 62, size=NUM_PERM, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+_PERM_B = _rng.randint(0, 1 << 62, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+_SHIFT = np.uint64(32)
+
+# Unit -> (base unit, factor)
+UNITS = {
+    "mg": ("g", Decimal("0.001")), "g": ("g", 1), "gr": ("g", 1), "grs": ("g", 1), "kg": ("g", 1000),
+    "ml": ("ml", 1), "cl": ("ml", 10), "dl": ("ml", 100), "l": ("ml", 1000), "lt": ("ml", 1000),
+    "litre": ("ml", 1000), "litres": ("ml", 1000),
+}
+_QUANTITY = re.compile(r"(?:(\d+)\s*[x*]\s*)?(\d+(?:[.,]\d+)?)\s*(" + "|".join(sorted(UNITS, key=len, reverse=True)) +
+                       r")(?![a-z])")
+
+# Product columns used for matching (see CATALOG_FIELDS)
+MATCH_FIELDS = ("Brand", "Product", "Grammage")
+
+MATCHING_TABLES = {
+    "canonical_products": """
+        CREATE TABLE IF NOT EXISTS `canonical_products` (
+            `id` INT NOT NULL PRIMARY KEY,
+            `brand` VARCHAR(255) NULL,
+            `product` VARCHAR(512) NULL,
+            `quantity` VARCHAR(32) NOT NULL,
+            `signature` VARBINARY(256) NOT NULL,
+            `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+    "product_matches": """
+        CREATE TABLE IF NOT EXISTS `product_matches` (
+            `catalog_table` VARCHAR(64) NOT NULL,
+            `product_id` INT NOT NULL,
+            `canonical_id` INT NOT NULL,
+            `similarity` DECIMAL(4, 3) NOT NULL,
+            PRIMARY KEY (`catalog_table`, `product_id`),
+            INDEX `idx_canonical` (`canonical_id`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+}
+
+# Serializes matching runs: canonical ids are allocated by the matcher
+MATCHING_LOCK = "catalog_product_matching"
+MATCHING_LOCK_TIMEOUT_S = 120
+INSERT_BATCH_SIZE = 1000
+
+
+# ----- normalization -----
+def strip_accents(text: str) -> str:
+    if text.isascii():
+        return text
+    decomposed = unicodedata.normalize("NFKD", text.replace("œ", "oe").replace("Œ", "OE"))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _simplify(text: Optional[str]) -> str:
+    """Lowercase, unaccented, "×" read as "x"."""
+    return strip_accents(str(text or "")).lower().replace("×", "x")
+
+
+def _words(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def normalize_quantity(text: Optional[str]) -> str:
+    """
+    Read the first quantity in a text into a canonical form.
+
+    Args:
+        text: Grammage or product name (e.g. "6 x 1L", "1,5 L", "250gr")
+
+    Returns:
+        "1500ml", "6x1000ml", "250g", ... or "" when there is none
+    """
+    match = _QUANTITY.search(_simplify(text))
+    if not match:
+        return ""
+    count, amount, unit = match.groups()
+    base, factor = UNITS[unit]
+    value = Decimal(amount.replace(",", ".")) * factor
+    value = value.quantize(Decimal(1)) if value == value.to_integral() else value.normalize()
+    quantity = f"{value}{base}"
+    return f"{int(count)}x{quantity}" if count and int(count) > 1 else quantity
+
+
+def normalize_brand(brand: Optional[str]) -> str:
+    """Brand as compared for matching ("Délice" and "DELICE" are both "delice")."""
+    return _words(_simplify(brand))
+
+
+def normalize_product(brand: Optional[str], product: Optional[str], grammage: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Normalized matching text and quantity of a product.
+
+    The quantity comes from grammage, or from the name when grammage has
+    none; it is removed from the name either way.
+
+    Returns:
+        (text, quantity), e.g. ("delice lait demi ecreme", "1000ml")
+    """
+    name = _simplify(product)
+    quantity = normalize_quantity(grammage) or normalize_quantity(name)
+    name = _QUANTITY.sub(" ", name)
+    brand_words = normalize_brand(brand)
+    name_words = _words(name)
+    if brand_words and (name_words + " ").startswith(brand_words + " "):
+        # "DELICE Lait" with Brand "DELICE": keep the brand once
+        name_words = name_words[len(brand_words):].strip()
+    return " ".join(part for part in (brand_words, name_words) if part), quantity
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> List[str]:
+    padded = f" {text} "
+    if len(padded) <= size:
+        return [padded]
+    return [padded[i:i + size] for i in range(len(padded) - size + 1)]
+
+
+_shingle_hashes: Dict[str, int] = {}
+
+
+def _shingle_hash(shingle: str) -> int:
+    value = _shingle_hashes.get(shingle)
+    if value is None:
+        value = _shingle_hashes[shingle] = zlib.crc32(shingle.encode("utf-8"))
+    return value
+
+
+def minhash_signatures(texts: List[str]) -> np.ndarray:
+    """
+    MinHash signatures of the texts' character trigrams, computed in one
+    vectorized pass.
+
+    Returns:
+        uint32 array of shape (len(texts), NUM_PERM)
+    """
+    if not texts:
+        return np.empty((0, NUM_PERM), dtype=np.uint32)
+    hashes, offsets = [], []
+    for text in texts:
+        offsets.append(len(hashes))
+        hashes.extend({_shingle_hash(s) for s in shingles(text)})
+    values = np.array(hashes, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        permuted = (_PERM_A[:, None] * values[None, :] + _PERM_B[:, None]) >> _SHIFT
+    return np.minimum.reduceat(permuted, offsets, axis=1).T.astype(np.uint32)
+
+
+# ----- matching -----
+class ProductMatcher:
+    """
+    In-memory LSH index of canonical products.
+
+    match() returns the canonical id of a product, creating a canonical
+    product when nothing similar enough is indexed. Products with different
+    quantities or brands never match; products without a quantity (or a
+    brand) only match each other.
+    """
+
+    def __init__(self, next_id: int = 1):
+        self.next_id = next_id
+        self.signatures: Dict[int, np.ndarray] = {}
+        self.buckets: Dict[Tuple[str, str, int, bytes], List[int]] = defaultdict(list)
+        self.created: List[Dict[str, Any]] = []
+
+    def _band_keys(self, quantity: str, brand: str, signature: np.ndarray) -> List[Tuple[str, str, int, bytes]]:
+        raw = signature.tobytes()
+        width = len(raw) // BANDS
+        return [(quantity, brand, band, raw[band * width:(band + 1) * width]) for band in range(BANDS)]
+
+    def add(self, canonical_id: int, quantity: str, signature: np.ndarray, brand: Optional[str] = None):
+        """Index an existing canonical product."""
+        self.signatures[canonical_id] = signature
+        for key in self._band_keys(quantity, normalize_brand(brand), signature):
+            self.buckets[key].append(canonical_id)
+        self.next_id = max(self.next_id, canonical_id + 1)
+
+    def match_all(self, products: List[Tuple[Optional[str], Optional[str], Optional[str]]],
+                  chunk_size: int = 2000) -> List[Tuple[Optional[int], float]]:
+        """
+        Find or create the canonical product of each (brand, product,
+        grammage), in order, so later products can match canonical products
+        created by earlier ones.
+
+        Returns:
+            One (canonical_id, estimated similarity) per product; a new
+            canonical product has similarity 1.0, a product without a name
+            gets (None, 0.0)
+        """
+        results = []
+        for start in range(0, len(products), chunk_size):
+            chunk = products[start:start + chunk_size]
+            normalized = [normalize_product(*product) for product in chunk]
+            signatures = minhash_signatures([text for text, _ in normalized])
+            for product, (text, quantity), signature in zip(chunk, normalized, signatures):
+                results.append(self._match(product, text, quantity, signature) if text else (None, 0.0))
+        return results
+
+    def match(self, brand: Optional[str], product: Optional[str],
+              grammage: Optional[str] = None) -> Tuple[Optional[int], float]:
+        """Find or create the canonical product of one product (see match_all)."""
+        return self.match_all([(brand, product, grammage)])[0]
+
+    def _match(self, product, text: str, quantity: str, signature: np.ndarray) -> Tuple[int, float]:
+        keys = self._band_keys(quantity, normalize_brand(product[0]), signature)
+        candidates = {canonical_id for key in keys for canonical_id in self.buckets.get(key, ())}
+        best_id, best_similarity = None, -1.0
+        for canonical_id in candidates:
+            similarity = float(np.count_nonzero(self.signatures[canonical_id] == signature)) / NUM_PERM
+            if similarity > best_similarity or (similarity == best_similarity and canonical_id < best_id):
+                best_id, best_similarity = canonical_id, similarity
+        if best_id is not None and best_similarity >= MATCH_THRESHOLD:
+            return best_id, best_similarity
+
+        canonical_id = self.next_id
+        self.signatures[canonical_id] = signature
+        for key in keys:
+            self.buckets[key].append(canonical_id)
+        self.next_id += 1
+        brand, name, _ = product
+        self.created.append({"id": canonical_id, "brand": brand, "product": name,
+                             "quantity": quantity, "signature": signature})
+        return canonical_id, 1.0
+
+
+# ----- persistence -----
+def ensure_matching_tables(cursor):
+    for create_query in MATCHING_TABLES.values():
+        cursor.execute(create_query)
+
+
+def load_matcher(cursor) -> ProductMatcher:
+    """Build the LSH index from the stored canonical products."""
+    matcher = ProductMatcher()
+    cursor.execute("SELECT `id`, `brand`, `quantity`, `signature` FROM `canonical_products`")
+    for canonical_id, brand, quantity, signature in cursor.fetchall():
+        matcher.add(canonical_id, quantity, np.frombuffer(bytes(signature), dtype="<u4").astype(np.uint32), brand)
+    return matcher
+
+
+def read_match_rows(cursor, table_name: str) -> List[Tuple[int, Dict[str, Any]]]:
+    """(id, {Brand, Product, Grammage}) of every product of a catalog table."""
+    cursor.execute(f"SELECT * FROM `{table_name}` LIMIT 0")
+    cursor.fetchall()
+    available = set(cursor.column_names)
+    selected = [field for field in MATCH_FIELDS if sanitize_column_name(field) in available]
+    columns = ", ".join(["`id`"] + [f"`{sanitize_column_name(field)}`" for field in selected])
+    cursor.execute(f"SELECT {columns} FROM `{table_name}`")
+    return [(row[0], dict(zip(selected, row[1:]))) for row in cursor.fetchall()]
+
+
+def _truncate(value, length: int) -> Optional[str]:
+    return str(value)[:length] if value is not None else None
+
+
+def _insert_batches(cursor, query: str, rows: List[tuple]):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        cursor.executemany(query, rows[start:start + INSERT_BATCH_SIZE])
+
+
+def match_catalog(connection, table_name: str) -> Dict[str, int]:
+    """
+    Match the products of one catalog table against the canonical products
+    and store the result, replacing that table's previous matches.
+
+    Args:
+        connection: Open MySQL connection
+        table_name: Catalog table to match
+
+    Returns:
+        Dictionary with the number of products, matches to existing
+        canonical products and canonical products created
+    """
+    cursor = connection.cursor()
+    locked = False
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (MATCHING_LOCK, MATCHING_LOCK_TIMEOUT_S))
+        locked = cursor.fetchone()[0] == 1
+        if not locked:
+            raise RuntimeError("Timed out waiting for another product matching run")
+        ensure_matching_tables(cursor)
+        matcher = load_matcher(cursor)
+        first_new_id = matcher.next_id
+
+        rows = read_match_rows(cursor, table_name)
+        results = matcher.match_all([(row.get("Brand"), row.get("Product"), row.get("Grammage")) for _, row in rows])
+        matches = [(table_name, product_id, canonical_id, round(similarity, 3))
+                   for (product_id, _), (canonical_id, similarity) in zip(rows, results) if canonical_id is not None]
+
+        cursor.execute("DELETE FROM `product_matches` WHERE `catalog_table` = %s", (table_name,))
+        _insert_batches(cursor, "INSERT INTO `canonical_products` (`id`, `brand`, `product`, `quantity`, `signature`) "
+                                "VALUES (%s, %s, %s, %s, %s)",
+                        [(c["id"], _truncate(c["brand"], 255), _truncate(c["product"], 512), c["quantity"],
+                          c["signature"].astype("<u4").tobytes()) for c in matcher.created])
+        _insert_batches(cursor, "INSERT INTO `product_matches` VALUES (%s, %s, %s, %s)", matches)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        if locked:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MATCHING_LOCK,))
+            cursor.fetchall()
+        cursor.close()
+
+    created = len(matcher.created)
+    return {
+        "products": len(matches),
+        "matched_existing": sum(1 for m in matches if m[2] < first_new_id),
+        "new_canonical": created,
+    }
+
+
+def refresh_product_matches(table_name: str, connection=None) -> Optional[Dict[str, int]]:
+    """
+    Match a catalog after it was ingested. Failures are only reported: the
+    catalog itself is already loaded.
+
+    Args:
+        table_name: Catalog table that was just (re)loaded
+        connection: Connection to reuse (default: a pooled one, closed after)
+
+    Returns:
+        The counts from match_catalog, or None on failure
+    """
+    own_connection = connection is None
+    try:
+        if own_connection:
+            connection = get_connection()
+        counts = match_catalog(connection, table_name)
+        print(f"✅ Matched {counts['products']} products of '{table_name}' "
+              f"({counts['new_canonical']} new canonical products)", file=sys.stderr)
+        return counts
+    except Exception as err:
+        print(f"Warning: Could not match products of '{table_name}': {err}", file=sys.stderr)
+        return None
+    finally:
+        if own_connection and connection is not None and connection.is_connected():
+            connection.close()
+
+
+def rebuild_matches(connection) -> Dict[str, Any]:
+    """Drop every canonical product and match all catalog tables again (clears the latest-price index)."""
+    from catalog_analytics import list_catalog_tables
+    cursor = connection.cursor()
+    try:
+        ensure_matching_tables(cursor)
+        cursor.execute("TRUNCATE TABLE `product_matches`")
+        cursor.execute("TRUNCATE TABLE `canonical_products`")
+        # The latest-price index is keyed on the canonical ids renumbered here;
+        # it starts over with the next ingested catalog
+        from price_changes import ensure_price_tables
+        ensure_price_tables(cursor)
+        cursor.execute("TRUNCATE TABLE `latest_prices`")
+        catalogs = sorted(list_catalog_tables(cursor))
+    finally:
+        cursor.close()
+    totals = {"catalogs": len(catalogs), "products": 0, "canonical_products": 0}
+    for table_name in catalogs:
+        counts = match_catalog(connection, table_name)
+        totals["products"] += counts["products"]
+        totals["canonical_products"] += counts["new_canonical"]
+    return totals
+
+
+def fetch_canonical_product(canonical_id: int) -> Dict[str, Any]:
+    """
+    A canonical product and its offers in every catalog.
+
+    Returns:
+        Dictionary with success status, the canonical product and a list of
+        {"catalog_table", "product_id", "similarity", ...product fields}
+    """
+    from catalog_columns import original_field_name
+    connection = None
+    try:
+        connection = get_connection()
+        cursor = connection.cursor(dictionary=True)
+        ensure_matching_tables(cursor)
+        cursor.execute("SELECT `id`, `brand`, `product`, `quantity` FROM `canonical_products` WHERE `id` = %s",
+                       (canonical_id,))
+        canonical = cursor.fetchone()
+        if canonical is None:
+            return {"success": False, "error": f"Unknown canonical product {canonical_id}"}
+        cursor.execute("SELECT `catalog_table`, `product_id`, `similarity` FROM `product_matches` "
+                       "WHERE `canonical_id` = %s ORDER BY `catalog_table`", (canonical_id,))
+        by_table = defaultdict(dict)
+        for match in cursor.fetchall():
+            by_table[match["catalog_table"]][match["product_id"]] = float(match["similarity"])
+
+        offers = []
+        for table_name, similarities in by_table.items():
+            placeholders = ", ".join(["%s"] * len(similarities))
+            cursor.execute(f"SELECT * FROM `{table_name}` WHERE `id` IN ({placeholders})", tuple(similarities))
+            for row in cursor.fetchall():
+                offer = {"catalog_table": table_name, "product_id": row["id"], "similarity": similarities[row["id"]]}
+                for column, value in row.items():
+                    if column in ("id", "created_at"):
+                        continue
+                    if isinstance(value, Decimal):
+                        value = float(value)
+                    elif hasattr(value, "isoformat"):
+                        value = value.isoformat()
+                    offer[original_field_name(column)] = value
+                offers.append(offer)
+        cursor.close()
+        return {"success": True, "canonical": canonical, "offers": offers}
+    except mysql.connector.Error as err:
+        return {"success": False, "error": f"Database error: {err}"}
+    finally:
+        if connection is not None and connection.is_connected():
+            connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match products across catalog tables.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    match = commands.add_parser("match", help="match the products of one catalog table")
+    match.add_argument("table_name")
+    commands.add_parser("rebuild", help="forget all canonical products and match every catalog again")
+    show = commands.add_parser("show", help="print a canonical product and its offers as JSON")
+    show.add_argument("canonical_id", type=int)
+    args = parser.parse_args()
+
+    if args.command == "show":
+        result = fetch_canonical_product(args.canonical_id)
+    else:
+        connection = None
+        try:
+            connection = get_connection()
+            if args.command == "match":
+                result = dict(success=True, **match_catalog(connection, args.table_name))
+            else:
+                result = dict(success=True, **rebuild_matches(connection))
+        except (mysql.connector.Error, RuntimeError) as err:
+            result = {"success": False, "error": str(err)}
+        finally:
+            if connection is not None and connection.is_connected():
+                connection.close()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    sys.exit(0 if result["success"] else 1)
+
+
+if __name__ == "__main__":
+    main()
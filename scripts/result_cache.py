@@ -0,0 +1,166 @@
+"""
+Read-through cache for serialized catalog fetch results.
+
+Results are stored as pre-serialized JSON bytes, keyed by table name and
+query parameters, in an in-process LRU and (unless CATALOG_CACHE_DISK=0) in
+files under CATALOG_CACHE_DIR. Every entry is tagged with the table's version
+stamp; create_catalog_table bumps the stamp when it rewrites a table, which
+invalidates every cached result for it. The stamp is a small file, so a cache
+hit never touches MySQL.
+"""
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+
+# Upper bound on the in-process LRU, in bytes of cached JSON
+MEMORY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_memory_cache = OrderedDict()
+_memory_cache_bytes = 0
+
+def get_cache_dir():
+    """Return the cache directory (CATALOG_CACHE_DIR, default <repo>/.cache/catalog)."""
+    default_dir = Path(__file__).resolve().parent.parent / ".cache" / "catalog"
+    return Path(os.getenv("CATALOG_CACHE_DIR", str(default_dir)))
+
+def disk_cache_enabled():
+    """Return True unless the on-disk store is disabled with CATALOG_CACHE_DISK=0."""
+    return os.getenv("CATALOG_CACHE_DISK", "1") != "0"
+
+def _is_cacheable(table_name):
+    # Sanitized catalog table names only; anything else bypasses the cache
+    return bool(re.fullmatch(r'\w+', table_name or ''))
+
+def _stamp_path(table_name):
+    return get_cache_dir() / "versions" / table_name
+
+def _results_dir(table_name):
+    return get_cache_dir() / "results" / table_name
+
+def get_table_version(table_name):
+    """
+    Return the current version stamp of a table ("0" if never written).
+    """
+    try:
+        return _stamp_path(table_name).read_text(encoding="utf-8").strip() or "0"
+    except OSError:
+        return "0"
+
+def bump_table_version(table_name):
+    """
+    Give a table a new version stamp, invalidating all cached results for it.
+
+    Args:
+        table_name: Table that was just (re)written
+
+    Returns:
+        The new version stamp
+    """
+    if not _is_cacheable(table_name):
+        return None
+
+    version = f"{time.time_ns()}-{os.getpid()}"
+    stamp = _stamp_path(table_name)
+    stamp.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write then rename so readers never see a half-written stamp
+    tmp = stamp.with_name(f".{table_name}.{os.getpid()}.tmp")
+    tmp.write_text(version, encoding="utf-8")
+    os.replace(tmp, stamp)
+
+    # Old results can never be served again; reclaim the space
+    shutil.rmtree(_results_dir(table_name), ignore_errors=True)
+    return version
+
+def _cache_key(table_name, params):
+    return table_name + ":" + json.dumps(params or {}, sort_keys=True, separators=(",", ":"))
+
+def _disk_path(table_name, key, version):
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return _results_dir(table_name) / f"{digest}-{version}.json"
+
+def _forget(key):
+    global _memory_cache_bytes
+    old = _memory_cache.pop(key, None)
+    if old is not None:
+        _memory_cache_bytes -= len(old[1])
+
+def _remember(key, version, payload):
+    global _memory_cache_bytes
+    _forget(key)
+    if len(payload) > MEMORY_CACHE_MAX_BYTES:
+        return
+    _memory_cache[key] = (version, payload)
+    _memory_cache_bytes += len(payload)
+    while _memory_cache_bytes > MEMORY_CACHE_MAX_BYTES:
+        _, (_, evicted) = _memory_cache.popitem(last=False)
+        _memory_cache_bytes -= len(evicted)
+
+def get_cached(table_name, params=None):
+    """
+    Look up a cached result.
+
+    Args:
+        table_name: Table the result was fetched from
+        params: Dictionary of query parameters that shaped the result
+
+    Returns:
+        The cached JSON bytes, or None on a miss or stale entry
+    """
+    if not _is_cacheable(table_name):
+        return None
+
+    key = _cache_key(table_name, params)
+    version = get_table_version(table_name)
+
+    entry = _memory_cache.get(key)
+    if entry is not None:
+        if entry[0] == version:
+            _memory_cache.move_to_end(key)
+            return entry[1]
+        _forget(key)
+
+    if disk_cache_enabled():
+        try:
+            payload = _disk_path(table_name, key, version).read_bytes()
+        except OSError:
+            return None
+        _remember(key, version, payload)
+        return payload
+
+    return None
+
+def put_cached(table_name, params, version, payload):
+    """
+    Store a result under the version stamp read before it was fetched.
+
+    Reading the version before fetching means a result that races with a
+    rewrite is stored under the old stamp and is never served afterwards.
+
+    Args:
+        table_name: Table the result was fetched from
+        params: Dictionary of query parameters that shaped the result
+        version: Value of get_table_version() taken before the fetch
+        payload: Serialized JSON bytes
+    """
+    if not _is_cacheable(table_name):
+        return
+
+    key = _cache_key(table_name, params)
+    _remember(key, version, payload)
+
+    if disk_cache_enabled():
+        path = _disk_path(table_name, key, version)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(payload)
+            os.replace(tmp, path)
+        except OSError:
+            # The cache is best effort; the caller already has the result
+            pass
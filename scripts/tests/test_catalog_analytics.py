@@ -0,0 +1,102 @@
+from datetime import date
+from decimal import Decimal
+
+import catalog_analytics
+from catalog_analytics import _median_pct, collation_key, compute_catalog_aggregates
+
+
+def product(brand, after, before=None, rayon="Epicerie", start="04/08/2025", end="10/08/2025"):
+    return {"Brand": brand, "Rayon": rayon, "Famille": None, "Source": "Carrefour",
+            "Price Before (TND)": before, "Price After (TND)": after,
+            "promo_date_debut": start, "promo_date_fin": end}
+
+
+def test_collation_key_ignores_case_and_accents():
+    assert collation_key("Délice") == collation_key("DELICE") == collation_key("delice")
+    assert collation_key("Délice") != collation_key("Vitalait")
+
+
+def test_spellings_of_one_brand_are_a_single_key():
+    aggregates = compute_catalog_aggregates([
+        product("Délice", "1,350"),
+        product("DELICE", "1,200", before="1,500"),
+        product("Délice", "2,000"),
+        product("Vitalait", "1,290"),
+    ])
+
+    brands = sorted((value, pct, count) for dimension, value, pct, count, _ in aggregates["analytics_discounts"]
+                    if dimension == "brand")
+    assert brands == [("Délice", 0, 2), ("Délice", 20, 1), ("Vitalait", 0, 1)]
+    weeks = sorted((brand, count) for _, _, brand, count in aggregates["analytics_promo_weeks"])
+    assert weeks == [("Délice", 3), ("Vitalait", 1)]
+
+
+def test_prices_land_in_their_bucket():
+    aggregates = compute_catalog_aggregates([
+        product("A", "0,990"), product("A", "1,000"), product("A", "4,990"), product("A", "7500"),
+        product("A", None), product("A", "Prix en magasin"),
+    ])
+
+    assert sorted(aggregates["analytics_price_buckets"]) == [
+        ("Epicerie", 0, 1, 1), ("Epicerie", 1, 2, 1), ("Epicerie", 2, 5, 1), ("Epicerie", 5000, None, 1),
+    ]
+
+
+def test_promotion_is_counted_in_every_week_it_runs():
+    aggregates = compute_catalog_aggregates([product("A", "1,000", start="07/08/2025", end="19/08/2025")])
+
+    assert sorted(week for week, _, _, _ in aggregates["analytics_promo_weeks"]) == [
+        date(2025, 8, 4), date(2025, 8, 11), date(2025, 8, 18)]
+
+
+def test_median_of_the_discount_histogram():
+    assert _median_pct({}) is None
+    assert _median_pct({10: 1, 20: 1, 30: 1}) == 20.0
+    assert _median_pct({10: 2, 30: 2}) == 20.0
+    assert _median_pct({5: 1, 10: 5, 50: 2}) == 10.0
+
+
+class AnalyticsCursor:
+    def __init__(self, results):
+        self.results = results
+        self.rows = []
+
+    def execute(self, query, params=()):
+        self.rows = next((rows for prefix, rows in self.results.items() if prefix in query), [])
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class AnalyticsConnection:
+    def __init__(self, results):
+        self.results = results
+
+    def cursor(self):
+        return AnalyticsCursor(self.results)
+
+    def is_connected(self):
+        return False
+
+
+def test_fetch_analytics_reports_the_median_of_discounted_products(monkeypatch):
+    monkeypatch.setattr(catalog_analytics, "get_connection", lambda: AnalyticsConnection({
+        "FROM `analytics_discounts`": [
+            ("brand", "Délice", 0, 4, Decimal("8.000")),
+            ("brand", "Délice", 10, 1, Decimal("1.800")),
+            ("brand", "Délice", 20, 2, Decimal("3.200")),
+            ("brand", "Délice", 40, 1, Decimal("1.200")),
+        ],
+    }))
+
+    result = catalog_analytics.fetch_analytics()
+
+    assert result["success"]
+    [brand] = result["discounts"]
+    assert (brand["products"], brand["discounted"]) == (8, 4)
+    assert brand["median_discount_pct"] == 20.0
+    assert brand["avg_discount_pct"] == 22.5
+    assert brand["avg_price_after"] == 1.775
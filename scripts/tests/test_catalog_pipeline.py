@@ -0,0 +1,58 @@
+import create_table_catalog
+from catalog_pipeline import _load_staging_table
+
+
+class RecordingCursor:
+    def __init__(self, log):
+        self.log = log
+
+    def execute(self, query, params=None):
+        self.log.append((" ".join(query.split()), params))
+
+    def executemany(self, query, rows):
+        self.log.append((" ".join(query.split()), list(rows)))
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.log = []
+
+    def cursor(self, **kwargs):
+        return RecordingCursor(self.log)
+
+    def commit(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+PRODUCTS = [
+    {"Source": "Carrefour", "Brand": "Délice", "Product": "Lait", "Price After (TND)": "1,350"},
+    {"Source": "Carrefour", "Brand": "B" * 300, "Product": "Eau", "Price After (TND)": "Prix en magasin",
+     "Rayon": "Boissons"},
+]
+
+
+def test_pipeline_creates_the_table_create_catalog_table_creates(monkeypatch):
+    direct = RecordingConnection()
+    monkeypatch.setattr(create_table_catalog, "get_connection", lambda: direct)
+    monkeypatch.setattr(create_table_catalog, "bump_table_version", lambda table_name: None)
+    assert create_table_catalog.create_catalog_table(PRODUCTS, "promo.pdf", refresh_derived=False)["success"]
+
+    pipeline = RecordingConnection()
+    assert _load_staging_table(pipeline, "promo", PRODUCTS, "promo.pdf") == 2
+
+    assert pipeline.log == direct.log
+    create = next(query for query, _ in pipeline.log if query.startswith("CREATE TABLE"))
+    assert "`rayon`" in create.lower()
+    assert "DECIMAL" not in create
+    rows = next(rows for query, rows in pipeline.log if query.startswith("INSERT"))
+    assert rows[1][1] == "B" * 300
+    assert "Prix en magasin" in rows[1]
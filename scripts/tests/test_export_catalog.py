@@ -0,0 +1,17 @@
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from export_catalog import BatchWriter
+
+
+def test_partition_values_read_back_unchanged(tmp_path):
+    schema = pa.schema([("product", pa.string()), ("source_file", pa.string())])
+    names = ["promo été/2025.pdf", "a=b: 50% off?.pdf", "plain.pdf"]
+    writer = BatchWriter(str(tmp_path / "catalog"), schema, partition_column="source_file")
+    writer.write(pa.record_batch([pa.array(["Lait", "Eau", "Café"]), pa.array(names)], schema=schema))
+    files = writer.close()
+
+    assert len(files) == 3
+    table = ds.dataset(str(tmp_path / "catalog"), format="parquet", partitioning="hive").to_table()
+    assert sorted(zip(table["source_file"].to_pylist(), table["product"].to_pylist())) == \
+        sorted(zip(names, ["Lait", "Eau", "Café"]))
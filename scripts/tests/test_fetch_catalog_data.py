@@ -0,0 +1,74 @@
+import io
+import json
+
+import mysql.connector
+
+import fetch_catalog_data
+from benchmark_pipeline import generate_result_rows, legacy_convert_row
+from fetch_catalog_data import build_column_plan, convert_row
+
+
+def test_column_plan_converts_rows_like_the_per_cell_mapping():
+    description, rows = generate_result_rows(200)
+    names = [column[0] for column in description]
+    plan = build_column_plan(description)
+
+    products = [convert_row(row, plan) for row in rows]
+
+    assert products == [legacy_convert_row(dict(zip(names, row))) for row in rows]
+    assert products[1]["promo_date_fin"] == "31/08/2025" and products[0]["promo_date_fin"] is None
+    assert "id" not in products[0] and "Price Before (TND)" in products[0]
+
+
+class FailingCursor:
+    def __init__(self, description, rows):
+        self.description = description
+        self.chunks = [rows[:2], rows[2:4]]
+
+    def execute(self, query):
+        pass
+
+    def fetchmany(self, size):
+        if not self.chunks:
+            raise mysql.connector.errors.OperationalError("Lost connection to MySQL server during query")
+        return self.chunks.pop(0)
+
+    def close(self):
+        pass
+
+
+class FailingConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self, **kwargs):
+        return self._cursor
+
+    def is_connected(self):
+        return False
+
+
+def test_json_stream_reports_an_error_after_the_rows_written(monkeypatch):
+    description, rows = generate_result_rows(10)
+    monkeypatch.setattr(fetch_catalog_data, "get_connection",
+                        lambda: FailingConnection(FailingCursor(description, rows)))
+    monkeypatch.setattr(fetch_catalog_data, "table_exists", lambda connection, table_name: True)
+    out = io.StringIO()
+
+    result = fetch_catalog_data.stream_catalog_data("promo", out, "json", chunk_size=2)
+
+    assert not result["success"]
+    document = json.loads(out.getvalue())
+    assert document["success"] is False
+    assert "Lost connection" in document["error"]
+    assert len(document["data"]) == document["count"] == 4
+
+
+def test_json_stream_of_a_missing_table_is_an_error_document(monkeypatch):
+    monkeypatch.setattr(fetch_catalog_data, "get_connection", lambda: FailingConnection(None))
+    monkeypatch.setattr(fetch_catalog_data, "table_exists", lambda connection, table_name: False)
+    out = io.StringIO()
+
+    fetch_catalog_data.stream_catalog_data("missing", out, "json")
+
+    assert json.loads(out.getvalue()) == {"success": False, "error": "Table 'missing' does not exist", "count": 0}
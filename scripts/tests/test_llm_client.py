@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from llm_client import LLMClient, RateLimiter, TokenBucket
+from llm_stub_server import start_stub_server
+
+MESSAGES = [{"role": "user", "content": "page"}]
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        server = start_stub_server(**options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def client_for(server, **options):
+    return LLMClient(api_key="stub", endpoint=f"http://127.0.0.1:{server.server_port}", **options)
+
+
+def test_throttled_request_waits_for_retry_after(stub):
+    server = stub(throttle_every=2, retry_after=0.5)
+    client = client_for(server)
+    client.complete(MESSAGES, model="stub")
+
+    start = time.monotonic()
+    assert client.complete(MESSAGES, model="stub").startswith("[")
+
+    assert time.monotonic() - start >= 0.5
+    assert server.state.throttled == 1
+    stats = client.get_stats()
+    assert (stats["throttled"], stats["retries"], stats["attempts"]) == (1, 1, 3)
+
+
+def test_retries_stop_at_llm_max_retries(stub, monkeypatch):
+    server = stub(throttle_every=1, retry_after=0.01)
+    monkeypatch.setenv("LLM_MAX_RETRIES", "2")
+    client = client_for(server)
+
+    with pytest.raises(openai.RateLimitError):
+        client.complete(MESSAGES, model="stub")
+
+    assert server.state.requests == 3
+    stats = client.get_stats()
+    assert (stats["attempts"], stats["retries"], stats["failures"]) == (3, 2, 1)
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(per_minute=60, burst_s=2)
+    assert bucket.delay_for(2) == 0.0
+
+    bucket.take(2)
+
+    assert bucket.delay_for(1) == pytest.approx(1.0, abs=0.05)
+    assert bucket.delay_for(5) == pytest.approx(2.0, abs=0.05)
+
+
+def test_rate_limiter_paces_requests_over_the_token_budget():
+    async def run():
+        # 1000 tokens per second, bursts of 10000
+        limiter = RateLimiter(tpm=60000)
+        first = await limiter.acquire(10000)
+        second = await limiter.acquire(500)
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first < 0.05
+    assert second == pytest.approx(0.5, abs=0.1)
+
+
+def test_pause_holds_every_request():
+    async def run():
+        limiter = RateLimiter(rpm=6000)
+        limiter.pause(0.3)
+        return await limiter.acquire(1)
+
+    assert asyncio.run(run()) >= 0.3
@@ -0,0 +1,71 @@
+import pytest
+
+import llm_client
+import ocr
+from llm_json import ProductArrayParser
+from llm_stub_server import stub_answer
+
+
+def parse(text, piece_size=7):
+    parser = ProductArrayParser()
+    products = []
+    for i in range(0, len(text), piece_size):
+        products.extend(parser.feed(text[i:i + piece_size]))
+    return products, parser.finish()
+
+
+def test_objects_are_returned_as_they_complete():
+    parser = ProductArrayParser()
+
+    assert parser.feed('```json\n[{"Product": "Lait"}, {"Product": "Ca') == [{"Product": "Lait"}]
+    assert parser.feed('fé"}]\n```') == [{"Product": "Café"}]
+    assert parser.finish() == {"products": 2, "repaired": 0, "malformed": 0, "truncated": False,
+                               "trailing_text": True}
+
+
+def test_known_faults_are_repaired():
+    products, summary = parse('[{"Product": "Lait", "promo_date_debut": 13/08/2025,}]')
+
+    assert products == [{"Product": "Lait", "promo_date_debut": "13/08/2025"}]
+    assert summary["repaired"] == 1
+
+
+def test_malformed_objects_are_skipped_and_the_tail_is_cut():
+    products, summary = parse(stub_answer(products=3, malformed=True))
+
+    assert [p["Product"] for p in products] == ["Produit de test 1", "Produit de test 2", "Produit de test 3",
+                                                "Date sans guillemets"]
+    assert summary["malformed"] == 1
+    assert summary["truncated"]
+
+
+def test_brackets_in_prose_before_the_array_are_skipped():
+    products, summary = parse('Here are [the] products: [{"Product": "Lait"}, {"Product": "Eau"}]')
+
+    assert [p["Product"] for p in products] == ["Lait", "Eau"]
+    assert not summary["trailing_text"]
+
+
+def test_empty_array_followed_by_text_is_reported():
+    products, summary = parse('Here are [] products: [{"Product": "Lait"}]')
+
+    assert products == []
+    assert summary["trailing_text"]
+
+
+class ProseClient:
+    def stream(self, messages, model, **kwargs):
+        yield from ('Here are [] the products: ', '[{"Product": "Lait"}]')
+
+
+def test_streamed_answer_without_products_is_an_error(monkeypatch):
+    monkeypatch.setattr(llm_client, "get_llm_client", lambda: ProseClient())
+
+    with pytest.raises(RuntimeError, match="no products"):
+        ocr.llm_extract_products_from_ocr({"ok": True, "ocr": {}}, stream=True)
+
+
+def test_empty_or_partial_extractions_are_not_checkpointed():
+    assert ocr.is_complete_extraction([{"Product": "Lait"}])
+    assert not ocr.is_complete_extraction([])
+    assert not ocr.is_complete_extraction(ocr.PartialProducts([{"Product": "Lait"}], "stream cut"))
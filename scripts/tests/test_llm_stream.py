@@ -0,0 +1,48 @@
+import pytest
+
+import llm_client
+import ocr
+from llm_client import LLMClient
+from llm_stub_server import start_stub_server
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        server = start_stub_server(**options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_stream_settles_tokens_with_the_reported_usage(stub):
+    server = stub(products=5)
+    client = LLMClient(api_key="stub", endpoint=f"http://127.0.0.1:{server.server_port}", tpm=600000)
+    text = "".join(client.stream([{"role": "user", "content": "x" * 400}], model="stub"))
+
+    assert text.startswith("[")
+    stats = client.get_stats()
+    assert stats["prompt_tokens"] == 100
+    assert stats["completion_tokens"] == len(text) // 4
+
+
+def test_broken_stream_returns_the_products_parsed_so_far(stub, monkeypatch):
+    server = stub(products=20, drop_stream=True)
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "stub")
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("LLM_MAX_RETRIES", "0")
+    monkeypatch.setattr(llm_client, "_default_client", None)
+    seen = []
+
+    products = ocr.llm_extract_products_from_ocr({"ok": True, "ocr": {}}, openai_model="stub",
+                                                 on_product=seen.append, stream=True)
+
+    assert isinstance(products, ocr.PartialProducts)
+    assert 0 < len(products) < 20
+    assert products == seen
+    assert products.error
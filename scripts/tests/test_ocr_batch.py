@@ -0,0 +1,35 @@
+from benchmark_pipeline import generate_catalog_pdf
+from ocr_batch import output_names, run_batch
+
+
+def test_output_names_only_disambiguate_shared_stems():
+    names = output_names(["/in/a/promo.pdf", "/in/b/promo.pdf", "/in/b/PROMO.PDF", "/in/a/froid.pdf"])
+
+    assert names["/in/a/froid.pdf"] == "froid.json"
+    shared = [names[path] for path in ("/in/a/promo.pdf", "/in/b/promo.pdf", "/in/b/PROMO.PDF")]
+    assert len({name.lower() for name in shared}) == 3
+    assert all(name.lower().startswith("promo-") for name in shared)
+
+
+def test_disabled_page_index_reports_no_dedup(tmp_path, monkeypatch):
+    monkeypatch.setenv("OCR_DEDUP", "0")
+    monkeypatch.setenv("OCR_JOBS_DIR", str(tmp_path / "jobs"))
+    pdf = generate_catalog_pdf(str(tmp_path / "promo.pdf"), pages=2, density=12)
+
+    summary = run_batch([pdf], str(tmp_path / "out"), workers=1, use_llm=False)
+
+    assert summary["files"][0]["ok"]
+    assert summary["files"][0]["dedup"] is None
+    assert summary["dedup_hit_rate"] is None
+
+
+def test_page_index_lookups_are_reported(tmp_path, monkeypatch):
+    monkeypatch.setenv("OCR_DEDUP_INDEX", str(tmp_path / "pages.sqlite"))
+    monkeypatch.setenv("OCR_JOBS_DIR", str(tmp_path / "jobs"))
+    pdf = generate_catalog_pdf(str(tmp_path / "promo.pdf"), pages=2, density=12)
+    run_batch([pdf], str(tmp_path / "first"), workers=1, use_llm=False)
+
+    summary = run_batch([pdf], str(tmp_path / "second"), workers=1, use_llm=False)
+
+    assert summary["files"][0]["dedup"] == {"lookups": 2, "hits": 2, "hit_rate": 1.0}
+    assert summary["dedup_hit_rate"] == 1.0
@@ -0,0 +1,33 @@
+import pytest
+
+from ocr_jobs import open_job, load_page_checkpoint, save_page_checkpoint
+
+CONFIG = {"method": "spatial", "dpi": 200, "language": "fr", "paddle_options": {}}
+PAGE = {"method": "spatial_pymupdf", "text": "Produit 1,990", "text_blocks": []}
+
+
+@pytest.fixture(autouse=True)
+def jobs_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("OCR_JOBS_DIR", str(tmp_path / "jobs"))
+
+
+def test_concurrent_runs_of_the_same_pdf_keep_their_checkpoints():
+    first = open_job(b"%PDF same upload", CONFIG)
+    save_page_checkpoint(first, 0, "ocr", PAGE)
+    second = open_job(b"%PDF same upload", CONFIG)
+
+    assert second != first
+    assert load_page_checkpoint(first, 0, "ocr") == PAGE
+    assert open_job(b"%PDF same upload", CONFIG, resume=True) == second
+
+
+def test_resume_redoes_degraded_pages():
+    job_dir = open_job(b"%PDF degraded", CONFIG)
+    save_page_checkpoint(job_dir, 0, "ocr", PAGE)
+    save_page_checkpoint(job_dir, 1, "ocr", dict(PAGE, method="tesseract_basic",
+                                                  degraded={"from": "spatial", "to": "basic", "reason": "boom"}))
+
+    resumed = open_job(b"%PDF degraded", CONFIG, resume=True)
+    assert resumed == job_dir
+    assert load_page_checkpoint(resumed, 0, "ocr") == PAGE
+    assert load_page_checkpoint(resumed, 1, "ocr") is None
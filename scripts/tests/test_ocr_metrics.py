@@ -0,0 +1,17 @@
+from ocr_metrics import disable_metrics, enable_metrics, get_metrics, stage
+
+
+def test_stage_reports_process_peak_and_its_growth():
+    enable_metrics()
+    try:
+        with stage("render", page=1):
+            block = b"x" * (32 * 1024 * 1024)
+        metrics = get_metrics()
+    finally:
+        disable_metrics()
+    del block
+
+    [record] = metrics["stages"]
+    assert "peak_rss_mb" not in record
+    assert record["process_peak_rss_mb"] <= metrics["peak_rss_mb"]
+    assert record["peak_rss_growth_mb"] >= 0
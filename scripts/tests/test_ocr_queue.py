@@ -0,0 +1,108 @@
+"""
+End-to-end run of one upload through the queue: `ocr_queue.py work` OCRs it
+in a pool worker (with the page budgets on, so through ocr.PageWorker),
+extracts products from llm_stub_server.py and loads them into MySQL.
+
+Without TEST_MYSQL_DATABASE the database points at a closed port, so the job
+must get through OCR and extraction and fail only at the database step.
+"""
+import os
+import sys
+import time
+import socket
+import subprocess
+from pathlib import Path
+
+import fitz
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+JOB_TIMEOUT_S = 180
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port, timeout_s=15):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"nothing listening on port {port}")
+
+
+def _catalog_pdf(path):
+    doc = fitz.open()
+    page = doc.new_page()
+    for i in range(8):
+        page.insert_text((50, 60 + 90 * i), f"Lait entier 1L marque Délice prix promo {i + 1},990 DT")
+    doc.save(str(path))
+
+
+def test_work_runs_a_real_job(tmp_path, monkeypatch):
+    llm_port = _free_port()
+    env = dict(
+        os.environ,
+        OCR_QUEUE_DB=str(tmp_path / "queue.sqlite3"),
+        OCR_JOBS_DIR=str(tmp_path / "jobs"),
+        OCR_DEDUP="0",
+        OCR_ARCHIVE_UPLOADS="0",
+        OCR_LANG="fr",
+        CATALOG_CACHE_DISK="0",
+        AZURE_OPENAI_ENDPOINT=f"http://127.0.0.1:{llm_port}",
+        AZURE_OPENAI_API_KEY="test",
+        LLM_STREAM="0",
+        PYTHONIOENCODING="utf-8",
+    )
+    real_db = os.getenv("TEST_MYSQL_DATABASE")
+    if real_db:
+        env["MYSQL_DATABASE"] = real_db
+    else:
+        env.update(MYSQL_HOST="127.0.0.1", MYSQL_PORT=str(_free_port()))
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+
+    pdf = tmp_path / "catalogue-test.pdf"
+    _catalog_pdf(pdf)
+
+    import ocr_queue
+    submitted = ocr_queue.submit_job(pdf.read_bytes(), pdf.name, "test")
+    assert submitted["success"], submitted
+    job_id = submitted["job"]["id"]
+
+    stub = subprocess.Popen([sys.executable, "llm_stub_server.py", "--port", str(llm_port), "--products", "2"],
+                            cwd=SCRIPTS_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    pool = subprocess.Popen([sys.executable, "ocr_queue.py", "work", "--workers", "1"],
+                            cwd=SCRIPTS_DIR, env=env, stdout=subprocess.DEVNULL)
+    try:
+        _wait_for_port(llm_port)
+        deadline = time.monotonic() + JOB_TIMEOUT_S
+        while True:
+            job = ocr_queue.get_job_status(job_id)["job"]
+            if job["status"] in ("done", "failed") or time.monotonic() > deadline:
+                break
+            time.sleep(0.5)
+    finally:
+        pool.terminate()
+        pool.wait(timeout=60)
+        stub.terminate()
+        stub.wait(timeout=10)
+
+    assert job["status"] in ("done", "failed"), job
+    # OCR and extraction ran in the worker (and were checkpointed)
+    assert list(Path(env["OCR_JOBS_DIR"]).glob("*/products.json")), job
+    if real_db:
+        assert job["status"] == "done", job
+        assert job["result"]["products_inserted"] == 2
+    else:
+        assert job["status"] == "failed"
+        assert job["error"].startswith("Database error"), job["error"]
+    # The pool stopped its worker and left nothing running
+    assert pool.returncode == 0
+    assert ocr_queue.get_job_status(job_id)["job"]["status"] == job["status"]
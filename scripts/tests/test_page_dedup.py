@@ -0,0 +1,45 @@
+import fitz
+
+from page_dedup import PageFingerprint, PageIndex
+
+
+def _form_pages(prices):
+    """Pages drawn through a Form XObject ("q /fzFrm0 Do Q"), one per price."""
+    src = fitz.open()
+    for price in prices:
+        page = src.new_page()
+        for i in range(3):
+            page.insert_text((50, 60 + 50 * i), f"Huile de tournesol 1L prix {price}")
+    out = fitz.open()
+    for i in range(len(prices)):
+        page = out.new_page()
+        page.show_pdf_page(page.rect, src, i)
+    return out
+
+
+def test_form_xobject_pages_with_other_text_do_not_match(tmp_path):
+    doc = _form_pages(["17,800 DT", "9,990 DT", "17,800 DT"])
+    index = PageIndex(tmp_path / "index.sqlite3")
+    try:
+        index.store(PageFingerprint(doc[0]), "ocr", "v", {"text": "17,800 DT"})
+        assert index.lookup(PageFingerprint(doc[1]), "ocr", "v") is None
+        assert index.lookup(PageFingerprint(doc[2]), "ocr", "v") == {"text": "17,800 DT"}
+    finally:
+        index.close()
+
+
+def test_scanned_pages_need_identical_images(tmp_path):
+    doc = fitz.open()
+    for shade in (0.5, 0.52):
+        page = doc.new_page()
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+        pix.set_rect(pix.irect, (int(255 * shade),) * 3)
+        page.insert_image(page.rect, pixmap=pix)
+    first, second = PageFingerprint(doc[0]), PageFingerprint(doc[1])
+    assert not first.has_text
+    index = PageIndex(tmp_path / "index.sqlite3")
+    try:
+        index.store(first, "ocr", "v", {"text": "scan 1"})
+        assert index.lookup(second, "ocr", "v") is None
+    finally:
+        index.close()
@@ -0,0 +1,79 @@
+from datetime import date
+from decimal import Decimal
+
+from price_changes import detect_price_changes
+from product_matching import ProductMatcher
+
+
+def product(product_id, canonical_id, price, brand="DELICE", name="Lait", promo_start="2025-01-20",
+            promo_end="2025-02-01"):
+    return {"id": product_id, "canonical_id": canonical_id, "Source": "Carrefour", "Brand": brand,
+            "Product": name, "Price Before (TND)": None, "Price After (TND)": price,
+            "promo_date_debut": promo_start, "promo_date_fin": promo_end}
+
+
+def ingest(index, table_name, products):
+    """Run detection like update_price_index and apply its writes to index."""
+    changes, upserts, deletes = detect_price_changes(table_name, products, list(index.values()))
+    for row in upserts:
+        index[(row["retailer"], row["canonical_id"])] = row
+    for key in deletes:
+        del index[key]
+    return sorted((change[3], change[4], change[7], change[8]) for change in changes)
+
+
+def test_new_drop_rise_and_promo_ended():
+    index = {}
+    assert ingest(index, "week1", [
+        product(1, 10, "1,990"),
+        product(2, 20, "2,500"),
+        product(3, 30, "4,000", promo_start="2025-01-01", promo_end="2025-01-10"),
+    ]) == [(10, "new", None, Decimal("1.990")), (20, "new", None, Decimal("2.500")),
+           (30, "new", None, Decimal("4.000"))]
+
+    assert ingest(index, "week2", [
+        product(1, 10, "1,790"),
+        product(2, 20, "2,900"),
+    ]) == [(10, "drop", Decimal("1.990"), Decimal("1.790")), (20, "rise", Decimal("2.500"), Decimal("2.900")),
+           (30, "promo_ended", Decimal("4.000"), None)]
+    assert index[("Carrefour", 30)]["status"] == "ended"
+
+
+def test_reingesting_a_catalog_gives_the_same_changes():
+    index = {}
+    ingest(index, "week1", [product(1, 10, "1,990"), product(2, 20, "2,500", promo_end="2025-01-10")])
+    week2 = [product(1, 10, "1,790")]
+    first = ingest(index, "week2", week2)
+    state = {key: dict(row) for key, row in index.items()}
+
+    assert ingest(index, "week2", week2) == first
+    assert index == state
+
+
+def test_unchanged_price_is_not_logged():
+    index = {}
+    ingest(index, "week1", [product(1, 10, "1,990")])
+
+    assert ingest(index, "week2", [product(1, 10, "1,990")]) == []
+    assert index[("Carrefour", 10)]["catalog_table"] == "week2"
+
+
+def test_same_product_name_of_two_brands_is_not_a_price_change():
+    matcher = ProductMatcher()
+    (delice, _), (vitalait, _) = matcher.match_all([("Délice", "Lait demi-écrémé", "1L"),
+                                                    ("Vitalait", "Lait demi-écrémé", "1L")])
+    index = {}
+    ingest(index, "week1", [product(1, delice, "1,350", brand="Délice")])
+
+    assert ingest(index, "week2", [product(1, delice, "1,350", brand="Délice"),
+                                   product(2, vitalait, "1,290", brand="Vitalait")]) \
+        == [(vitalait, "new", None, Decimal("1.290"))]
+
+
+def test_catalog_without_promo_dates_uses_today():
+    index = {}
+    ingest(index, "week1", [product(1, 10, "1,990", promo_start=None, promo_end="2025-01-10")])
+    changes, _, _ = detect_price_changes("week2", [product(2, 20, "3,000", promo_start=None, promo_end=None)],
+                                         list(index.values()), today=date(2025, 1, 5))
+
+    assert [change[4] for change in changes] == ["new"]
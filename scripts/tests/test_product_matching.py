@@ -0,0 +1,31 @@
+import numpy as np
+
+from product_matching import ProductMatcher, minhash_signatures, normalize_product
+
+
+def test_same_name_from_other_brands_stays_apart():
+    matcher = ProductMatcher()
+    ids = [canonical_id for canonical_id, _ in matcher.match_all([
+        ("Délice", "Lait demi-écrémé", "1L"),
+        ("Vitalait", "Lait demi-écrémé", "1L"),
+        ("Jadida", "Lait demi-écrémé", "1L"),
+        ("DELICE", "Lait demi ecreme", "100cl"),
+        ("Saida", "Biscuits au beurre", "100g"),
+        ("Bahlsen", "Biscuits au beurre", "100g"),
+        ("SAIDA", "SAIDA Biscuits au beurre 100 gr", None),
+    ])]
+
+    assert ids[0] == ids[3]
+    assert len({ids[0], ids[1], ids[2]}) == 3
+    assert ids[4] == ids[6]
+    assert ids[4] != ids[5]
+
+
+def test_reloaded_canonical_products_keep_their_brand():
+    text, quantity = normalize_product("Vitalait", "Lait demi-écrémé", "1L")
+    matcher = ProductMatcher()
+    matcher.add(7, quantity, minhash_signatures([text])[0], "Vitalait")
+
+    assert matcher.match("VITALAIT", "Lait demi écrémé", "1 l")[0] == 7
+    assert matcher.match("Délice", "Lait demi-écrémé", "1L")[0] == 8
+    assert isinstance(matcher.signatures[7], np.ndarray)
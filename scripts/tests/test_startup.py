@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import fitz
+import pytest
+
+from llm_stub_server import start_stub_server
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent
+
+# Run ocr.py as `python ocr.py <pdf>` would, then report what got imported
+PROBE = """
+import json, runpy, sys
+sys.argv = ["ocr.py", sys.argv[1]]
+try:
+    runpy.run_path("ocr.py", run_name="__main__")
+finally:
+    heavy = ("paddle", "paddleocr", "paddlex")
+    print(json.dumps(sorted(m for m in sys.modules if m.split(".")[0] in heavy)))
+"""
+
+
+@pytest.fixture
+def stub():
+    server = start_stub_server()
+    yield server
+    server.shutdown()
+
+
+def test_spatial_run_does_not_import_paddle(tmp_path, stub):
+    pdf = tmp_path / "catalog.pdf"
+    with fitz.open() as doc:
+        page = doc.new_page()
+        for i in range(8):
+            page.insert_text((72, 72 + 60 * i), f"Produit {i + 1}   {i + 1},990 DT")
+        doc.save(str(pdf))
+
+    # Importable stand-ins, so the check holds whether or not Paddle is installed
+    for name in ("paddle", "paddleocr"):
+        (tmp_path / "site" / name).mkdir(parents=True)
+        (tmp_path / "site" / name / "__init__.py").write_text("")
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(tmp_path / "site"),
+        # Pages run in this process, not in a PageWorker child
+        OCR_PAGE_BUDGET_S="0",
+        OCR_DOC_BUDGET_S="0",
+        OCR_DEDUP="0",
+        OCR_LANG="fr",
+        OCR_ARCHIVE_UPLOADS="0",
+        OCR_JOBS_DIR=str(tmp_path / "jobs"),
+        CATALOG_CACHE_DISK="0",
+        LLM_STREAM="0",
+        AZURE_OPENAI_API_KEY="stub",
+        AZURE_OPENAI_ENDPOINT=f"http://127.0.0.1:{stub.server_port}",
+    )
+    proc = subprocess.run([sys.executable, "-c", PROBE, str(pdf)], cwd=str(SCRIPTS_DIR), env=env,
+                          capture_output=True, text=True, timeout=120)
+
+    lines = proc.stdout.strip().splitlines()
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    assert json.loads(lines[-1]) == []
+    result = json.loads("\n".join(lines[:-1]))
+    assert result["ok"], result
@@ -0,0 +1,27 @@
+import os
+import time
+
+import upload_archive
+from upload_archive import archive_upload, get_archive_dir
+
+
+def test_default_archive_dir_is_not_the_tracked_uploads(monkeypatch):
+    monkeypatch.delenv("OCR_UPLOAD_ARCHIVE_DIR", raising=False)
+
+    assert get_archive_dir().parts[-2:] == (".cache", "uploads")
+
+
+def test_prune_leaves_pdfs_it_did_not_archive(tmp_path, monkeypatch):
+    monkeypatch.setenv("OCR_UPLOAD_ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(upload_archive, "UPLOAD_ARCHIVE_MAX_FILES", 1)
+    sample = tmp_path / "1758727504728-catalogue-special_froid.pdf"
+    sample.write_bytes(b"%PDF sample")
+    old = time.time() - 365 * 24 * 3600
+    os.utime(sample, (old, old))
+
+    first = archive_upload(b"%PDF first", "first.pdf")
+    second = archive_upload(b"%PDF second", "second.pdf")
+
+    assert sample.exists()
+    assert second.exists()
+    assert not first.exists()
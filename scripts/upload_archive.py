@@ -0,0 +1,181 @@
+"""
+Bounded archive of uploaded catalog PDFs.
+
+The upload route pipes PDFs to ocr.py over stdin, so nothing has to be
+written to disk to process them. Keeping a copy is opt-in
+(OCR_ARCHIVE_UPLOADS=1); copies go to OCR_UPLOAD_ARCHIVE_DIR (default
+<repo>/.cache/uploads) under their content hash, so uploading the same
+catalog again refreshes the existing copy instead of adding one.
+
+Every archive write prunes the copies (<hash>-<name>.pdf; other PDFs in the
+directory are never touched): duplicate copies (same content under different
+names) are reduced to the newest one, then copies older than
+UPLOAD_RETENTION_DAYS are removed, then the oldest ones until at most
+UPLOAD_ARCHIVE_MAX_FILES files and UPLOAD_ARCHIVE_MAX_MB megabytes remain.
+
+Usage:
+  python upload_archive.py prune [--dry-run]
+"""
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Names archive_upload gives its copies
+_ARCHIVED_NAME = re.compile(r"^[0-9a-f]{16}-.+\.pdf$")
+
+UPLOAD_RETENTION_DAYS = float(os.getenv("UPLOAD_RETENTION_DAYS", "14"))
+UPLOAD_ARCHIVE_MAX_FILES = int(os.getenv("UPLOAD_ARCHIVE_MAX_FILES", "200"))
+UPLOAD_ARCHIVE_MAX_MB = float(os.getenv("UPLOAD_ARCHIVE_MAX_MB", "2048"))
+
+
+def archive_enabled() -> bool:
+    return os.getenv("OCR_ARCHIVE_UPLOADS", "0") == "1"
+
+
+def get_archive_dir() -> Path:
+    default_dir = Path(__file__).resolve().parent.parent / ".cache" / "uploads"
+    return Path(os.getenv("OCR_UPLOAD_ARCHIVE_DIR", str(default_dir)))
+
+
+def _content_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def archive_upload(data: bytes, name: str = None) -> Optional[Path]:
+    """
+    Keep a copy of an uploaded PDF, then prune the archive.
+
+    Args:
+        data: PDF bytes
+        name: Original file name (kept after the hash, for humans)
+
+    Returns:
+        Path of the copy, or None if it could not be written
+    """
+    archive_dir = get_archive_dir()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    safe_name = re.sub(r"[^\w.-]", "_", os.path.basename(name or "upload.pdf"))[:100]
+    try:
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        existing = next(archive_dir.glob(f"{digest}-*.pdf"), None)
+        if existing is not None:
+            os.utime(existing)
+            path = existing
+        else:
+            path = archive_dir / f"{digest}-{safe_name if safe_name.lower().endswith('.pdf') else safe_name + '.pdf'}"
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+    except OSError as e:
+        print(f"Could not archive upload: {e}", file=sys.stderr)
+        return None
+    prune_archive(keep=path)
+    return path
+
+
+def prune_archive(max_age_days: float = None, max_files: int = None, max_mb: float = None,
+                  keep: Path = None, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Apply the retention policy to the copies in the archive directory.
+
+    Args:
+        max_age_days, max_files, max_mb: Limits (default: the module settings)
+        keep: A file never to remove (the one just archived)
+        dry_run: Only report what would be removed
+
+    Returns:
+        Dictionary with the removed files and what remains
+    """
+    max_age_days = UPLOAD_RETENTION_DAYS if max_age_days is None else max_age_days
+    max_files = UPLOAD_ARCHIVE_MAX_FILES if max_files is None else max_files
+    max_mb = UPLOAD_ARCHIVE_MAX_MB if max_mb is None else max_mb
+    archive_dir = get_archive_dir()
+    if not archive_dir.is_dir():
+        return {"removed": [], "files": 0, "bytes": 0}
+
+    files = []
+    for path in archive_dir.glob("*.pdf"):
+        if not _ARCHIVED_NAME.match(path.name):
+            continue
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append({"path": path, "mtime": stat.st_mtime, "size": stat.st_size})
+    files.sort(key=lambda f: f["mtime"], reverse=True)  # newest first
+    keep = keep.resolve() if keep is not None else None
+
+    removed: List[Dict[str, Any]] = []
+
+    def remove(entry, reason):
+        if keep is not None and entry["path"].resolve() == keep:
+            return False
+        if not dry_run:
+            try:
+                entry["path"].unlink()
+            except OSError as e:
+                print(f"Could not remove {entry['path']}: {e}", file=sys.stderr)
+                return False
+        removed.append({"path": str(entry["path"]), "reason": reason})
+        return True
+
+    # Duplicates: same size first, then same content
+    by_size: Dict[int, List[Dict[str, Any]]] = {}
+    for entry in files:
+        by_size.setdefault(entry["size"], []).append(entry)
+    seen_hashes = set()
+    remaining = []
+    for entry in files:
+        if len(by_size[entry["size"]]) > 1:
+            try:
+                digest = _content_hash(entry["path"])
+            except OSError:
+                continue
+            if digest in seen_hashes and remove(entry, "duplicate"):
+                continue
+            seen_hashes.add(digest)
+        remaining.append(entry)
+
+    cutoff = time.time() - max_age_days * 24 * 3600
+    kept = []
+    for entry in remaining:
+        if entry["mtime"] < cutoff and remove(entry, "expired"):
+            continue
+        kept.append(entry)
+
+    max_bytes = max_mb * 1024 * 1024
+    total = sum(entry["size"] for entry in kept)
+    while kept and (len(kept) > max_files or total > max_bytes):
+        entry = kept.pop()  # oldest
+        if remove(entry, "over limit"):
+            total -= entry["size"]
+        elif keep is not None and entry["path"].resolve() == keep:
+            # Only the file just archived is left over the limit
+            kept.append(entry)
+            break
+    return {"removed": removed, "files": len(kept), "bytes": total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the upload archive retention policy.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prune = commands.add_parser("prune", help="remove duplicate, expired and excess archived PDFs")
+    prune.add_argument("--dry-run", action="store_true", help="only list what would be removed")
+    args = parser.parse_args()
+
+    result = prune_archive(dry_run=args.dry_run)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()